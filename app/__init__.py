@@ -20,6 +20,11 @@ def create_app():
     """Create and configure the Flask application"""
     app = Flask(__name__)
 
+    # Stream multipart uploads to disk instead of buffering them in memory
+    from app.upload_spool import SpooledRequest, cleanup_stale_spool_files
+    app.request_class = SpooledRequest
+    cleanup_stale_spool_files()
+
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key')
 
@@ -72,4 +77,31 @@ def create_app():
     app.register_blueprint(api.bp)
     app.register_blueprint(webhooks.bp)
 
+    # Resume month generation jobs interrupted by a crash or redeploy
+    from app.services import job_checkpoints, print_renditions
+    job_checkpoints.start()
+
+    # Print files of long-gone sessions
+    print_renditions.cleanup_expired_renditions()
+
+    # Processed Stripe events past Stripe's redelivery window
+    from app.services import webhook_events
+    webhook_events.cleanup_expired_events()
+
+    # Chunked uploads abandoned part-way
+    from app.services import chunked_uploads
+    chunked_uploads.cleanup_expired_uploads()
+
+    # Pre-staged uploads of checkouts that were never paid
+    from app.services import fulfillment_staging
+    fulfillment_staging.cleanup_expired_staging()
+
+    # Shop and blueprint IDs persisted across restarts, kept warm in the background
+    from app.services import printify_catalog
+    printify_catalog.start(app)
+
+    # Printify fulfillment of paid orders queued by the Stripe webhook
+    from app.services import fulfillment_queue
+    fulfillment_queue.start(app)
+
     return app
@@ -1,14 +1,24 @@
 """
 API routes for AJAX calls and image serving
 """
-from flask import Blueprint, jsonify, send_file, Response, request, url_for
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Blueprint, jsonify, send_file, Response, request, url_for, current_app
 from app import session_storage
 from app.routes.main import get_current_project
 from app.services import stripe_service
+from app.services.generation_scheduler import get_scheduler
+from app.services import admission_control, speculative_generation, chunked_uploads, upload_ingest
+from app.services import fulfillment_queue, print_renditions, printify_catalog, printify_upload_cache
+from app.services import printify_client, fulfillment_staging
 import io
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+# How long a generate request waits for its month before answering 202
+# (the job keeps running; the page then polls /api/project/status)
+GENERATE_REQUEST_WAIT_SECONDS = int(os.getenv('GENERATE_REQUEST_WAIT_SECONDS', 20))
+
 @bp.route('/image/thumbnail/<int:image_id>')
 def get_thumbnail(image_id):
     """Serve thumbnail image"""
@@ -52,13 +62,27 @@ def project_status():
 
     # Get generation status from session
     months = session_storage.get_all_months()
+    storage_id = session_storage.get_storage_id()
 
     return jsonify({
         'project_id': project['id'],
         'status': project['status'],
-        'months': months
+        'months': [session_storage.month_summary(m) for m in months],
+        'queue': get_scheduler().get_session_stats(storage_id),
+        'admission': admission_control.get_admission_status(storage_id),
+        'speculative': project.get('speculative')
     })
 
+@bp.route('/generate/admission', methods=['POST'])
+def generate_admission():
+    """Take a calendar generation slot, or get queue position and ETA"""
+    project = get_current_project()
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    admission = admission_control.request_admission(session_storage.get_storage_id())
+    return jsonify(admission)
+
 @bp.route('/delete/image/<int:image_id>', methods=['POST'])
 def delete_image(image_id):
     """Delete an uploaded image"""
@@ -68,15 +92,207 @@ def delete_image(image_id):
 
     session_storage.delete_image(image_id)
 
+    # Pre-generated months used the old reference photos
+    storage_id = session_storage.get_storage_id()
+    speculative_generation.cancel(storage_id)
+    speculative_generation.start(storage_id)
+
     return jsonify({'success': True})
 
+def _chunked_upload_error(e):
+    body = {'error': str(e)}
+    if e.received is not None:
+        body['received'] = e.received
+    return jsonify(body), e.status
+
+@bp.route('/upload/chunked', methods=['POST'])
+def create_chunked_upload():
+    """
+    Start a resumable upload
+    JSON body: {"filename": ..., "size": <bytes>, "sha256": <optional hex digest>}
+    """
+    project = get_current_project()
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = chunked_uploads.create_upload(
+            session_storage.get_storage_id(),
+            data.get('filename'),
+            data.get('size'),
+            sha256=data.get('sha256')
+        )
+    except chunked_uploads.ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+
+    return jsonify(upload), 201
+
+@bp.route('/upload/chunked/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Bytes received so far - clients resume from 'received'"""
+    project = get_current_project()
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        return jsonify(chunked_uploads.get_upload_status(upload_id, session_storage.get_storage_id()))
+    except chunked_uploads.ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+
+@bp.route('/upload/chunked/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    Append one chunk (raw request body)
+    Headers: Upload-Offset (byte offset of the chunk), X-Chunk-SHA256 (hex digest)
+    """
+    project = get_current_project()
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None or offset < 0:
+        return jsonify({'error': 'Missing or invalid Upload-Offset header'}), 400
+
+    try:
+        upload = chunked_uploads.write_chunk(
+            upload_id,
+            session_storage.get_storage_id(),
+            offset,
+            request.stream,
+            request.content_length,
+            checksum=request.headers.get('X-Chunk-SHA256')
+        )
+    except chunked_uploads.ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+
+    return jsonify(upload)
+
+@bp.route('/upload/chunked/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Assemble the upload and run it through the normal photo processing"""
+    project = get_current_project()
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    storage_id = session_storage.get_storage_id()
+    try:
+        filename, path = chunked_uploads.complete_upload(upload_id, storage_id)
+    except chunked_uploads.ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+
+    try:
+        result = upload_ingest.store_upload(filename, upload_ingest.submit_upload(path))
+    except Exception as e:
+        return jsonify({'error': f'Error processing {filename}: {str(e)}'}), 422
+    finally:
+        chunked_uploads.discard_upload(upload_id)
+
+    image_count = len(session_storage.get_uploaded_images())
+    if image_count >= 3 and not result['duplicate']:
+        # Same as the form upload: pre-generate from the new reference set
+        speculative_generation.cancel(storage_id)
+        speculative_generation.start(storage_id)
+
+    return jsonify({
+        'success': True,
+        'image_id': result['image_id'],
+        'duplicate': result['duplicate'],
+        'bytes_saved': result['bytes_saved'],
+        'image_count': image_count
+    })
+
+@bp.route('/upload/chunked/complete', methods=['POST'])
+def complete_chunked_uploads():
+    """
+    Assemble several finished uploads and process them together, like one form upload
+    JSON body: {"upload_ids": [...]}
+    """
+    project = get_current_project()
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    upload_ids = (request.get_json(silent=True) or {}).get('upload_ids')
+    if not isinstance(upload_ids, list) or not upload_ids:
+        return jsonify({'error': 'upload_ids must be a non-empty list'}), 400
+    if len(upload_ids) > chunked_uploads.CHUNKED_UPLOAD_MAX_OPEN_PER_SESSION:
+        return jsonify({'error': f'At most {chunked_uploads.CHUNKED_UPLOAD_MAX_OPEN_PER_SESSION} uploads per request'}), 400
+
+    # Process all photos in parallel on the image pool, with one pixel
+    # budget for the request (same as the form upload)
+    storage_id = session_storage.get_storage_id()
+    pixel_budget = upload_ingest.RequestPixelBudget()
+    results = {}
+    pending = []
+    for upload_id in upload_ids:
+        try:
+            filename, path = chunked_uploads.complete_upload(upload_id, storage_id)
+        except chunked_uploads.ChunkedUploadError as e:
+            results[upload_id] = {'upload_id': upload_id, 'success': False, 'error': str(e)}
+            continue
+        try:
+            pending.append((upload_id, filename, upload_ingest.submit_upload(path, pixel_budget)))
+        except Exception as e:
+            chunked_uploads.discard_upload(upload_id)
+            results[upload_id] = {'upload_id': upload_id, 'success': False,
+                                  'error': f'Error processing {filename}: {str(e)}'}
+
+    # Save in upload order as results come back
+    stored = 0
+    for upload_id, filename, future in pending:
+        try:
+            result = upload_ingest.store_upload(filename, future)
+            results[upload_id] = {
+                'upload_id': upload_id,
+                'success': True,
+                'image_id': result['image_id'],
+                'duplicate': result['duplicate'],
+                'bytes_saved': result['bytes_saved']
+            }
+            if not result['duplicate']:
+                stored += 1
+        except Exception as e:
+            results[upload_id] = {'upload_id': upload_id, 'success': False,
+                                  'error': f'Error processing {filename}: {str(e)}'}
+        finally:
+            chunked_uploads.discard_upload(upload_id)
+
+    image_count = len(session_storage.get_uploaded_images())
+    if image_count >= 3 and stored:
+        speculative_generation.cancel(storage_id)
+        speculative_generation.start(storage_id)
+
+    return jsonify({
+        'success': True,
+        'results': [results[upload_id] for upload_id in upload_ids],
+        'image_count': image_count
+    })
+
+@bp.route('/order/status/<checkout_session_id>')
+def order_status(checkout_session_id):
+    """Fulfillment progress for a paid order (keyed by Stripe checkout session ID)"""
+    status = fulfillment_queue.get_status(checkout_session_id)
+    if not status:
+        return jsonify({'error': 'Order not found'}), 404
+    return jsonify(status)
+
+@bp.route('/print/<session_id>/<name>')
+def print_rendition(session_id, name):
+    """Serve a print rendition to Printify through a signed, expiring URL"""
+    path = print_renditions.verify_url(
+        session_id, name, request.args.get('expires'), request.args.get('signature')
+    )
+    if not path:
+        return jsonify({'error': 'Invalid or expired link'}), 403
+    if not path.exists():
+        return jsonify({'error': 'Image not found'}), 404
+
+    return send_file(path, mimetype='image/jpeg')
+
 @bp.route('/generate/month/<int:month_num>', methods=['POST'])
 def generate_month(month_num):
     """Generate a single month's image with AI face-swapping"""
-    from app.services.gemini_service import generate_calendar_image
-    from app.services.monthly_themes import get_enhanced_prompt
-    from PIL import Image as PILImage
-    import io
+    from app.services.month_generation import submit_month
     import traceback
 
     print(f"\n{'='*70}")
@@ -112,6 +328,18 @@ def generate_month(month_num):
                 'message': f'Month {month_num} already generated'
             })
 
+        # Only admitted calendars may generate - everyone else waits in line
+        admission = admission_control.request_admission(session_storage.get_storage_id())
+        if not admission['admitted']:
+            print(f"⏳ Month {month_num}: Calendar queued at position {admission['position']}")
+            return jsonify({
+                'success': False,
+                'status': 'queued',
+                'month': month_num,
+                'queue_position': admission['position'],
+                'eta_seconds': admission['eta_seconds']
+            }), 202
+
         # Mark as processing
         print(f"📝 Month {month_num}: Marking as processing...")
         session_storage.update_month_status(month_num, 'processing')
@@ -121,50 +349,42 @@ def generate_month(month_num):
         uploaded_images = session_storage.get_uploaded_images()
         print(f"✓ Month {month_num}: Found {len(uploaded_images)} uploaded images")
 
-        reference_image_data = [img['file_data'] for img in uploaded_images]
-
-        if not reference_image_data:
+        if not uploaded_images:
             error_msg = 'No reference images found'
             print(f"❌ Month {month_num}: {error_msg}")
             session_storage.update_month_status(month_num, 'failed', error=error_msg)
             return jsonify({'error': error_msg}), 400
 
-        print(f"✓ Month {month_num}: Prepared {len(reference_image_data)} reference images")
-
-        # Generate image with simple working prompts
-        print(f"📸 Month {month_num}: Getting enhanced prompt...")
-        enhanced_prompt = get_enhanced_prompt(month_num)
-        print(f"✓ Month {month_num}: Prompt length: {len(enhanced_prompt)} chars")
-
-        print(f"🎨 Month {month_num}: Starting Gemini API call...")
-        image_data = generate_calendar_image(enhanced_prompt, reference_image_data)
-        print(f"✅ Month {month_num}: Generation succeeded! Size: {len(image_data)} bytes")
-
-        # Convert PNG to JPEG for smaller file size
-        # Quality 80 optimized for memory: good quality, smaller files, less RAM
-        img = PILImage.open(io.BytesIO(image_data))
-        img_io = io.BytesIO()
-        img.convert('RGB').save(img_io, format='JPEG', quality=80, optimize=True)
-        jpeg_data = img_io.getvalue()
-
-        # Clear image data from memory immediately
-        del image_data
-        del img
-        del img_io
-        import gc
-        gc.collect()
-
-        # Save to session storage
-        session_storage.update_month_status(month_num, 'completed', image_data=jpeg_data)
-
-        print(f"💾 Month {month_num}: Saved {len(jpeg_data)} bytes")
+        print(f"✓ Month {month_num}: Prepared {len(uploaded_images)} reference images")
+
+        # Queue on the fair scheduler and wait (bounded) for our turn + the Gemini call
+        storage_id = session_storage.get_storage_id()
+        try:
+            jpeg_size = submit_month(storage_id, month_num, uploaded_images).result(
+                timeout=GENERATE_REQUEST_WAIT_SECONDS
+            )
+            if jpeg_size is None:
+                # We attached to a speculative job whose result was discarded - generate for real
+                jpeg_size = submit_month(storage_id, month_num, uploaded_images).result(
+                    timeout=GENERATE_REQUEST_WAIT_SECONDS
+                )
+        except FutureTimeoutError:
+            # Still queued or generating - don't hold the request thread for it
+            queue = get_scheduler().get_session_stats(storage_id)
+            print(f"⏳ Month {month_num}: Still generating, answering 202 (queue depth {queue['queue_depth']})")
+            return jsonify({
+                'success': True,
+                'status': 'generating',
+                'month': month_num,
+                'queue': queue
+            }), 202
 
         return jsonify({
             'success': True,
             'status': 'completed',
             'month': month_num,
             'message': f'Month {month_num} generated successfully',
-            'image_size': len(jpeg_data)
+            'image_size': jpeg_size
         })
 
     except Exception as e:
@@ -224,6 +444,9 @@ def debug_session():
         'has_project': bool(project),
         'project_id': project['id'] if project else None,
         'project_status': project.get('status') if project else None,
+        'printify_catalog': printify_catalog.get_stats(),
+        'printify_upload_cache': printify_upload_cache.get_stats(),
+        'printify_client': printify_client.get_stats(),
     }
 
     if project:
@@ -257,10 +480,21 @@ def create_checkout():
 
     try:
         # Create Stripe checkout session
+        internal_session_id = session_storage.get_storage_id()
         session_data = stripe_service.create_checkout_session(
             product_type=product_type,
             success_url=url_for('main.order_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url=url_for('projects.preview', _external=True)
+            cancel_url=url_for('projects.preview', _external=True),
+            # The webhook finds the calendar (and its print renditions) by this
+            metadata={'internal_session_id': internal_session_id}
+        )
+
+        # Upload the print renditions to Printify while the customer pays
+        fulfillment_staging.stage(
+            current_app._get_current_object(),
+            session_data['session_id'],
+            internal_session_id,
+            product_type
         )
 
         # Store checkout session ID in session storage for tracking
@@ -2,19 +2,10 @@
 Project routes - Upload, prompts, preview, checkout
 """
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.utils import secure_filename
-from app import session_storage
+from app import session_storage, upload_spool
 from app.routes.main import get_current_project
 from app.services.monthly_themes import get_all_themes, get_theme, get_enhanced_prompt
-from PIL import Image, ImageOps
-import io
-
-# Register HEIC support for iPhone photos
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-except ImportError:
-    pass  # HEIC support not available
+from app.services import admission_control, speculative_generation, upload_ingest
 
 bp = Blueprint('projects', __name__, url_prefix='/project')
 
@@ -26,64 +17,68 @@ def upload():
         return redirect(url_for('main.start'))
 
     if request.method == 'POST':
+        processed_count = 0
+        duplicates = []
+        bytes_saved = 0
+
         # Handle file uploads
         if 'photos' in request.files:
             files = request.files.getlist('photos')
 
-            processed_count = 0
+            # Process all photos in parallel on the image pool; the decode
+            # budget caps how many full-resolution decodes are in flight and
+            # the pixel budget how much one request may ask us to decode
+            pending = []
+            pixel_budget = upload_ingest.RequestPixelBudget()
             for file in files:
                 if file and file.filename:
                     try:
-                        # Read image data
-                        original_data = file.read()
-
-                        # Open image (supports JPEG, PNG, HEIC, etc.)
-                        img = Image.open(io.BytesIO(original_data))
-
-                        # Auto-rotate based on EXIF orientation (iPhone photos)
-                        img = ImageOps.exif_transpose(img)
-
-                        # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-
-                        # Optimize: Resize if too large (face detection doesn't need 4000px)
-                        # Target max dimension: 1920px (plenty for AI face analysis)
-                        max_dimension = 1920
-                        if max(img.size) > max_dimension:
-                            # Resize maintaining aspect ratio
-                            ratio = max_dimension / max(img.size)
-                            new_size = tuple(int(dim * ratio) for dim in img.size)
-                            img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-                        # Save optimized version (strips EXIF for privacy + size reduction)
-                        optimized_io = io.BytesIO()
-                        img.save(optimized_io, format='JPEG', quality=90, optimize=True)
-                        img_data = optimized_io.getvalue()
-
-                        # Create thumbnail for preview
-                        img.thumbnail((200, 200))
-                        thumb_io = io.BytesIO()
-                        img.save(thumb_io, format='JPEG', quality=85)
-                        thumb_data = thumb_io.getvalue()
-
-                        # Save to session storage
-                        session_storage.add_uploaded_image(
-                            secure_filename(file.filename),
-                            img_data,
-                            thumb_data
-                        )
-                        processed_count += 1
-
+                        # Spooled temp file path (or bytes if kept in memory)
+                        source = upload_spool.get_upload_source(file)
+                        pending.append((file.filename, upload_ingest.submit_upload(source, pixel_budget)))
                     except Exception as e:
                         flash(f'Error processing {file.filename}: {str(e)}', 'warning')
-                        continue
 
-            flash(f'{len(files)} photos uploaded successfully!', 'success')
+            # Save in upload order as results come back; near-duplicates
+            # of an already stored photo are skipped
+            for filename, future in pending:
+                try:
+                    result = upload_ingest.store_upload(filename, future)
+                    if result['duplicate']:
+                        duplicates.append(filename)
+                        bytes_saved += result['bytes_saved']
+                    else:
+                        processed_count += 1
+
+                except Exception as e:
+                    flash(f'Error processing {filename}: {str(e)}', 'warning')
+                    continue
+
+            if request.accept_mimetypes.best != 'application/json':
+                flash(f'{processed_count} photos uploaded successfully!', 'success')
+                if duplicates:
+                    flash(f'Skipped {len(duplicates)} duplicate photo{"s" if len(duplicates) > 1 else ""} '
+                          f'({bytes_saved / 1024:.0f}KB saved)', 'info')
 
         # Check if enough photos
         images = session_storage.get_uploaded_images()
         if len(images) >= 3:  # Minimum 3 photos
+            # Reference set changed - restart pre-generation with the new photos
+            storage_id = session_storage.get_storage_id()
+            speculative_generation.cancel(storage_id)
+            speculative_generation.start(storage_id)
+
+        # XHR/API clients get a summary instead of a redirect
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({
+                'success': True,
+                'uploaded': processed_count,
+                'duplicates_skipped': duplicates,
+                'bytes_saved': bytes_saved,
+                'image_count': len(images)
+            })
+
+        if len(images) >= 3:
             return redirect(url_for('projects.themes'))
 
     # Get uploaded images
@@ -126,6 +121,9 @@ def themes():
             flash(f'Error setting up themes: {str(e)}', 'danger')
             return redirect(url_for('projects.themes'))
 
+    # Use idle capacity to get a head start while the user reads
+    speculative_generation.start(session_storage.get_storage_id())
+
     # Get all pre-defined themes
     all_themes = get_all_themes()
 
@@ -154,7 +152,15 @@ def generate():
         # Mark project as processing
         session_storage.update_project_status('processing')
 
-        flash('Starting AI generation with face-swapping... This will take 5-10 minutes.', 'info')
+        # Take a generation slot, or join the queue if the machine is busy
+        admission = admission_control.request_admission(session_storage.get_storage_id())
+        if admission['admitted']:
+            minutes = max(1, round(admission_control.estimate_calendar_seconds() / 60))
+            flash(f'Starting AI generation with face-swapping... This will take about {minutes} minutes.', 'info')
+        else:
+            minutes = max(1, round(admission['eta_seconds'] / 60))
+            flash(f"Lots of hunks in the oven! You're #{admission['position']} in line - "
+                  f"generation starts in about {minutes} minutes.", 'info')
 
         # Redirect immediately to preview page (AJAX will handle actual generation)
         return redirect(url_for('projects.preview'))
@@ -176,7 +182,11 @@ def preview():
     # Check if generation is complete
     if not all(m['generation_status'] == 'completed' for m in months):
         flash('Calendar generation in progress...', 'info')
-        return render_template('generating.html', project=project, months=months)
+        return render_template(
+            'generating.html',
+            project=project,
+            months=[session_storage.month_summary(m) for m in months]
+        )
 
     month_names = [
         'January', 'February', 'March', 'April', 'May', 'June',
@@ -3,10 +3,7 @@ Webhook handlers for external service events
 Currently handles Stripe payment confirmation webhooks
 """
 from flask import Blueprint, request, jsonify
-import stripe
-from datetime import datetime
-from app.services import stripe_service, printify_service
-from app import session_storage
+from app.services import stripe_service, fulfillment_queue, webhook_events, fulfillment_staging
 
 bp = Blueprint('webhooks', __name__, url_prefix='/webhooks')
 
@@ -28,167 +25,31 @@ def stripe_webhook():
 
     print(f"📨 Received Stripe webhook: {event['type']}")
 
-    # Handle checkout.session.completed event
+    checkout_session_id = None
     if event['type'] == 'checkout.session.completed':
-        session_obj = event['data']['object']
-
-        # Retrieve full checkout session with expanded data
-        checkout_session = stripe_service.retrieve_checkout_session(
-            session_obj['id'],
-            expand=['line_items', 'customer']
-        )
-
-        # Extract payment and customer information
-        payment_intent_id = checkout_session.payment_intent
-        customer_email = checkout_session.customer_details.email
-        product_type = checkout_session.metadata.get('product_type')
-        internal_session_id = checkout_session.metadata.get('internal_session_id')
-
-        print(f"✅ Payment successful!")
-        print(f"   Customer: {customer_email}")
-        print(f"   Product: {product_type}")
-        print(f"   Payment Intent: {payment_intent_id}")
-        print(f"   Internal Session ID: {internal_session_id}")
-
-        # Extract shipping address
-        shipping_address = stripe_service.extract_shipping_address(checkout_session)
+        checkout_session_id = event['data']['object']['id']
 
-        # Create Printify order asynchronously
-        # Note: In production, this should be a background task (Celery/RQ)
-        # For now, we'll do it synchronously
-        try:
-            order_id = create_printify_order(
-                internal_session_id=internal_session_id,
-                stripe_session_id=checkout_session.id,
-                payment_intent_id=payment_intent_id,
-                product_type=product_type,
-                customer_email=customer_email,
-                shipping_address=shipping_address
-            )
-
-            print(f"🎉 Order fulfilled successfully: {order_id}")
-
-        except Exception as e:
-            print(f"❌ Printify order creation failed: {e}")
-            # In production: save to failed_orders table for manual retry
-            # For now, log the error
-            import traceback
-            traceback.print_exc()
+    # Stripe redelivery of an event we already handled - answer right away
+    processed = webhook_events.find_processed(event['id'], checkout_session_id)
+    if processed:
+        print(f"ℹ️ Event {event['id']} already processed ({processed['event_id']}), skipping")
+        return jsonify({'success': True, 'duplicate': True})
 
+    # Handle checkout.session.completed event
+    if checkout_session_id:
+        # Record the paid checkout in the durable outbox and answer Stripe
+        # right away - the fulfillment worker does the slow Printify work
+        # The event carries the metadata, customer and shipping details, so
+        # the worker only retrieves the session from Stripe if some are missing
+        checkout = stripe_service.checkout_details_from_event(event['data']['object'])
+        if fulfillment_queue.enqueue(event['id'], checkout_session_id, checkout=checkout):
+            print(f"✅ Payment successful! Queued fulfillment for checkout {checkout_session_id}")
+        else:
+            print(f"ℹ️ Checkout {checkout_session_id} already queued (Stripe retry)")
+
+    # Abandoned checkout - its pre-staged uploads will never be used
+    elif event['type'] == 'checkout.session.expired':
+        fulfillment_staging.discard(event['data']['object']['id'])
+
+    webhook_events.mark_processed(event['id'], event['type'], checkout_session_id)
     return jsonify({'success': True})
-
-def create_printify_order(internal_session_id, stripe_session_id, payment_intent_id, product_type, customer_email, shipping_address):
-    """
-    Create Printify order after successful payment
-
-    This function:
-    1. Retrieves user's generated month images from session
-    2. Uploads all 12 images to Printify
-    3. Creates a calendar product with those images
-    4. Submits the order to Printify for fulfillment
-
-    Args:
-        internal_session_id: Internal session ID to look up user's calendar
-        stripe_session_id: Stripe checkout session ID
-        payment_intent_id: Stripe payment intent ID
-        product_type: 'calendar_2026', 'desktop', or 'standard_wall'
-        customer_email: Customer email address
-        shipping_address: Dict with shipping address fields
-
-    Returns:
-        str: Printify order ID
-
-    Note: In production, this should be a background task to avoid
-          blocking the webhook response
-    """
-    print("\n" + "="*60)
-    print("📦 Starting Printify Order Creation")
-    print("="*60)
-
-    # Step 1: Get user's generated month images from session storage using internal session ID
-    print(f"   Looking up calendar images for session: {internal_session_id}...")
-
-    months = session_storage.get_months_by_session_id(internal_session_id)
-
-    if not months or len(months) < 12:
-        raise Exception(f"Insufficient month images: found {len(months)}, need 12")
-
-    print(f"   Found {len(months)} months in session storage")
-
-    # Step 2: Upload all 12 month images to Printify
-    print("\n📤 Uploading images to Printify...")
-    month_names = ["january", "february", "march", "april", "may", "june",
-                   "july", "august", "september", "october", "november", "december"]
-
-    printify_image_ids = {}
-    for i, month_name in enumerate(month_names):
-        month_num = i + 1
-        month_data = next((m for m in months if m['month_number'] == month_num), None)
-
-        if not month_data or not month_data.get('master_image_data'):
-            raise Exception(f"Missing image data for month {month_num}")
-
-        # Upload to Printify
-        upload_data = printify_service.upload_image(
-            month_data['master_image_data'],
-            filename=f"{month_name}.jpg"
-        )
-
-        printify_image_ids[month_name] = upload_data['id']
-
-    print(f"✅ Uploaded {len(printify_image_ids)} images successfully")
-
-    # Step 3: Get product configuration
-    product_config = printify_service.CALENDAR_PRODUCTS.get(product_type)
-    if not product_config:
-        raise Exception(f"Invalid product type: {product_type}")
-
-    # Step 4: Create Printify product with uploaded images
-    print("\n🎨 Creating Printify product...")
-    product_id = printify_service.create_calendar_product(
-        product_type=product_type,
-        month_image_ids=printify_image_ids,
-        title=f"Custom Hunk Calendar for {customer_email}"
-    )
-
-    # Step 5: Publish the product
-    print("\n📢 Publishing product...")
-    printify_service.publish_product(product_id)
-
-    # Step 6: Create order
-    print("\n📦 Creating Printify order...")
-    order_id = printify_service.create_order(
-        product_id=product_id,
-        variant_id=product_config['variant_id'],
-        quantity=1,
-        shipping_address=shipping_address,
-        customer_email=customer_email
-    )
-
-    # Step 7: Submit order to production
-    print("\n🏭 Submitting order to production...")
-    printify_service.submit_order(order_id)
-
-    print("\n✅ Order creation complete!")
-    print(f"   Printify Order ID: {order_id}")
-    print(f"   Product ID: {product_id}")
-    print(f"   Customer: {customer_email}")
-    print("="*60 + "\n")
-
-    # Save order details to session storage
-    order_info = {
-        'stripe_checkout_session_id': stripe_session_id,
-        'stripe_payment_intent_id': payment_intent_id,
-        'printify_order_id': order_id,
-        'printify_product_id': product_id,
-        'product_type': product_type,
-        'customer_email': customer_email,
-        'shipping_address': shipping_address,
-        'status': 'submitted',
-        'created_at': datetime.now().isoformat()
-    }
-
-    session_storage.save_order_info(internal_session_id, order_info)
-    print(f"💾 Order info saved to session storage")
-
-    return order_id
@@ -0,0 +1,164 @@
+"""
+Admission control for calendar generation
+Caps how many calendars generate at once on this machine and queues the
+overflow in a durable, file-locked queue shared by all worker processes
+"""
+import os
+import json
+import time
+import fcntl
+from contextlib import contextmanager
+from app.session_storage import DATA_DIR
+from app.services.generation_scheduler import get_scheduler
+
+# Max calendars generating at the same time on this machine
+MAX_INFLIGHT_CALENDARS = int(os.getenv('MAX_INFLIGHT_CALENDARS', 3))
+# Admitted sessions that stop polling/generating for this long lose their slot
+ADMISSION_LEASE_SECONDS = int(os.getenv('ADMISSION_LEASE_SECONDS', 600))
+# Queued sessions that stop polling for this long are dropped from the queue
+QUEUE_ABANDON_SECONDS = int(os.getenv('ADMISSION_QUEUE_ABANDON_SECONDS', 300))
+
+MONTHS_PER_CALENDAR = 12
+
+# Status polls refresh a session's last_seen at most this often (each refresh is a write)
+STATUS_TOUCH_SECONDS = 30
+
+ADMISSION_DIR = DATA_DIR / 'admission'
+ADMISSION_DIR.mkdir(exist_ok=True, parents=True)
+QUEUE_FILE = ADMISSION_DIR / 'queue.json'
+LOCK_FILE = ADMISSION_DIR / 'queue.lock'
+
+
+def _read_state():
+    try:
+        with open(QUEUE_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'admitted': {}, 'queue': []}
+
+def _write_state(state):
+    tmp_file = QUEUE_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, QUEUE_FILE)  # Atomic - never leaves a half-written queue
+
+@contextmanager
+def _locked_state():
+    """Read-modify-write the queue under an exclusive lock (safe across processes)"""
+    with open(LOCK_FILE, 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = _read_state()
+            original = json.dumps(state, sort_keys=True)
+            yield state
+            if json.dumps(state, sort_keys=True) != original:
+                _write_state(state)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _expire_and_promote(state, now):
+    """Drop stale entries and move queued sessions into free slots"""
+    for session_id, entry in list(state['admitted'].items()):
+        if now - entry['last_seen'] > ADMISSION_LEASE_SECONDS:
+            print(f"  ℹ Admission lease expired for session {session_id[:8]}...")
+            del state['admitted'][session_id]
+
+    state['queue'] = [
+        entry for entry in state['queue']
+        if now - entry['last_seen'] <= QUEUE_ABANDON_SECONDS
+    ]
+
+    while state['queue'] and len(state['admitted']) < MAX_INFLIGHT_CALENDARS:
+        entry = state['queue'].pop(0)
+        state['admitted'][entry['session_id']] = {'admitted_at': now, 'last_seen': now}
+        print(f"  ✓ Admitted queued session {entry['session_id'][:8]}... "
+              f"after {int(now - entry['enqueued_at'])}s")
+
+def estimate_calendar_seconds():
+    """Expected wall time for one calendar, from the moving average of Gemini latency"""
+    scheduler = get_scheduler()
+    parallelism = min(scheduler.max_per_session, scheduler.workers)
+    return MONTHS_PER_CALENDAR * scheduler.avg_latency / parallelism
+
+def _status(state, session_id):
+    if session_id in state['admitted']:
+        return {'admitted': True, 'position': 0, 'eta_seconds': 0}
+
+    for index, entry in enumerate(state['queue']):
+        if entry['session_id'] == session_id:
+            position = index + 1
+            # Slots free up MAX_INFLIGHT_CALENDARS at a time, one calendar's duration apart
+            rounds = (position + MAX_INFLIGHT_CALENDARS - 1) // MAX_INFLIGHT_CALENDARS
+            return {
+                'admitted': False,
+                'position': position,
+                'eta_seconds': int(rounds * estimate_calendar_seconds())
+            }
+
+    return {'admitted': False, 'position': None, 'eta_seconds': None}
+
+def request_admission(session_id):
+    """
+    Admit a session's calendar generation or place it in the queue
+
+    Args:
+        session_id: Storage ID of the session
+
+    Returns:
+        dict: {'admitted': bool, 'position': int, 'eta_seconds': int}
+              position is 0 when admitted, 1-based while queued
+    """
+    now = time.time()
+    with _locked_state() as state:
+        _expire_and_promote(state, now)
+
+        if session_id in state['admitted']:
+            state['admitted'][session_id]['last_seen'] = now
+        else:
+            entry = next((e for e in state['queue'] if e['session_id'] == session_id), None)
+            if entry:
+                entry['last_seen'] = now
+            elif len(state['admitted']) < MAX_INFLIGHT_CALENDARS:
+                state['admitted'][session_id] = {'admitted_at': now, 'last_seen': now}
+            else:
+                state['queue'].append({'session_id': session_id, 'enqueued_at': now, 'last_seen': now})
+                print(f"  ⏳ Generation queue full - session {session_id[:8]}... "
+                      f"queued at position {len(state['queue'])}")
+
+        return _status(state, session_id)
+
+def get_admission_status(session_id):
+    """
+    Admission status for a session without joining the queue
+
+    Polling counts as activity: it keeps an admitted session's lease (and a
+    queued session's place) alive while its months generate.
+    """
+    now = time.time()
+    with _locked_state() as state:
+        _expire_and_promote(state, now)
+        entry = state['admitted'].get(session_id) or next(
+            (e for e in state['queue'] if e['session_id'] == session_id), None
+        )
+        if entry and now - entry['last_seen'] >= STATUS_TOUCH_SECONDS:
+            entry['last_seen'] = now
+        return _status(state, session_id)
+
+def release(session_id):
+    """Free a session's slot once its calendar has finished generating"""
+    with _locked_state() as state:
+        if state['admitted'].pop(session_id, None):
+            print(f"  ✓ Released generation slot for session {session_id[:8]}...")
+        state['queue'] = [e for e in state['queue'] if e['session_id'] != session_id]
+        _expire_and_promote(state, time.time())
+
+def get_stats():
+    """Machine-wide admission stats"""
+    with _locked_state() as state:
+        _expire_and_promote(state, time.time())
+        return {
+            'max_inflight_calendars': MAX_INFLIGHT_CALENDARS,
+            'inflight': len(state['admitted']),
+            'queued': len(state['queue']),
+            'calendar_eta_seconds': int(estimate_calendar_seconds())
+        }
@@ -0,0 +1,228 @@
+"""
+Resumable chunked uploads for mobile clients
+A client creates an upload, sends the file in chunks at explicit offsets
+(each with its own SHA-256), can ask how much the server has after a
+dropped connection, and completes the upload once every byte is in.
+State lives on the data volume so uploads survive worker restarts.
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import secrets
+import shutil
+from contextlib import contextmanager
+from app.session_storage import DATA_DIR
+
+# Largest file a chunked upload may assemble
+CHUNKED_UPLOAD_MAX_BYTES = int(os.getenv('CHUNKED_UPLOAD_MAX_BYTES', 40 * 1024 * 1024))
+# Chunk size we suggest to clients, and the most we accept in one request
+CHUNKED_UPLOAD_CHUNK_BYTES = int(os.getenv('CHUNKED_UPLOAD_CHUNK_BYTES', 1024 * 1024))
+CHUNKED_UPLOAD_MAX_CHUNK_BYTES = 8 * 1024 * 1024
+# Unfinished uploads are discarded after this long
+CHUNKED_UPLOAD_TTL_SECONDS = int(os.getenv('CHUNKED_UPLOAD_TTL_SECONDS', 24 * 3600))
+# Unfinished uploads one session may have at once (also the most one batch complete takes)
+CHUNKED_UPLOAD_MAX_OPEN_PER_SESSION = int(os.getenv('CHUNKED_UPLOAD_MAX_OPEN_PER_SESSION', 20))
+
+CHUNKED_UPLOAD_DIR = DATA_DIR / 'chunked_uploads'
+CHUNKED_UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
+
+_READ_BLOCK = 64 * 1024
+
+
+class ChunkedUploadError(Exception):
+    """Invalid chunked upload request (carries an HTTP status for the API)"""
+
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+def _upload_dir(upload_id):
+    # IDs are token_urlsafe, never paths - reject anything else
+    if not upload_id or not all(c.isalnum() or c in '-_' for c in upload_id):
+        raise ChunkedUploadError('Upload not found', 404)
+    return CHUNKED_UPLOAD_DIR / upload_id
+
+@contextmanager
+def _locked_upload(upload_id, session_id):
+    """Load an upload's metadata under an exclusive lock and save it afterwards"""
+    upload_dir = _upload_dir(upload_id)
+    meta_file = upload_dir / 'meta.json'
+    if not meta_file.exists():
+        raise ChunkedUploadError('Upload not found', 404)
+
+    with open(upload_dir / 'lock', 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(meta_file, 'r') as f:
+                meta = json.load(f)
+            if meta['session_id'] != session_id:
+                raise ChunkedUploadError('Upload not found', 404)
+            yield meta
+            meta['updated_at'] = time.time()
+            _write_meta(upload_dir, meta)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _write_meta(upload_dir, meta):
+    tmp_file = upload_dir / 'meta.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_file, upload_dir / 'meta.json')
+
+def _status(upload_id, meta):
+    return {
+        'upload_id': upload_id,
+        'filename': meta['filename'],
+        'total_size': meta['total_size'],
+        'received': meta['received'],
+        'complete': meta['received'] == meta['total_size'],
+        'chunk_size': CHUNKED_UPLOAD_CHUNK_BYTES
+    }
+
+
+def _open_upload_count(session_id):
+    count = 0
+    for meta_file in CHUNKED_UPLOAD_DIR.glob('*/meta.json'):
+        try:
+            with open(meta_file, 'r') as f:
+                if json.load(f)['session_id'] == session_id:
+                    count += 1
+        except (OSError, ValueError, KeyError):
+            continue
+    return count
+
+def create_upload(session_id, filename, total_size, sha256=None):
+    """
+    Start a chunked upload
+
+    Args:
+        session_id: Storage ID of the uploading session
+        filename: Original file name
+        total_size: Size of the complete file in bytes
+        sha256: Optional hex SHA-256 of the complete file, checked on completion
+
+    Returns:
+        dict: Upload status including 'upload_id' and suggested 'chunk_size'
+    """
+    if not isinstance(total_size, int) or total_size <= 0:
+        raise ChunkedUploadError('size must be a positive integer')
+    if total_size > CHUNKED_UPLOAD_MAX_BYTES:
+        raise ChunkedUploadError(f'File too large (max {CHUNKED_UPLOAD_MAX_BYTES // (1024 * 1024)}MB)', 413)
+
+    cleanup_expired_uploads()
+    if _open_upload_count(session_id) >= CHUNKED_UPLOAD_MAX_OPEN_PER_SESSION:
+        raise ChunkedUploadError('Too many unfinished uploads - complete them first', 429)
+
+    upload_id = secrets.token_urlsafe(16)
+    upload_dir = CHUNKED_UPLOAD_DIR / upload_id
+    upload_dir.mkdir()
+    (upload_dir / 'data.part').touch()
+
+    meta = {
+        'session_id': session_id,
+        'filename': filename or 'photo.jpg',
+        'total_size': total_size,
+        'sha256': sha256.lower() if sha256 else None,
+        'received': 0,
+        'created_at': time.time(),
+        'updated_at': time.time()
+    }
+    _write_meta(upload_dir, meta)
+    return _status(upload_id, meta)
+
+def get_upload_status(upload_id, session_id):
+    """Get how many bytes the server has, so a client can resume from there"""
+    with _locked_upload(upload_id, session_id) as meta:
+        return _status(upload_id, meta)
+
+def write_chunk(upload_id, session_id, offset, stream, content_length, checksum=None):
+    """
+    Write one chunk at `offset`, streaming it from the request body
+
+    The chunk only counts once its SHA-256 matches `checksum`. Re-sending a
+    chunk the server already has is acknowledged without rewriting it.
+
+    Args:
+        offset: Byte offset of this chunk in the file
+        stream: Readable request body
+        content_length: Size of the chunk in bytes
+        checksum: Hex SHA-256 of the chunk
+
+    Returns:
+        dict: Upload status after the write
+    """
+    if content_length is None or content_length <= 0:
+        raise ChunkedUploadError('Empty chunk')
+    if content_length > CHUNKED_UPLOAD_MAX_CHUNK_BYTES:
+        raise ChunkedUploadError('Chunk too large', 413)
+
+    with _locked_upload(upload_id, session_id) as meta:
+        if offset + content_length <= meta['received']:
+            # Duplicate of a chunk we already stored (client retried after a lost response)
+            return _status(upload_id, meta)
+        if offset != meta['received']:
+            raise ChunkedUploadError('Offset mismatch', 409, received=meta['received'])
+        if offset + content_length > meta['total_size']:
+            raise ChunkedUploadError('Chunk exceeds declared file size', 416, received=meta['received'])
+
+        digest = hashlib.sha256()
+        remaining = content_length
+        with open(_upload_dir(upload_id) / 'data.part', 'r+b') as part:
+            part.seek(offset)
+            while remaining:
+                block = stream.read(min(_READ_BLOCK, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                part.write(block)
+                remaining -= len(block)
+
+        if remaining:
+            # Connection dropped mid-chunk - the partial bytes get overwritten on retry
+            raise ChunkedUploadError('Incomplete chunk', 400, received=meta['received'])
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise ChunkedUploadError('Chunk checksum mismatch', 422, received=meta['received'])
+
+        meta['received'] = offset + content_length
+        return _status(upload_id, meta)
+
+def complete_upload(upload_id, session_id):
+    """
+    Finish an upload once every byte has arrived
+
+    Returns:
+        tuple: (filename, path to the assembled file) - call discard_upload()
+               when done processing it
+    """
+    with _locked_upload(upload_id, session_id) as meta:
+        if meta['received'] != meta['total_size']:
+            raise ChunkedUploadError('Upload incomplete', 409, received=meta['received'])
+
+        path = _upload_dir(upload_id) / 'data.part'
+        if meta['sha256']:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(_READ_BLOCK), b''):
+                    digest.update(block)
+            if digest.hexdigest() != meta['sha256']:
+                raise ChunkedUploadError('File checksum mismatch', 422, received=meta['received'])
+
+        return meta['filename'], str(path)
+
+def discard_upload(upload_id):
+    """Delete an upload's state and data"""
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+
+def cleanup_expired_uploads():
+    """Delete uploads nobody has touched for CHUNKED_UPLOAD_TTL_SECONDS"""
+    cutoff = time.time() - CHUNKED_UPLOAD_TTL_SECONDS
+    for upload_dir in CHUNKED_UPLOAD_DIR.iterdir():
+        try:
+            if (upload_dir / 'meta.json').stat().st_mtime < cutoff:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+        except OSError:
+            continue
@@ -0,0 +1,576 @@
+"""
+Durable fulfillment queue behind the Stripe webhook
+The webhook only records a paid checkout in an on-disk outbox and returns.
+A background worker runs the Printify steps, checkpointing each step's
+result, so a retry (or another process after a crash) resumes where the
+last attempt stopped instead of re-uploading images or creating a second
+product. Failed orders stay in the outbox with their error. In batch mode
+(FULFILLMENT_BATCH_WINDOW_SECONDS) due orders are collected for a short
+window and fulfilled together.
+"""
+import os
+import json
+import time
+import fcntl
+import socket
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from app.session_storage import DATA_DIR
+
+# Attempts before an order is parked as 'failed' for manual follow-up
+FULFILLMENT_MAX_ATTEMPTS = int(os.getenv('FULFILLMENT_MAX_ATTEMPTS', 8))
+# Retry backoff: base * 2^(attempt - 1), capped
+FULFILLMENT_RETRY_BASE_SECONDS = int(os.getenv('FULFILLMENT_RETRY_BASE_SECONDS', 30))
+FULFILLMENT_RETRY_MAX_SECONDS = 3600
+# A running order whose worker stops checkpointing for this long is picked up again
+FULFILLMENT_LEASE_SECONDS = int(os.getenv('FULFILLMENT_LEASE_SECONDS', 300))
+FULFILLMENT_POLL_SECONDS = int(os.getenv('FULFILLMENT_POLL_SECONDS', 2))
+# Batch mode (0 = off): due orders are held for up to this long so they can
+# be fulfilled together - one shared upload pool, then products and orders
+# created concurrently - smoothing Printify load during bursts
+FULFILLMENT_BATCH_WINDOW_SECONDS = int(os.getenv('FULFILLMENT_BATCH_WINDOW_SECONDS', 0))
+# A batch starts early once this many orders are due
+FULFILLMENT_BATCH_SIZE = int(os.getenv('FULFILLMENT_BATCH_SIZE', 10))
+# Orders of a batch running their product/order steps at once
+FULFILLMENT_BATCH_CONCURRENCY = int(os.getenv('FULFILLMENT_BATCH_CONCURRENCY', 4))
+
+OUTBOX_DIR = DATA_DIR / 'fulfillment_outbox'
+OUTBOX_DIR.mkdir(exist_ok=True, parents=True)
+LOCK_FILE = OUTBOX_DIR / 'outbox.lock'
+
+# Identifies this process as a lease owner
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+MONTH_NAMES = ["january", "february", "march", "april", "may", "june",
+               "july", "august", "september", "october", "november", "december"]
+
+# Fulfillment steps in order - each one's result is checkpointed in record['steps']
+STEPS = ['checkout', 'upload_images', 'create_product', 'publish_product',
+         'create_order', 'submit_order', 'save_order_info']
+
+_thread = None
+_wake = threading.Event()  # Set when an order is queued, so the worker starts right away
+
+
+class LeaseLost(Exception):
+    """Another process took over the order (our lease expired)"""
+    pass
+
+
+def _record_path(key):
+    # Checkout session IDs are alphanumeric plus underscores
+    if not key or not all(c.isalnum() or c == '_' for c in key):
+        raise ValueError(f"Invalid fulfillment key: {key!r}")
+    return OUTBOX_DIR / f'{key}.json'
+
+def _read_record(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_record(record):
+    record['updated_at'] = time.time()
+    path = _record_path(record['key'])
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _outbox_lock():
+    """Exclusive lock across processes for claiming and rewriting records"""
+    with open(LOCK_FILE, 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def enqueue(event_id, stripe_session_id, checkout=None):
+    """
+    Record a paid checkout for fulfillment (called by the webhook)
+
+    Idempotent: Stripe retries of the same checkout don't queue it twice.
+
+    Args:
+        event_id: Stripe event ID
+        stripe_session_id: Stripe checkout session ID (the record key)
+        checkout: Checkout details taken from the event payload, if complete
+                  (stripe_service.checkout_details_from_event) - saves the
+                  worker retrieving the session from Stripe
+
+    Returns:
+        bool: True if newly queued, False if already known
+    """
+    now = time.time()
+    with _outbox_lock():
+        if _record_path(stripe_session_id).exists():
+            return False
+        _write_record({
+            'key': stripe_session_id,
+            'event_id': event_id,
+            'stripe_session_id': stripe_session_id,
+            'status': 'queued',
+            'steps': {'checkout': checkout} if checkout else {},
+            'attempts': 0,
+            'next_attempt_at': now,
+            'last_error': None,
+            'owner': None,
+            'lease_expires': 0,
+            'created_at': now
+        })
+    _wake.set()
+    return True
+
+def get_status(stripe_session_id):
+    """
+    Fulfillment progress for an order (no customer details)
+
+    Returns:
+        dict or None: None if the order isn't in the outbox
+    """
+    try:
+        record = _read_record(_record_path(stripe_session_id))
+    except ValueError:
+        return None
+    if not record:
+        return None
+
+    return {
+        'status': record['status'],
+        'steps_completed': [step for step in STEPS if step in record['steps']],
+        'images_uploaded': len(record['steps'].get('uploaded_months', {})),
+        'attempts': record['attempts'],
+        'next_attempt_at': record['next_attempt_at'] if record['status'] == 'retrying' else None,
+        'printify_order_id': record['steps'].get('create_order'),
+        'created_at': datetime.utcfromtimestamp(record['created_at']).isoformat(),
+        'updated_at': datetime.utcfromtimestamp(record['updated_at']).isoformat()
+    }
+
+def requeue(stripe_session_id):
+    """Give a 'failed' order a fresh set of attempts, keeping its completed steps"""
+    with _outbox_lock():
+        record = _read_record(_record_path(stripe_session_id))
+        if not record or record['status'] != 'failed':
+            return False
+        record.update(status='queued', attempts=0, next_attempt_at=time.time(), owner=None, lease_expires=0)
+        _write_record(record)
+    _wake.set()
+    return True
+
+
+def _claim_due(limit=1, window=0):
+    """
+    Take up to `limit` due orders, oldest first (including ones whose
+    worker died mid-run)
+
+    With a window, nothing is taken until the oldest due order has waited
+    that long or `limit` orders are due.
+    """
+    now = time.time()
+    with _outbox_lock():
+        due = []
+        for path in OUTBOX_DIR.glob('*.json'):
+            record = _read_record(path)
+            if not record or record['status'] not in ('queued', 'retrying', 'running'):
+                continue
+            if record['status'] == 'running' and record['lease_expires'] > now:
+                continue
+            if record['next_attempt_at'] > now:
+                continue
+            due.append(record)
+
+        if not due:
+            return []
+
+        due.sort(key=lambda r: r['created_at'])
+        due_since = min(max(r['created_at'], r['next_attempt_at']) for r in due)
+        if window and len(due) < limit and now - due_since < window:
+            return []
+
+        claimed = due[:limit]
+        for record in claimed:
+            record['status'] = 'running'
+            record['owner'] = OWNER_ID
+            record['lease_expires'] = now + FULFILLMENT_LEASE_SECONDS
+            record['attempts'] += 1
+            _write_record(record)
+        return claimed
+
+def _claim_next():
+    """Take the oldest due order, or one whose worker died mid-run"""
+    claimed = _claim_due()
+    return claimed[0] if claimed else None
+
+def _save_step(record, step, result):
+    """Checkpoint a finished step (and renew the lease)"""
+    with _outbox_lock():
+        current = _read_record(_record_path(record['key']))
+        if not current or current['owner'] != OWNER_ID:
+            raise LeaseLost(record['key'])
+        record['steps'][step] = result
+        current['steps'] = record['steps']
+        current['lease_expires'] = time.time() + FULFILLMENT_LEASE_SECONDS
+        _write_record(current)
+
+def _renew_leases(records):
+    """Extend the leases of claimed orders this process is still running"""
+    now = time.time()
+    with _outbox_lock():
+        for record in records:
+            current = _read_record(_record_path(record['key']))
+            if current and current['owner'] == OWNER_ID and current['status'] == 'running':
+                current['lease_expires'] = now + FULFILLMENT_LEASE_SECONDS
+                _write_record(current)
+
+@contextmanager
+def _lease_heartbeat(records):
+    """
+    Keep claimed orders' leases alive while they run
+
+    A single step can outlast the lease (an upload retried up to
+    PRINTIFY_MAX_ATTEMPTS times, or calls waiting out a 429), and another
+    process must not take the order over meanwhile.
+    """
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(FULFILLMENT_LEASE_SECONDS / 3):
+            try:
+                _renew_leases(records)
+            except Exception as e:
+                print(f"⚠️ Fulfillment lease renewal failed: {e}")
+
+    threading.Thread(target=heartbeat, name='fulfillment-heartbeat', daemon=True).start()
+    try:
+        yield
+    finally:
+        done.set()
+
+def _finish(record, error=None):
+    """Mark an attempt done: completed, retrying with backoff, or failed"""
+    now = time.time()
+    with _outbox_lock():
+        current = _read_record(_record_path(record['key']))
+        if not current or current['owner'] != OWNER_ID:
+            return
+
+        current['owner'] = None
+        current['lease_expires'] = 0
+        if error is None:
+            current['status'] = 'completed'
+            current['last_error'] = None
+        elif current['attempts'] >= FULFILLMENT_MAX_ATTEMPTS:
+            current['status'] = 'failed'
+            current['last_error'] = error
+        else:
+            delay = min(FULFILLMENT_RETRY_BASE_SECONDS * 2 ** (current['attempts'] - 1), FULFILLMENT_RETRY_MAX_SECONDS)
+            current['status'] = 'retrying'
+            current['next_attempt_at'] = now + delay
+            current['last_error'] = error
+        _write_record(current)
+        return current
+
+
+def _checkout_step(record):
+    """
+    Step 1: Payment, customer and shipping details - usually already taken
+    from the webhook payload, otherwise retrieved from Stripe
+    """
+    from app.services import stripe_service
+
+    if 'checkout' in record['steps']:
+        return record['steps']['checkout']
+
+    checkout_session = stripe_service.retrieve_checkout_session(record['stripe_session_id'])
+    _save_step(record, 'checkout', stripe_service.extract_checkout_details(checkout_session))
+    return record['steps']['checkout']
+
+def prepare_uploads(internal_session_id, skip=()):
+    """
+    The print renditions of a calendar, ready for printify_service.upload_images
+
+    Args:
+        internal_session_id: Storage ID of the calendar's session
+        skip: Month names already uploaded
+
+    Returns:
+        dict: Month name -> upload_images item (by URL or base64)
+    """
+    from app import session_storage
+    from app.services import print_renditions
+
+    months = session_storage.get_months_by_session_id(internal_session_id)
+    if not months or len(months) < 12:
+        raise Exception(f"Insufficient month images: found {len(months)}, need 12")
+
+    pending = {}
+    for month_num, month_name in enumerate(MONTH_NAMES, start=1):
+        if month_name in skip:
+            continue
+        month_data = next((m for m in months if m['month_number'] == month_num), None)
+        if not month_data or not month_data.get('master_image_data'):
+            raise Exception(f"Missing image data for month {month_num}")
+        master_data = month_data['master_image_data']
+        if print_renditions.PUBLIC_BASE_URL:
+            # Printify fetches the file itself - no image bytes leave this worker
+            pending[month_name] = (
+                print_renditions.signed_url(internal_session_id, month_num, master_data),
+                f"{month_name}.jpg",
+                print_renditions.content_hash(internal_session_id, month_num, master_data)
+            )
+        else:
+            pending[month_name] = (
+                print_renditions.get_rendition(internal_session_id, month_num, master_data),
+                f"{month_name}.jpg"
+            )
+    return pending
+
+def _pending_uploads(record):
+    """The print renditions of an order not uploaded yet - by this outbox or at checkout"""
+    from app.services import fulfillment_staging
+
+    internal_session_id = record['steps']['checkout']['internal_session_id']
+    uploaded = record['steps'].get('uploaded_months', {})
+
+    # Uploads pre-staged when the checkout session was created
+    staged = fulfillment_staging.get_staged_uploads(record['stripe_session_id'], internal_session_id)
+    staged = {month_name: upload_id for month_name, upload_id in staged.items() if month_name not in uploaded}
+    if staged:
+        uploaded = {**uploaded, **staged}
+        _save_step(record, 'uploaded_months', uploaded)
+        print(f"📦 Using {len(staged)} uploads pre-staged at checkout")
+
+    return prepare_uploads(internal_session_id, skip=uploaded)
+
+def _checkpoint_upload(record, month_name, upload_data):
+    """Save one month's Printify upload ID as soon as it finishes"""
+    uploaded = dict(record['steps'].get('uploaded_months', {}))
+    uploaded[month_name] = upload_data['id']
+    _save_step(record, 'uploaded_months', uploaded)
+
+def run_fulfillment(record):
+    """
+    Run the remaining fulfillment steps for an order
+
+    Steps already in record['steps'] are skipped, and images uploaded by an
+    earlier attempt are not uploaded again.
+
+    Returns:
+        str: Printify order ID
+    """
+    from app import session_storage
+    from app.services import printify_service, fulfillment_staging
+
+    steps = record['steps']
+    print("\n" + "="*60)
+    print(f"📦 Fulfilling order {record['key'][:20]}... (attempt {record['attempts']})")
+    print("="*60)
+
+    # Step 1: Payment, customer and shipping details from Stripe
+    checkout = _checkout_step(record)
+    internal_session_id = checkout['internal_session_id']
+    product_type = checkout['product_type']
+
+    product_config = printify_service.CALENDAR_PRODUCTS.get(product_type)
+    if not product_config:
+        raise Exception(f"Invalid product type: {product_type}")
+
+    # Step 2: Upload the 12 print renditions, by URL or base64 (checkpointed per month)
+    if 'upload_images' not in steps:
+        pending = _pending_uploads(record)
+        print(f"\n📤 Uploading images to Printify ({12 - len(pending)} already uploaded)...")
+
+        # Concurrent uploads; each one is checkpointed as it finishes
+        printify_service.upload_images(
+            pending,
+            on_upload=lambda month_name, upload_data: _checkpoint_upload(record, month_name, upload_data)
+        )
+
+        _save_step(record, 'upload_images', dict(steps.get('uploaded_months', {})))
+        print(f"✅ Uploaded {len(steps['upload_images'])} images successfully")
+
+    # Step 3: Create the product with the uploaded images
+    if 'create_product' not in steps:
+        print("\n🎨 Creating Printify product...")
+        _save_step(record, 'create_product', printify_service.create_calendar_product(
+            product_type=product_type,
+            month_image_ids=steps['upload_images'],
+            title=f"Custom Hunk Calendar for {checkout['customer_email']}"
+        ))
+    product_id = steps['create_product']
+
+    # Step 4: Publish the product
+    if 'publish_product' not in steps:
+        print("\n📢 Publishing product...")
+        printify_service.publish_product(product_id)
+        _save_step(record, 'publish_product', True)
+
+    # Step 5: Create the order
+    if 'create_order' not in steps:
+        print("\n📦 Creating Printify order...")
+        _save_step(record, 'create_order', printify_service.create_order(
+            product_id=product_id,
+            variant_id=product_config['variant_id'],
+            quantity=1,
+            shipping_address=checkout['shipping_address'],
+            customer_email=checkout['customer_email'],
+            external_id=f"hotm_{record['stripe_session_id']}"
+        ))
+    order_id = steps['create_order']
+
+    # Step 6: Submit the order to production
+    if 'submit_order' not in steps:
+        print("\n🏭 Submitting order to production...")
+        printify_service.submit_order(order_id)
+        _save_step(record, 'submit_order', True)
+
+    # Step 7: Save order details to session storage
+    if 'save_order_info' not in steps:
+        session_storage.save_order_info(internal_session_id, {
+            'stripe_checkout_session_id': record['stripe_session_id'],
+            'stripe_payment_intent_id': checkout['payment_intent_id'],
+            'printify_order_id': order_id,
+            'printify_product_id': product_id,
+            'product_type': product_type,
+            'customer_email': checkout['customer_email'],
+            'shipping_address': checkout['shipping_address'],
+            'status': 'submitted',
+            'created_at': datetime.now().isoformat()
+        })
+        _save_step(record, 'save_order_info', True)
+        fulfillment_staging.discard(record['stripe_session_id'])
+
+    print("\n✅ Order creation complete!")
+    print(f"   Printify Order ID: {order_id}")
+    print(f"   Product ID: {product_id}")
+    print("="*60 + "\n")
+    return order_id
+
+def _run_claimed(record):
+    """Run a claimed order and record the outcome"""
+    try:
+        order_id = run_fulfillment(record)
+    except LeaseLost:
+        print(f"⚠️ Fulfillment {record['key'][:20]}... taken over by another process")
+        return
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        result = _finish(record, error=str(e))
+        if result and result['status'] == 'failed':
+            print(f"❌ Fulfillment {record['key'][:20]}... FAILED after {result['attempts']} attempts: {e}")
+        elif result:
+            print(f"⚠️ Fulfillment {record['key'][:20]}... attempt {result['attempts']} failed, "
+                  f"retrying in {result['next_attempt_at'] - time.time():.0f}s: {e}")
+        return
+
+    _finish(record)
+    print(f"🎉 Order fulfilled successfully: {order_id}")
+
+def process_next():
+    """
+    Claim and run one due order
+
+    Returns:
+        bool: True if an order was processed
+    """
+    record = _claim_next()
+    if not record:
+        return False
+
+    with _lease_heartbeat([record]):
+        _run_claimed(record)
+    return True
+
+def process_batch():
+    """
+    Claim the due orders of a batch window and fulfill them together
+
+    All of the batch's image uploads go through one upload pool, then the
+    orders run their remaining steps (product, publish, order, submit)
+    FULFILLMENT_BATCH_CONCURRENCY at a time. Printify has no bulk product
+    or order endpoints, so this is what batching can share; the client's
+    rate limiter paces the calls.
+
+    Returns:
+        bool: True if a batch was processed
+    """
+    records = _claim_due(FULFILLMENT_BATCH_SIZE, window=FULFILLMENT_BATCH_WINDOW_SECONDS)
+    if not records:
+        return False
+
+    print(f"\n📦 Fulfilling a batch of {len(records)} orders")
+
+    # Orders also wait their turn below without checkpointing
+    with _lease_heartbeat(records):
+        _run_batch(records)
+    return True
+
+def _run_batch(records):
+    """Shared uploads, then each order's remaining steps (see process_batch)"""
+    from flask import current_app
+    from app.services import printify_service
+
+    # Checkout details and outstanding uploads of every order, in one pool
+    pending = {}
+    by_key = {record['key']: record for record in records}
+    for record in records:
+        try:
+            _checkout_step(record)
+            if 'upload_images' not in record['steps']:
+                for month_name, image in _pending_uploads(record).items():
+                    pending[(record['key'], month_name)] = image
+        except Exception as e:
+            # Left for run_fulfillment below, which fails or retries it properly
+            print(f"⚠️ Fulfillment {record['key'][:20]}... could not prepare uploads: {e}")
+
+    if pending:
+        print(f"📤 Uploading {len(pending)} images for {len(records)} orders...")
+        try:
+            printify_service.upload_images(
+                pending,
+                on_upload=lambda key, upload_data: _checkpoint_upload(by_key[key[0]], key[1], upload_data)
+            )
+        except Exception as e:
+            # Orders with missing uploads retry them in run_fulfillment
+            print(f"⚠️ Some batch uploads failed: {e}")
+
+    app = current_app._get_current_object()
+
+    def run_in_app(record):
+        with app.app_context():
+            _run_claimed(record)
+
+    with ThreadPoolExecutor(max_workers=FULFILLMENT_BATCH_CONCURRENCY, thread_name_prefix='fulfillment') as executor:
+        list(executor.map(run_in_app, records))
+
+def _worker_loop(app):
+    while True:
+        try:
+            with app.app_context():
+                process = process_batch if FULFILLMENT_BATCH_WINDOW_SECONDS else process_next
+                while process():
+                    pass
+        except Exception as e:
+            print(f"⚠️ Fulfillment worker error: {e}")
+        _wake.wait(FULFILLMENT_POLL_SECONDS)
+        _wake.clear()
+
+def start(app):
+    """Start the background fulfillment worker (idempotent)"""
+    global _thread
+    if _thread:
+        return
+
+    _thread = threading.Thread(target=_worker_loop, args=(app,), name='fulfillment-worker', daemon=True)
+    _thread.start()
+    print(f"✓ Fulfillment worker started (max {FULFILLMENT_MAX_ATTEMPTS} attempts, owner {OWNER_ID})")
+    if FULFILLMENT_BATCH_WINDOW_SECONDS:
+        print(f"  Batch mode: {FULFILLMENT_BATCH_WINDOW_SECONDS}s window, up to {FULFILLMENT_BATCH_SIZE} orders")
@@ -0,0 +1,178 @@
+"""
+Fulfillment pre-staging at checkout
+When a Stripe checkout session is created the calendar is already final, so
+(with FULFILLMENT_PRESTAGE on) its 12 print renditions are uploaded to
+Printify and the product's blueprint config resolved in the background
+while the customer pays. The fulfillment worker picks the staged upload
+IDs up by checkout session ID; staging of abandoned checkouts is deleted.
+"""
+import os
+import json
+import time
+import threading
+from app.session_storage import DATA_DIR
+
+# Start Printify uploads as soon as a checkout session is created
+FULFILLMENT_PRESTAGE = os.getenv('FULFILLMENT_PRESTAGE', '0') == '1'
+# Stripe checkout sessions expire after 24h - staging older than this is unused
+FULFILLMENT_STAGING_TTL_SECONDS = int(os.getenv('FULFILLMENT_STAGING_TTL_SECONDS', 24 * 3600))
+
+STAGING_DIR = DATA_DIR / 'fulfillment_staging'
+STAGING_DIR.mkdir(exist_ok=True, parents=True)
+
+# Only one staging thread per checkout session
+_active = set()
+# Checkouts discarded while their staging thread still runs - it must not
+# write the record back
+_discarded = set()
+_active_lock = threading.Lock()
+
+
+def _path(checkout_session_id):
+    # Checkout session IDs are alphanumeric plus underscores
+    if not checkout_session_id or not all(c.isalnum() or c == '_' for c in checkout_session_id):
+        raise ValueError(f"Invalid checkout session ID: {checkout_session_id!r}")
+    return STAGING_DIR / f'{checkout_session_id}.json'
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write(record):
+    record['updated_at'] = time.time()
+    path = _path(record['checkout_session_id'])
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+def _write_unless_discarded(record):
+    with _active_lock:
+        if record['checkout_session_id'] not in _discarded:
+            _write(record)
+
+def _run_staging(app, record):
+    from app.services import printify_service
+    from app.services.fulfillment_queue import prepare_uploads
+
+    checkout_session_id = record['checkout_session_id']
+    try:
+        with app.app_context():
+            # Resolve the blueprint's provider/variant now (catalog cache)
+            config = printify_service.CALENDAR_PRODUCTS[record['product_type']]
+            if config['print_provider_id'] == 'auto' or config['variant_id'] == 'auto':
+                printify_service.auto_detect_config(config['blueprint_id'])
+
+            pending = prepare_uploads(record['internal_session_id'])
+
+            def checkpoint_upload(month_name, upload_data):
+                record['uploaded_months'][month_name] = upload_data['id']
+                _write_unless_discarded(record)
+
+            printify_service.upload_images(pending, on_upload=checkpoint_upload)
+
+        record['status'] = 'staged'
+        print(f"📦 Pre-staged {len(record['uploaded_months'])} uploads for checkout {checkout_session_id[:20]}...")
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+        print(f"⚠️ Pre-staging failed for checkout {checkout_session_id[:20]}... "
+              f"({len(record['uploaded_months'])} uploads kept): {e}")
+    finally:
+        with _active_lock:
+            if checkout_session_id not in _discarded:
+                _write(record)
+            _active.discard(checkout_session_id)
+            _discarded.discard(checkout_session_id)
+
+def stage(app, checkout_session_id, internal_session_id, product_type):
+    """
+    Start uploading a checkout's print renditions in the background
+    (no-op unless FULFILLMENT_PRESTAGE is on)
+
+    Args:
+        app: Flask app, for the background thread's app context
+        checkout_session_id: Stripe checkout session ID (the staging key)
+        internal_session_id: Storage ID of the calendar's session
+        product_type: Product key in printify_service.CALENDAR_PRODUCTS
+
+    Returns:
+        bool: True if staging started
+    """
+    if not FULFILLMENT_PRESTAGE:
+        return False
+
+    with _active_lock:
+        if checkout_session_id in _active:
+            return False
+        _active.add(checkout_session_id)
+
+    now = time.time()
+    record = {
+        'checkout_session_id': checkout_session_id,
+        'internal_session_id': internal_session_id,
+        'product_type': product_type,
+        'status': 'uploading',
+        'uploaded_months': {},
+        'error': None,
+        'created_at': now
+    }
+    _write(record)
+    threading.Thread(
+        target=_run_staging,
+        args=(app, record),
+        name=f'prestage-{checkout_session_id[:12]}',
+        daemon=True
+    ).start()
+    return True
+
+def get_staged_uploads(checkout_session_id, internal_session_id):
+    """
+    Printify upload IDs staged for a checkout (possibly only some months,
+    if staging is still running or failed part-way)
+
+    Returns:
+        dict: Month name -> Printify upload ID
+    """
+    try:
+        record = _read(_path(checkout_session_id))
+    except ValueError:
+        return {}
+    # Only trust staging made for the same calendar
+    if not record or record['internal_session_id'] != internal_session_id:
+        return {}
+    return dict(record['uploaded_months'])
+
+def discard(checkout_session_id):
+    """Drop a checkout's staging (fulfilled or expired checkout)"""
+    try:
+        path = _path(checkout_session_id)
+    except ValueError:
+        return
+    with _active_lock:
+        if checkout_session_id in _active:
+            _discarded.add(checkout_session_id)
+        path.unlink(missing_ok=True)
+
+def cleanup_expired_staging():
+    """
+    Delete staging older than FULFILLMENT_STAGING_TTL_SECONDS
+
+    The Printify uploads themselves stay in the media library (and in the
+    upload cache, so a later order of the same calendar still reuses them).
+    """
+    cutoff = time.time() - FULFILLMENT_STAGING_TTL_SECONDS
+    removed = 0
+    for path in STAGING_DIR.glob('*.json'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"✓ Removed {removed} unused fulfillment stagings")
+    return removed
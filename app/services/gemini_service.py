@@ -138,6 +138,7 @@ def generate_calendar_images_batch(project_id, prompts, reference_image_data_lis
     """
     from app import db
     from app.models import CalendarMonth, CalendarProject
+    from app.services import image_pool, image_processing
 
     results = {}
 
@@ -178,11 +179,8 @@ def generate_calendar_images_batch(project_id, prompts, reference_image_data_lis
             # Generate image with face-swapping
             image_data = generate_calendar_image(prompt, reference_image_data_list)
 
-            # Convert PNG to JPEG for smaller file size
-            img = Image.open(io.BytesIO(image_data))
-            img_io = io.BytesIO()
-            img.convert('RGB').save(img_io, format='JPEG', quality=95)
-            jpeg_data = img_io.getvalue()
+            # Convert PNG to JPEG for smaller file size (in the image pool)
+            jpeg_data = image_pool.run(image_processing.transcode_to_jpeg, image_data, quality=95, optimize=False, adaptive=False)
 
             # Save to database
             month.master_image_data = jpeg_data
@@ -0,0 +1,288 @@
+"""
+Fair scheduler in front of the Gemini generation call path
+Round-robins across sessions within each priority class, caps how many
+jobs a single session can have in flight, and estimates per-session wait
+"""
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# Priority classes - lower value is served first
+PRIORITY_PAID = 0         # Paid work / regenerate-after-checkout
+PRIORITY_PREVIEW = 1      # Free previews before purchase
+PRIORITY_SPECULATIVE = 2  # Pre-generation before the user asks - idle capacity only
+
+PRIORITY_NAMES = {
+    PRIORITY_PAID: 'paid',
+    PRIORITY_PREVIEW: 'preview',
+    PRIORITY_SPECULATIVE: 'speculative',
+}
+
+# Worker threads calling Gemini concurrently (whole machine)
+GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', 2))
+# Max jobs one session can have running at the same time
+GENERATION_MAX_PER_SESSION = int(os.getenv('GENERATION_MAX_PER_SESSION', 1))
+# Workers kept free for real requests while speculative jobs run
+SPECULATIVE_RESERVED_WORKERS = int(os.getenv('SPECULATIVE_RESERVED_WORKERS', 1))
+
+# Gemini latency estimate used before we have any samples
+DEFAULT_LATENCY_SECONDS = 30.0
+# Weight of the newest sample in the latency moving average
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class _Job:
+    """A queued unit of work for one session"""
+
+    def __init__(self, session_id, key, priority, fn, args, kwargs):
+        self.session_id = session_id
+        self.key = key
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.time()
+        self.dispatched = False
+
+
+class GenerationScheduler:
+    """
+    Fair, priority-aware job scheduler with a fixed pool of worker threads
+
+    Jobs are grouped per session inside each priority class. Workers always
+    drain the highest non-empty priority class first and rotate between
+    sessions within it, so a session with 12 queued months only gets one
+    turn per round. A session never has more than `max_per_session` jobs
+    running at once.
+    """
+
+    def __init__(self, workers=GENERATION_WORKERS, max_per_session=GENERATION_MAX_PER_SESSION):
+        self.workers = max(1, workers)
+        self.max_per_session = max(1, max_per_session)
+
+        self._cond = threading.Condition()
+        # priority -> OrderedDict(session_id -> deque of jobs)
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._running = {}   # session_id -> running job count
+        self._jobs = {}      # (session_id, key) -> job (queued or running)
+        self._latency_avg = DEFAULT_LATENCY_SECONDS
+        self._threads = []
+
+    def start(self):
+        """Start worker threads (idempotent)"""
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'generation-worker-{i}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        print(f"✓ Generation scheduler started: {self.workers} workers, "
+              f"{self.max_per_session} per session")
+
+    def submit(self, session_id, key, fn, *args, priority=PRIORITY_PREVIEW, **kwargs):
+        """
+        Queue a job for a session
+
+        Args:
+            session_id: Storage ID of the session that owns the job
+            key: Job key unique within the session (e.g. month number)
+            fn: Callable to run on a worker thread
+            priority: PRIORITY_PAID, PRIORITY_PREVIEW or PRIORITY_SPECULATIVE
+
+        Returns:
+            Future: Resolves with fn's return value. If the same job is
+                    already queued or running, its existing future is returned.
+        """
+        with self._cond:
+            existing = self._jobs.get((session_id, key))
+            if existing:
+                # Promote a queued job if it's resubmitted at a higher priority
+                if priority < existing.priority and not existing.dispatched:
+                    self._remove_queued(existing)
+                    existing.priority = priority
+                    self._enqueue(existing)
+                    self._cond.notify()
+                return existing.future
+
+            job = _Job(session_id, key, priority, fn, args, kwargs)
+            self._jobs[(session_id, key)] = job
+            self._enqueue(job)
+            self._cond.notify()
+
+        self.start()
+        return job.future
+
+    def cancel_session(self, session_id, priority=None):
+        """
+        Cancel a session's queued jobs (running jobs finish normally)
+
+        Args:
+            session_id: Storage ID of the session
+            priority: Only cancel jobs in this priority class (default: all)
+
+        Returns:
+            int: Number of jobs cancelled
+        """
+        cancelled = 0
+        with self._cond:
+            for job_priority, sessions in self._queues.items():
+                if priority is not None and job_priority != priority:
+                    continue
+                for job in sessions.pop(session_id, ()):
+                    job.future.cancel()
+                    self._jobs.pop((job.session_id, job.key), None)
+                    cancelled += 1
+        return cancelled
+
+    def get_session_stats(self, session_id):
+        """
+        Queue depth and estimated wait for one session
+
+        Returns:
+            dict: {'queued', 'running', 'queue_depth', 'estimated_wait_seconds', 'avg_latency_seconds'}
+        """
+        with self._cond:
+            queued = 0
+            ahead = 0
+            for priority in sorted(self._queues):
+                sessions = self._queues[priority]
+                own = len(sessions.get(session_id, ()))
+                if own:
+                    queued += own
+                    # Round-robin: every other session gets a turn for each of ours
+                    ahead += sum(min(len(jobs), own) for sid, jobs in sessions.items() if sid != session_id)
+                elif not queued:
+                    # Higher priority classes are drained before ours
+                    ahead += sum(len(jobs) for jobs in sessions.values())
+
+            running = self._running.get(session_id, 0)
+            queue_depth = sum(len(jobs) for sessions in self._queues.values() for jobs in sessions.values())
+
+            if queued:
+                # Bounded both by the shared pool and by the per-session cap
+                rounds = max((ahead + queued) / self.workers, queued / self.max_per_session)
+                estimated_wait = rounds * self._latency_avg
+            else:
+                estimated_wait = 0.0
+
+            return {
+                'queued': queued,
+                'running': running,
+                'queue_depth': queue_depth,
+                'estimated_wait_seconds': round(estimated_wait, 1),
+                'avg_latency_seconds': round(self._latency_avg, 1),
+            }
+
+    def get_stats(self):
+        """Machine-wide scheduler stats"""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'max_per_session': self.max_per_session,
+                'running': sum(self._running.values()),
+                'queue_depth': {
+                    PRIORITY_NAMES[priority]: sum(len(jobs) for jobs in sessions.values())
+                    for priority, sessions in self._queues.items()
+                },
+                'avg_latency_seconds': round(self._latency_avg, 1),
+            }
+
+    @property
+    def avg_latency(self):
+        """Moving average of job latency in seconds"""
+        return self._latency_avg
+
+    # Internal helpers (call with self._cond held)
+
+    def _enqueue(self, job):
+        self._queues[job.priority].setdefault(job.session_id, deque()).append(job)
+
+    def _remove_queued(self, job):
+        sessions = self._queues[job.priority]
+        jobs = sessions.get(job.session_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del sessions[job.session_id]
+
+    def _next_job(self):
+        """Pick the next job: highest priority first, round-robin across sessions"""
+        running_total = sum(self._running.values())
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            if priority == PRIORITY_SPECULATIVE and sessions:
+                # Speculative work only runs on otherwise idle workers
+                if running_total >= max(1, self.workers - SPECULATIVE_RESERVED_WORKERS):
+                    continue
+            for session_id in list(sessions):
+                if self._running.get(session_id, 0) >= self.max_per_session:
+                    continue
+                jobs = sessions[session_id]
+                job = jobs.popleft()
+                if jobs:
+                    # Send this session to the back of the line
+                    sessions.move_to_end(session_id)
+                else:
+                    del sessions[session_id]
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                job.dispatched = True
+                self._running[job.session_id] = self._running.get(job.session_id, 0) + 1
+
+            run = job.future.set_running_or_notify_cancel()
+            result = error = None
+            if run:
+                started = time.time()
+                try:
+                    result = job.fn(*job.args, **job.kwargs)
+                except BaseException as e:
+                    traceback.print_exc()
+                    error = e
+                elapsed = time.time() - started
+
+            # Forget the job before resolving its future, so a submit() made
+            # once the result is known starts a new job instead of getting this one
+            with self._cond:
+                if run:
+                    self._latency_avg += LATENCY_EWMA_ALPHA * (elapsed - self._latency_avg)
+                self._running[job.session_id] -= 1
+                if not self._running[job.session_id]:
+                    del self._running[job.session_id]
+                if self._jobs.get((job.session_id, job.key)) is job:
+                    del self._jobs[(job.session_id, job.key)]
+                self._cond.notify_all()
+
+            if run:
+                if error is not None:
+                    job.future.set_exception(error)
+                else:
+                    job.future.set_result(result)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Get the process-wide generation scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler()
+        return _scheduler
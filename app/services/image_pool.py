@@ -0,0 +1,149 @@
+"""
+Process pool for CPU-bound image work
+Keeps PIL decode/encode (and the image copies it makes) out of the web
+worker's request threads. Submissions are bounded so a burst can't queue
+unlimited image bytes in memory.
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker processes (0 runs everything inline on the calling thread)
+IMAGE_POOL_WORKERS = int(os.getenv('IMAGE_POOL_WORKERS', os.cpu_count() or 1))
+# Jobs allowed to wait for a worker before submit() blocks
+IMAGE_POOL_QUEUE_SIZE = int(os.getenv('IMAGE_POOL_QUEUE_SIZE', 8))
+# Recycle workers after this many jobs to hand fragmented memory back to the OS
+IMAGE_POOL_MAX_TASKS_PER_CHILD = int(os.getenv('IMAGE_POOL_MAX_TASKS_PER_CHILD', 50))
+
+# Memory allowed for full-resolution decodes in flight at once (whole process)
+IMAGE_DECODE_BUDGET_MB = int(os.getenv('IMAGE_DECODE_BUDGET_MB', 160))
+
+
+class MemoryBudget:
+    """
+    Counting budget in bytes shared by all request threads
+
+    acquire() blocks until the requested bytes fit. A single request bigger
+    than the whole budget is still admitted once nothing else is in flight,
+    so oversized images are serialized rather than rejected.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self._cond:
+            while self.in_use and self.in_use + nbytes > self.limit:
+                self._cond.wait()
+            self.in_use += nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, IMAGE_POOL_WORKERS) + IMAGE_POOL_QUEUE_SIZE)
+
+decode_budget = MemoryBudget(IMAGE_DECODE_BUDGET_MB * 1024 * 1024)
+
+
+def _get_executor():
+    """Lazily create the process pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # forkserver: never fork the threaded web worker itself. Preload
+            # only the image code - the default preloads __main__, which
+            # would run the entry point (and create_app) in the server.
+            ctx = multiprocessing.get_context('forkserver')
+            ctx.set_forkserver_preload(['app.services.image_processing'])
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_POOL_WORKERS,
+                mp_context=ctx,
+                max_tasks_per_child=IMAGE_POOL_MAX_TASKS_PER_CHILD
+            )
+            print(f"✓ Image pool started: {IMAGE_POOL_WORKERS} worker processes")
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def submit(fn, *args, **kwargs):
+    """
+    Queue an image_processing function on the pool
+
+    Blocks while the pool's queue is full, so callers can't pile up
+    unbounded image bytes waiting for a worker.
+
+    Args:
+        fn: Top-level (picklable) function, e.g. image_processing.transcode_to_jpeg
+
+    Returns:
+        Future: Resolves with fn's return value
+    """
+    if IMAGE_POOL_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    _slots.acquire()
+    try:
+        future = _get_executor().submit(fn, *args, **kwargs)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda f: _slots.release())
+    return future
+
+def run(fn, *args, **kwargs):
+    """
+    Run an image_processing function in the pool and wait for its result
+
+    Falls back to running inline if the pool is disabled or a worker
+    process died.
+
+    Returns:
+        fn's return value
+    """
+    if IMAGE_POOL_WORKERS <= 0:
+        return fn(*args, **kwargs)
+
+    try:
+        return submit(fn, *args, **kwargs).result()
+    except BrokenProcessPool:
+        print(f"⚠️ Image pool broken, running {fn.__name__} inline and restarting pool")
+        _reset_executor()
+        return fn(*args, **kwargs)
+
+def submit_budgeted(nbytes, fn, *args, **kwargs):
+    """
+    Queue a memory-heavy job once `nbytes` of the decode budget is free
+
+    The budget is held until the job finishes, capping how many
+    full-resolution decodes run at once across all requests.
+
+    Returns:
+        Future: Resolves with fn's return value
+    """
+    decode_budget.acquire(nbytes)
+    try:
+        future = submit(fn, *args, **kwargs)
+    except BaseException:
+        decode_budget.release(nbytes)
+        raise
+    future.add_done_callback(lambda f: decode_budget.release(nbytes))
+    return future
@@ -0,0 +1,585 @@
+"""
+CPU-bound image operations
+Plain top-level functions taking and returning bytes, so they can run
+inline or in the image_pool worker processes
+"""
+import io
+import os
+from PIL import Image, ImageFilter, ImageOps
+
+# Largest image we will decode. PIL warns above this and refuses outright
+# (DecompressionBombError) above twice this, in every process that imports us.
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 50_000_000))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Register HEIC support for iPhone photos
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    # Uploads only use the primary image - don't decode depth maps or
+    # auxiliary images (portrait mattes etc.) alongside it
+    pillow_heif.options.DEPTH_IMAGES = False
+    pillow_heif.options.AUX_IMAGES = False
+except ImportError:
+    pillow_heif = None  # HEIC support not available
+
+# Face detection for reference selection
+try:
+    import cv2
+except ImportError:
+    cv2 = None  # Reference photos are used in upload order instead
+
+# Laplacian variance of a crisp face at detection scale, and the share of
+# the frame a close-up face covers - scores saturate at these values
+SHARP_LAPLACIAN_VARIANCE = 300.0
+LARGE_FACE_FRACTION = 0.15
+
+_face_cascade = None
+
+# Adaptive JPEG quality: stored images are encoded at the lowest quality
+# whose SSIM against the source meets the target. The quality a caller asks
+# for becomes the ceiling, so no image gets bigger than before.
+JPEG_ADAPTIVE_QUALITY = os.getenv('JPEG_ADAPTIVE_QUALITY', '1') == '1'
+JPEG_TARGET_SSIM = float(os.getenv('JPEG_TARGET_SSIM', 0.98))
+JPEG_MIN_QUALITY = int(os.getenv('JPEG_MIN_QUALITY', 60))
+JPEG_PROGRESSIVE = os.getenv('JPEG_PROGRESSIVE', '1') == '1'
+# '4:2:0' (smallest), '4:2:2' or '4:4:4' (sharpest color edges)
+JPEG_SUBSAMPLING = os.getenv('JPEG_SUBSAMPLING', '4:2:0')
+# Quality probes are compared at this size (luma; chroma at half of it)
+SSIM_MAX_DIMENSION = int(os.getenv('SSIM_MAX_DIMENSION', 512))
+# Float planes and integral images ssim() holds at SSIM_MAX_DIMENSION
+_SSIM_WORKING_BYTES = SSIM_MAX_DIMENSION ** 2 * 8 * 16
+
+
+def _save_jpeg(img, quality, optimize=False, progressive=False, subsampling=-1):
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality, optimize=optimize,
+             progressive=progressive, subsampling=subsampling)
+    return out.getvalue()
+
+def encode_jpeg_adaptive(img, max_quality=90, target_ssim=None, min_quality=None,
+                         progressive=None, subsampling=None, optimize=True):
+    """
+    Encode at the lowest quality that keeps SSIM >= target_ssim
+
+    Binary-searches quality between min_quality and max_quality. Probes skip
+    the Huffman optimization and progressive passes, which are lossless and
+    don't change SSIM; only the final encode uses them.
+
+    Args:
+        img: RGB PIL image
+        max_quality: Highest quality to use (what a fixed encoder would have used)
+        target_ssim, min_quality, progressive, subsampling: Override the
+            JPEG_* settings
+
+    Returns:
+        tuple: (jpeg bytes, stats dict with 'quality', 'ssim', 'bytes',
+                'baseline_bytes' and 'bytes_saved' vs a plain max_quality encode)
+    """
+    target_ssim = JPEG_TARGET_SSIM if target_ssim is None else target_ssim
+    min_quality = min(JPEG_MIN_QUALITY if min_quality is None else min_quality, max_quality)
+    progressive = JPEG_PROGRESSIVE if progressive is None else progressive
+    subsampling = JPEG_SUBSAMPLING if subsampling is None else subsampling
+
+    baseline = _save_jpeg(img, max_quality, optimize=optimize)
+
+    low, high = min_quality, max_quality
+    best_quality, best_ssim = max_quality, None
+    while low <= high:
+        quality = (low + high) // 2
+        candidate = _save_jpeg(img, quality, subsampling=subsampling)
+        with Image.open(io.BytesIO(candidate)) as decoded:
+            score = ssim(img, decoded)
+        if score >= target_ssim:
+            best_quality, best_ssim = quality, score
+            high = quality - 1
+        else:
+            low = quality + 1
+
+    data = _save_jpeg(img, best_quality, optimize=optimize, progressive=progressive, subsampling=subsampling)
+    if len(data) >= len(baseline):
+        data, best_quality = baseline, max_quality
+
+    return data, {
+        'quality': best_quality,
+        'ssim': best_ssim,
+        'bytes': len(data),
+        'baseline_bytes': len(baseline),
+        'bytes_saved': len(baseline) - len(data)
+    }
+
+def encode_jpeg(img, quality, optimize=True, adaptive=True):
+    """
+    Encode an RGB image for storage
+
+    With JPEG_ADAPTIVE_QUALITY on, `quality` is a ceiling and the lowest
+    quality meeting JPEG_TARGET_SSIM is used; bytes saved are logged.
+    adaptive=False keeps `quality` (images that print renditions are made from).
+
+    Returns:
+        bytes: JPEG image data
+    """
+    if not JPEG_ADAPTIVE_QUALITY or not adaptive:
+        return _save_jpeg(img, quality, optimize=optimize)
+
+    data, stats = encode_jpeg_adaptive(img, max_quality=quality, optimize=optimize)
+    print(f"🗜️ JPEG {img.width}x{img.height}: q{stats['quality']} instead of q{quality}, "
+          f"{stats['bytes'] // 1024}KB (saved {stats['bytes_saved'] // 1024}KB)")
+    return data
+
+def transcode_to_jpeg(image_data, quality=80, optimize=True, adaptive=True):
+    """
+    Decode an image (e.g. Gemini's PNG) and re-encode it as JPEG
+
+    Args:
+        image_data: Source image bytes
+        quality: JPEG quality (1-95) - the ceiling with adaptive encoding
+        optimize: Run the extra Huffman optimization pass
+        adaptive: Allow adaptive quality (see encode_jpeg)
+
+    Returns:
+        bytes: JPEG image data
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        rgb = img.convert('RGB')
+
+    return encode_jpeg(rgb, quality, optimize=optimize, adaptive=adaptive)
+
+def make_thumbnail(image_data, size=(200, 200), quality=85):
+    """
+    Create a JPEG thumbnail that fits inside `size`
+
+    Returns:
+        bytes: JPEG thumbnail data
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        # HEIC: the container's embedded preview, never the full image
+        preview = embedded_thumbnail(img, max(size))
+        if preview is not None:
+            img = preview
+        # draft() lets the JPEG decoder skip straight to a reduced scale
+        img.draft('RGB', size)
+        img.thumbnail(size)
+        rgb = img.convert('RGB')
+
+    out = io.BytesIO()
+    rgb.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+def make_derivatives(image_data, max_dimensions, quality=85):
+    """
+    Create downscaled JPEG copies of an image in one decode
+
+    Args:
+        image_data: Source image bytes
+        max_dimensions: Iterable of max width/height values, e.g. (1200, 600)
+        quality: JPEG quality for every derivative
+
+    Returns:
+        dict: {max_dimension: jpeg bytes}
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        rgb = img.convert('RGB')
+
+    derivatives = {}
+    # Largest first so each step downsamples the previous (smaller) result
+    for max_dimension in sorted(max_dimensions, reverse=True):
+        rgb.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        rgb.save(out, format='JPEG', quality=quality, optimize=True)
+        derivatives[max_dimension] = out.getvalue()
+    return derivatives
+
+def _open(source):
+    """Open image bytes or a file path (paths are read lazily from disk)"""
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+def read_header(source):
+    """
+    Read format, dimensions and EXIF orientation without decoding pixels
+
+    Args:
+        source: Image bytes or path to a spooled upload
+
+    Returns:
+        dict: {'format', 'width', 'height', 'orientation'}
+    """
+    with _open(source) as img:
+        return {
+            'format': img.format,
+            'width': img.width,
+            'height': img.height,
+            'orientation': img.getexif().get(0x0112, 1)
+        }
+
+def estimate_decode_bytes(image_data, max_dimension=1920):
+    """
+    Estimate peak memory to decode and process an upload, from its header only
+
+    Args:
+        image_data: Image bytes or path to a spooled upload
+
+    Counts the decoded RGBA-sized frame plus one working copy (RGB convert /
+    resize), at the reduced size JPEG draft decoding will produce, and with
+    adaptive JPEG quality the decoded probe and ssim()'s arrays. Neither
+    Image.open() nor draft() decodes pixels, so this is cheap.
+    """
+    img, _ = open_reduced(image_data, max_dimension)
+    with img:
+        width, height = img.size
+    estimate = width * height * 4 * 2
+    if JPEG_ADAPTIVE_QUALITY:
+        estimate += width * height * 3 + _SSIM_WORKING_BYTES
+    return estimate
+
+# EXIF orientation tag value -> transpose that undoes it (same table as ImageOps.exif_transpose)
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def embedded_thumbnail(img, min_box):
+    """
+    Get the preview image embedded in a HEIC container
+
+    iPhone HEICs carry a small (typically 320px) HEVC-coded thumbnail, which
+    decodes in a fraction of the time of the 12MP primary image.
+
+    Args:
+        img: Opened (not yet loaded) PIL image
+        min_box: Smallest acceptable max width/height of the thumbnail
+
+    Returns:
+        PIL image or None: The thumbnail, or None if the image isn't HEIC or
+                           has no thumbnail that large
+    """
+    if pillow_heif is None or img.format != 'HEIF':
+        return None
+    thumb = pillow_heif.thumbnail(img, min_box=min_box)
+    if thumb is img or thumb.size == img.size:
+        return None  # No embedded thumbnail - pillow_heif hands back the image itself
+    return thumb
+
+def open_reduced(image_data, max_dimension):
+    """
+    Open an image, decoding as close to `max_dimension` as the format allows
+
+    For JPEGs, draft() makes libjpeg decode at 1/2, 1/4 or 1/8 scale via
+    DCT scaling, so a 12MP photo is never materialized at full size. HEVC
+    has no reduced decode, so HEICs use an embedded thumbnail when one is
+    big enough and otherwise decode the primary image only.
+
+    Args:
+        image_data: Image bytes or path to a spooled upload
+        max_dimension: Target max width/height
+
+    Returns:
+        tuple: (PIL image, EXIF orientation value)
+    """
+    img = _open(image_data)
+    orientation = img.getexif().get(0x0112, 1)
+
+    if img.format == 'JPEG' and max(img.size) > max_dimension:
+        # Request the aspect-correct target so both axes allow the same scale
+        ratio = max_dimension / max(img.size)
+        img.draft('RGB', (int(img.width * ratio), int(img.height * ratio)))
+    elif max(img.size) > max_dimension:
+        thumb = embedded_thumbnail(img, max_dimension)
+        if thumb is not None:
+            img.close()
+            img = thumb
+
+    return img, orientation
+
+def downscale(img, max_dimension):
+    """
+    Shrink an image to fit `max_dimension`, in two stages
+
+    A cheap integer box reduce() gets within 2x of the target, then LANCZOS
+    resamples to the exact size - near-identical output to a single LANCZOS
+    pass at a fraction of the CPU.
+    """
+    if max(img.size) <= max_dimension:
+        return img
+
+    ratio = max_dimension / max(img.size)
+    new_size = tuple(max(1, int(dim * ratio)) for dim in img.size)
+
+    # Keep 2x headroom for the final resample so quality isn't lost
+    factor = int(1 / ratio / 2)
+    if factor >= 2:
+        img = img.reduce(factor)
+
+    return img.resize(new_size, Image.Resampling.LANCZOS)
+
+def apply_orientation(img, orientation):
+    """Rotate/flip an image according to its EXIF orientation value"""
+    method = _ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+def _window_sums(x, size=8, stride=4):
+    """Sums of x over size x size windows every `stride` pixels (integral image)"""
+    import numpy as np
+
+    integral = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+    integral[1:, 1:] = x.cumsum(axis=0).cumsum(axis=1)
+    rows = np.arange(0, x.shape[0] - size + 1, stride)
+    cols = np.arange(0, x.shape[1] - size + 1, stride)
+    return (integral[np.ix_(rows + size, cols + size)] - integral[np.ix_(rows, cols + size)]
+            - integral[np.ix_(rows + size, cols)] + integral[np.ix_(rows, cols)])
+
+def _ssim_plane(a, b, size=8):
+    n = size * size
+    mu_a = _window_sums(a, size) / n
+    mu_b = _window_sums(b, size) / n
+    var_a = _window_sums(a * a, size) / n - mu_a ** 2
+    var_b = _window_sums(b * b, size) / n - mu_b ** 2
+    covariance = _window_sums(a * b, size) / n - mu_a * mu_b
+
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / \
+               ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def _ssim_planes(img, max_dimension):
+    """Y at most max_dimension on its long side, Cb and Cr at half of that, as float arrays"""
+    import numpy as np
+
+    img = img.convert('YCbCr')
+    if max_dimension:
+        factor = -(-max(img.size) // max_dimension)
+        if factor > 1:
+            img = img.reduce(factor)
+    y, cb, cr = img.split()
+    return [np.asarray(plane, dtype=np.float64) for plane in (y, cb.reduce(2), cr.reduce(2))]
+
+def ssim(image_a, image_b, max_dimension=SSIM_MAX_DIMENSION):
+    """
+    Mean structural similarity of two images over luma and chroma
+
+    8x8 windows every 4px, so half of them straddle JPEG block edges where
+    blocking shows (windows on the block grid alone overstate quality).
+    Both images are box-reduced to max_dimension first, and chroma (which
+    JPEG subsamples) to half of it, which keeps the arrays a few MB; Y, Cb
+    and Cr are weighted 4:1:1.
+
+    Args:
+        image_a, image_b: PIL images; image_b is resized to image_a's size if needed
+        max_dimension: Compare at this size (None: full size)
+
+    Returns:
+        float: 1.0 for identical images, lower as they diverge
+    """
+    if image_b.size != image_a.size:
+        image_b = image_b.resize(image_a.size, Image.Resampling.LANCZOS)
+
+    planes_a = _ssim_planes(image_a, max_dimension)
+    planes_b = _ssim_planes(image_b, max_dimension)
+
+    weights = (4, 1, 1)
+    return sum(
+        weight * _ssim_plane(a, b)
+        for a, b, weight in zip(planes_a, planes_b, weights)
+    ) / sum(weights)
+
+def dhash(img, hash_size=8):
+    """
+    Perceptual difference hash: 64 bits describing the image's brightness
+    gradients. Re-encodes, resizes and small edits of the same photo land
+    within a few bits of each other (compare with hamming_distance).
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (hash_size + 1) + col + 1])
+    return bits
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two dhash values"""
+    return bin(hash_a ^ hash_b).count('1')
+
+def process_upload(image_data, max_dimension=1920):
+    """
+    Turn an uploaded selfie into a stored master JPEG and a thumbnail
+
+    Decodes near the target size (JPEG DCT scaling), downsizes to
+    `max_dimension` in stages, applies EXIF orientation on the small image,
+    converts to RGB and strips metadata (privacy + size). HEIC thumbnails
+    come from the container's embedded preview.
+
+    Args:
+        image_data: Uploaded file bytes or path to the spooled upload (JPEG, PNG, HEIC, ...)
+        max_dimension: Max width/height of the stored master
+
+    Returns:
+        tuple: (master_jpeg_bytes, thumbnail_jpeg_bytes, dhash)
+    """
+    # Open image (supports JPEG, PNG, HEIC, etc.) at reduced size where possible
+    img, orientation = open_reduced(image_data, max_dimension)
+
+    # HEIC containers carry their own small preview - grab it before decoding
+    preview = embedded_thumbnail(img, 200)
+
+    # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Resize if too large (face detection doesn't need 4000px)
+    img = downscale(img, max_dimension)
+
+    # Auto-rotate based on EXIF orientation (iPhone photos) - cheap at this size
+    img = apply_orientation(img, orientation)
+
+    # Save optimized version (strips EXIF for privacy + size reduction)
+    master_data = encode_jpeg(img, 90)
+
+    # Create thumbnail for preview
+    if preview is not None:
+        thumb = apply_orientation(preview.convert('RGB'), orientation)
+        thumb.thumbnail((200, 200))
+    else:
+        img.thumbnail((200, 200))
+        thumb = img
+    thumb_io = io.BytesIO()
+    thumb.save(thumb_io, format='JPEG', quality=85)
+
+    # Perceptual hash for near-duplicate detection (thumbnail is plenty)
+    return master_data, thumb_io.getvalue(), dhash(thumb)
+
+def face_detection_available():
+    """True when OpenCV is installed (opencv-python-headless)"""
+    return cv2 is not None
+
+def _get_face_cascade():
+    """Frontal face Haar cascade bundled with OpenCV (loaded once per process)"""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
+
+def analyze_reference(image_data, detect_dimension=640):
+    """
+    Score a stored selfie as a face reference for Gemini
+
+    Finds the largest frontal face and measures its sharpness (variance of
+    the Laplacian). Big, sharp, single faces score highest; group shots are
+    penalized because they blur whose identity to keep.
+
+    Args:
+        image_data: Stored master JPEG bytes (already upright)
+        detect_dimension: Max width/height to run detection at
+
+    Returns:
+        dict: {'score', 'faces', 'face_box' ((x, y, w, h) in image pixels,
+               or None if no face was found), 'sharpness'}
+    """
+    import numpy as np
+
+    gray = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError('Could not decode reference image')
+
+    height, width = gray.shape
+    scale = min(1.0, detect_dimension / max(width, height))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+    faces = _get_face_cascade().detectMultiScale(
+        cv2.equalizeHist(gray), scaleFactor=1.1, minNeighbors=5, minSize=(32, 32)
+    )
+    if len(faces) == 0:
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        return {'score': min(sharpness / SHARP_LAPLACIAN_VARIANCE, 1.0), 'faces': 0, 'face_box': None, 'sharpness': sharpness}
+
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    sharpness = float(cv2.Laplacian(gray[y:y + h, x:x + w], cv2.CV_64F).var())
+    face_fraction = (w * h) / (gray.shape[0] * gray.shape[1])
+
+    score = 0.5 * min(sharpness / SHARP_LAPLACIAN_VARIANCE, 1.0) + 0.5 * min(face_fraction / LARGE_FACE_FRACTION, 1.0)
+    if len(faces) > 1:
+        score *= 0.5
+
+    return {
+        'score': score,
+        'faces': len(faces),
+        'face_box': tuple(int(v / scale) for v in (x, y, w, h)),
+        'sharpness': sharpness
+    }
+
+def crop_reference(image_data, face_box=None, max_dimension=1024, quality=90):
+    """
+    Crop a reference photo to a face-centred head-and-shoulders region
+
+    The crop is a 3:4 portrait about three face-widths wide with the face in
+    the upper third, clamped to the photo. Without a face box the whole
+    photo is kept. Either way the result is downscaled to `max_dimension`.
+
+    Returns:
+        bytes: JPEG image data
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        rgb = img.convert('RGB')
+
+    if face_box:
+        x, y, w, h = face_box
+        crop_w = min(rgb.width, w * 3)
+        crop_h = min(rgb.height, crop_w * 4 // 3)
+        crop_w = min(crop_w, crop_h * 3 // 4)
+
+        left = int(min(max(x + w / 2 - crop_w / 2, 0), rgb.width - crop_w))
+        top = int(min(max(y + h / 2 - crop_h / 3, 0), rgb.height - crop_h))
+        rgb = rgb.crop((left, top, left + crop_w, top + crop_h))
+
+    rgb = downscale(rgb, max_dimension)
+
+    out = io.BytesIO()
+    rgb.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+def make_print_rendition(image_data, size, quality=95, dpi=300):
+    """
+    Fit a generated month onto a print placeholder canvas
+
+    The artwork is scaled to fit entirely inside `size` (nothing cropped).
+    The leftover margins are filled with a blurred, enlarged copy of the
+    same image rather than flat bars, which prints far less noticeably.
+
+    Args:
+        image_data: Month JPEG bytes
+        size: (width, height) of the product placeholder in pixels
+        quality: JPEG quality for print (no chroma subsampling)
+        dpi: Resolution written to the JPEG header
+
+    Returns:
+        bytes: Print-ready JPEG data
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        rgb = img.convert('RGB')
+
+    canvas_width, canvas_height = size
+    art = ImageOps.contain(rgb, size, Image.Resampling.LANCZOS)
+
+    if art.size != size:
+        # Blur at low resolution - same look, a fraction of the CPU
+        background = ImageOps.fit(rgb, (canvas_width // 8, canvas_height // 8), Image.Resampling.BILINEAR)
+        background = background.filter(ImageFilter.GaussianBlur(6))
+        canvas = background.resize(size, Image.Resampling.BILINEAR)
+        canvas.paste(art, ((canvas_width - art.width) // 2, (canvas_height - art.height) // 2))
+    else:
+        canvas = art
+
+    out = io.BytesIO()
+    canvas.save(out, format='JPEG', quality=quality, subsampling='4:4:4', optimize=True, dpi=(dpi, dpi))
+    return out.getvalue()
@@ -0,0 +1,242 @@
+"""
+Durable checkpoints for month generation jobs
+Every queued/running month is persisted with a lease that its owning
+process keeps renewing. After a crash or redeploy the leases expire and a
+recovery pass re-queues only the unfinished months with the same parameters.
+"""
+import os
+import json
+import time
+import fcntl
+import socket
+import secrets
+import threading
+from contextlib import contextmanager
+from app.session_storage import DATA_DIR
+
+# A job whose owner stops heartbeating for this long is considered dead
+JOB_LEASE_SECONDS = int(os.getenv('GENERATION_JOB_LEASE_SECONDS', 90))
+# How often owners renew their leases and look for dead jobs to recover
+JOB_HEARTBEAT_SECONDS = int(os.getenv('GENERATION_JOB_HEARTBEAT_SECONDS', 15))
+
+JOBS_DIR = DATA_DIR / 'generation_jobs'
+JOBS_DIR.mkdir(exist_ok=True, parents=True)
+LOCK_FILE = JOBS_DIR / 'jobs.lock'
+
+# Identifies this process as a lease owner
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+_active = set()          # Record keys owned by this process
+_active_lock = threading.Lock()
+_thread = None
+
+
+def _record_path(key):
+    return JOBS_DIR / f'{key}.json'
+
+def _read_record(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_record(record):
+    path = _record_path(record['key'])
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _jobs_lock():
+    """Exclusive lock across processes for claiming and rewriting records"""
+    with open(LOCK_FILE, 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def record_key(session_id, month_num):
+    """Checkpoint key for a session's month"""
+    return f'{session_id}_{month_num}'
+
+def checkpoint(session_id, month_num, prompt, reference_hashes, priority):
+    """
+    Persist a month job before it is queued
+
+    Args:
+        session_id: Storage ID of the session
+        month_num: Month number (1-12)
+        prompt: Exact prompt text sent to Gemini
+        reference_hashes: Content hashes of the uploaded images used as
+                          references (session_storage.image_fingerprints)
+        priority: Scheduler priority class
+
+    Returns:
+        str: Record key (pass to complete() when the job finishes)
+    """
+    key = record_key(session_id, month_num)
+    now = time.time()
+    with _jobs_lock():
+        existing = _read_record(_record_path(key)) or {}
+        _write_record({
+            'key': key,
+            'session_id': session_id,
+            'month_num': month_num,
+            'prompt': prompt,
+            'reference_hashes': reference_hashes,
+            'priority': priority,
+            'owner': OWNER_ID,
+            'created_at': existing.get('created_at', now),
+            'heartbeat_at': now,
+            'lease_expires': now + JOB_LEASE_SECONDS,
+            'recoveries': existing.get('recoveries', 0)
+        })
+    with _active_lock:
+        _active.add(key)
+    return key
+
+def complete(key):
+    """Remove a finished (completed, failed or cancelled) job's checkpoint"""
+    with _active_lock:
+        _active.discard(key)
+    with _jobs_lock():
+        record = _read_record(_record_path(key))
+        # Another process may have recovered the job in the meantime
+        if record and record['owner'] == OWNER_ID:
+            _record_path(key).unlink(missing_ok=True)
+
+def heartbeat():
+    """Renew leases on all jobs owned by this process"""
+    with _active_lock:
+        keys = list(_active)
+    if not keys:
+        return
+
+    now = time.time()
+    with _jobs_lock():
+        for key in keys:
+            record = _read_record(_record_path(key))
+            if not record or record['owner'] != OWNER_ID:
+                with _active_lock:
+                    _active.discard(key)
+                continue
+            record['heartbeat_at'] = now
+            record['lease_expires'] = now + JOB_LEASE_SECONDS
+            _write_record(record)
+
+def recover():
+    """
+    Re-queue month jobs whose owner stopped heartbeating
+
+    Months already completed in the session are dropped; the rest are
+    resubmitted with the prompt, reference images and priority they were
+    checkpointed with.
+
+    Returns:
+        int: Number of months re-queued
+    """
+    from app import session_storage
+    from app.services.month_generation import submit_month, release_slot_if_finished
+
+    now = time.time()
+    claimed = []
+    with _jobs_lock():
+        for path in JOBS_DIR.glob('*.json'):
+            record = _read_record(path)
+            if not record or record['owner'] == OWNER_ID or record['lease_expires'] > now:
+                continue
+            # Claim it so no other process recovers the same job
+            record['owner'] = OWNER_ID
+            record['lease_expires'] = now + JOB_LEASE_SECONDS
+            record['recoveries'] = record.get('recoveries', 0) + 1
+            _write_record(record)
+            claimed.append(record)
+
+    requeued = 0
+    for record in claimed:
+        session_id = record['session_id']
+        month_num = record['month_num']
+        month = next(
+            (m for m in session_storage.get_months_by_session_id(session_id) if m['month_number'] == month_num),
+            None
+        )
+
+        if not month or month['generation_status'] == 'completed':
+            _record_path(record['key']).unlink(missing_ok=True)
+            continue
+
+        # Matched by content - the job was checkpointed with the hashes of its photos
+        images = session_storage.get_uploaded_images_by_session_id(session_id)
+        images = dict(zip(session_storage.image_fingerprints(images), images))
+        reference_hashes = record.get('reference_hashes')
+        if not reference_hashes or not all(h in images for h in reference_hashes):
+            print(f"⚠️ Recovery: reference photos gone for month {month_num}, marking failed")
+            session_storage.update_month_status_by_session_id(session_id, month_num, 'failed', error='Reference photos changed')
+            _record_path(record['key']).unlink(missing_ok=True)
+            release_slot_if_finished(session_id)
+            continue
+
+        session_storage.update_month_status_by_session_id(session_id, month_num, 'processing')
+        submit_month(
+            session_id,
+            month_num,
+            [images[h] for h in reference_hashes],
+            priority=record['priority'],
+            prompt=record['prompt']
+        )
+        requeued += 1
+        print(f"♻️ Recovered month {month_num} for session {session_id[:8]}... "
+              f"(recovery #{record['recoveries']})")
+
+    return requeued
+
+def reset_orphaned_months():
+    """
+    Return months stuck in 'processing' with no job checkpoint to 'pending'
+
+    These were interrupted before checkpointing existed or before their
+    record was written; the client can then generate them again.
+    """
+    from app import session_storage
+
+    reset = 0
+    for session_id in session_storage.get_all_session_ids():
+        for month in session_storage.get_months_by_session_id(session_id):
+            if month['generation_status'] != 'processing':
+                continue
+            if _record_path(record_key(session_id, month['month_number'])).exists():
+                continue
+            session_storage.update_month_status_by_session_id(session_id, month['month_number'], 'pending')
+            reset += 1
+
+    if reset:
+        print(f"♻️ Reset {reset} orphaned 'processing' months to pending")
+    return reset
+
+def _heartbeat_loop():
+    while True:
+        try:
+            heartbeat()
+            recover()
+        except Exception as e:
+            print(f"⚠️ Generation job heartbeat failed: {e}")
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+
+def start():
+    """Run startup recovery and the heartbeat/recovery thread (idempotent)"""
+    global _thread
+    if _thread:
+        return
+
+    try:
+        reset_orphaned_months()
+    except Exception as e:
+        print(f"⚠️ Orphaned month reset failed: {e}")
+
+    _thread = threading.Thread(target=_heartbeat_loop, name='generation-job-heartbeat', daemon=True)
+    _thread.start()
+    print(f"✓ Generation job checkpoints enabled (lease {JOB_LEASE_SECONDS}s, owner {OWNER_ID})")
@@ -0,0 +1,140 @@
+"""
+Month generation jobs
+Runs a single month's Gemini generation on a scheduler worker thread,
+outside the request that asked for it
+"""
+import gc
+from app import session_storage
+from app.services import admission_control, job_checkpoints, image_pool, image_processing, reference_selection
+from app.services import print_renditions
+from app.services.monthly_themes import get_enhanced_prompt
+from app.services.generation_scheduler import get_scheduler, PRIORITY_PAID, PRIORITY_PREVIEW
+
+
+def get_session_priority(session_id):
+    """Paid sessions (regenerate-after-checkout) outrank free previews"""
+    if session_storage.get_order_info_by_session_id(session_id):
+        return PRIORITY_PAID
+    return PRIORITY_PREVIEW
+
+
+def render_month_jpeg(month_num, reference_image_data, prompt=None):
+    """
+    Call Gemini for one month and transcode the PNG result to JPEG
+
+    Args:
+        month_num: Month number (1-12)
+        reference_image_data: List of reference image bytes for face-swapping
+        prompt: Prompt text (default: the month's enhanced theme prompt)
+
+    Returns:
+        bytes: JPEG image data
+    """
+    from app.services.gemini_service import generate_calendar_image
+
+    enhanced_prompt = prompt or get_enhanced_prompt(month_num)
+    print(f"🎨 Month {month_num}: Starting Gemini API call...")
+    image_data = generate_calendar_image(enhanced_prompt, reference_image_data)
+    print(f"✅ Month {month_num}: Generation succeeded! Size: {len(image_data)} bytes")
+
+    # Convert PNG to JPEG for smaller file size (in the image pool, off this thread)
+    # Quality 80 optimized for memory: good quality, smaller files, less RAM.
+    # Fixed, not adaptive: the print rendition is made from this file.
+    jpeg_data = image_pool.run(image_processing.transcode_to_jpeg, image_data, quality=80, adaptive=False)
+
+    # Clear image data from memory immediately
+    del image_data
+    gc.collect()
+
+    return jpeg_data
+
+
+def release_slot_if_finished(session_id):
+    """Hand the generation slot to the next queued calendar once no month is left to generate"""
+    months = session_storage.get_months_by_session_id(session_id)
+    # Failed months only come back through a retry, which asks for admission again
+    if months and all(m['generation_status'] in ('completed', 'failed') for m in months):
+        admission_control.release(session_id)
+
+
+def queue_print_rendition(session_id, month_num, jpeg_data):
+    """Prepare the month's print file in the background (never fails the month)"""
+    try:
+        print_renditions.build_async(session_id, month_num, jpeg_data)
+    except Exception as e:
+        print(f"⚠️ Month {month_num}: Could not queue print rendition: {e}")
+
+
+def generate_month_job(session_id, month_num, reference_images, prompt=None):
+    """
+    Generate one month's image and store it in the session
+
+    Runs on a scheduler worker thread, so it only uses session-ID based
+    storage functions (no Flask request context).
+
+    Args:
+        session_id: Storage ID of the session
+        month_num: Month number (1-12)
+        reference_images: Uploaded image dicts to pick face references from
+        prompt: Prompt text (default: the month's enhanced theme prompt)
+
+    Returns:
+        int: Size of the stored JPEG in bytes
+    """
+    try:
+        reference_image_data = reference_selection.select_references(session_id, reference_images)
+        jpeg_data = render_month_jpeg(month_num, reference_image_data, prompt)
+
+        session_storage.update_month_status_by_session_id(session_id, month_num, 'completed', image_data=jpeg_data)
+        print(f"💾 Month {month_num}: Saved {len(jpeg_data)} bytes")
+
+        queue_print_rendition(session_id, month_num, jpeg_data)
+        release_slot_if_finished(session_id)
+        return len(jpeg_data)
+
+    except Exception as e:
+        session_storage.update_month_status_by_session_id(session_id, month_num, 'failed', error=str(e))
+        release_slot_if_finished(session_id)
+        raise
+
+
+def submit_month(session_id, month_num, reference_images, priority=None, prompt=None):
+    """
+    Checkpoint a month and queue it for generation on the fair scheduler
+
+    Args:
+        session_id: Storage ID of the session
+        month_num: Month number (1-12)
+        reference_images: Uploaded image dicts to use as references
+        priority: Scheduler priority class (default: based on order status)
+        prompt: Prompt text (default: the month's enhanced theme prompt)
+
+    Returns:
+        Future: Resolves with the stored JPEG size in bytes
+    """
+    if priority is None:
+        priority = get_session_priority(session_id)
+    if prompt is None:
+        prompt = get_enhanced_prompt(month_num)
+
+    # Persist the job first so a crash/redeploy can resume it
+    key = job_checkpoints.checkpoint(
+        session_id,
+        month_num,
+        prompt,
+        session_storage.image_fingerprints(reference_images),
+        priority
+    )
+
+    future = get_scheduler().submit(
+        session_id,
+        month_num,
+        generate_month_job,
+        session_id,
+        month_num,
+        reference_images,
+        prompt,
+        priority=priority
+    )
+    future.add_done_callback(lambda f: job_checkpoints.complete(key))
+    return future
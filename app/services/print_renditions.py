@@ -0,0 +1,184 @@
+"""
+Print-ready month renditions
+As soon as a month completes, its image is fitted to the Printify calendar
+placeholder (3454x2725) and encoded for print in the background, so the
+Stripe webhook only has to read finished files. With PUBLIC_BASE_URL set,
+Printify fetches them itself through signed, expiring URLs.
+"""
+import os
+import re
+import hmac
+import time
+import shutil
+import hashlib
+from flask import current_app
+from app.session_storage import DATA_DIR
+from app.services import image_pool, image_processing
+from app.services.printify_service import PRINT_IMAGE_SIZE
+
+PRINT_RENDITION_QUALITY = int(os.getenv('PRINT_RENDITION_QUALITY', 95))
+# Renditions of sessions untouched for this long are deleted at startup
+PRINT_RENDITION_TTL_SECONDS = int(os.getenv('PRINT_RENDITION_TTL_SECONDS', 30 * 24 * 3600))
+
+# Externally reachable base URL of this app (e.g. https://hunkofthemonth.fly.dev).
+# When set, Printify downloads renditions by URL instead of receiving base64.
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', '').rstrip('/')
+# How long a signed rendition URL stays valid
+PRINT_URL_TTL_SECONDS = int(os.getenv('PRINT_URL_TTL_SECONDS', 3600))
+
+PRINT_RENDITION_DIR = DATA_DIR / 'print_renditions'
+PRINT_RENDITION_DIR.mkdir(exist_ok=True, parents=True)
+
+# Rendition file names, as produced by _rendition_path
+_RENDITION_NAME = re.compile(r'^\d{2}-[0-9a-f]{16}\.jpg$')
+# Session storage IDs are secrets.token_urlsafe
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Canvas plus blurred background and working copies, for the decode budget
+_RENDITION_BYTES = PRINT_IMAGE_SIZE[0] * PRINT_IMAGE_SIZE[1] * 3 * 3
+
+
+def _rendition_path(session_id, month_num, image_data):
+    # Keyed by content, so a regenerated month never gets a stale rendition
+    digest = hashlib.sha256(image_data).hexdigest()[:16]
+    return PRINT_RENDITION_DIR / session_id / f'{month_num:02d}-{digest}.jpg'
+
+def _store(path, rendition):
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(rendition)
+    os.replace(tmp_path, path)
+
+    # Drop renditions of earlier versions of this month
+    for old_path in path.parent.glob(f'{path.name[:2]}-*.jpg'):
+        if old_path != path:
+            old_path.unlink(missing_ok=True)
+
+def build_async(session_id, month_num, image_data):
+    """
+    Start rendering a completed month for print on the image pool
+
+    Returns:
+        Future or None: None if the rendition already exists
+    """
+    path = _rendition_path(session_id, month_num, image_data)
+    if path.exists():
+        return None
+
+    def on_done(future):
+        try:
+            _store(path, future.result())
+            print(f"🖨️ Month {month_num}: Print rendition ready ({path.stat().st_size // 1024}KB)")
+        except Exception as e:
+            print(f"⚠️ Month {month_num}: Print rendition failed: {e}")
+
+    future = image_pool.submit_budgeted(
+        _RENDITION_BYTES,
+        image_processing.make_print_rendition,
+        image_data,
+        PRINT_IMAGE_SIZE,
+        quality=PRINT_RENDITION_QUALITY
+    )
+    future.add_done_callback(on_done)
+    return future
+
+def ensure_rendition(session_id, month_num, image_data):
+    """
+    Make sure a month's print rendition is on disk, rendering it now if the
+    background build hasn't happened (e.g. after a redeploy)
+
+    Args:
+        session_id: Storage ID of the session
+        month_num: Month number (1-12)
+        image_data: The month's stored JPEG bytes
+
+    Returns:
+        tuple: (path, rendition bytes or None if it was already on disk)
+    """
+    path = _rendition_path(session_id, month_num, image_data)
+    if path.exists():
+        return path, None
+
+    print(f"⚠️ Month {month_num}: No precomputed print rendition, rendering now")
+    rendition = image_pool.run(
+        image_processing.make_print_rendition,
+        image_data,
+        PRINT_IMAGE_SIZE,
+        quality=PRINT_RENDITION_QUALITY
+    )
+    _store(path, rendition)
+    return path, rendition
+
+def get_rendition(session_id, month_num, image_data):
+    """
+    Get the print-ready JPEG for a month
+
+    Returns:
+        bytes: Print-ready JPEG data
+    """
+    path, rendition = ensure_rendition(session_id, month_num, image_data)
+    return rendition if rendition is not None else path.read_bytes()
+
+def content_hash(session_id, month_num, image_data):
+    """
+    SHA-256 hex of a month's print rendition file (rendering it if needed),
+    for the Printify upload cache
+    """
+    path, _ = ensure_rendition(session_id, month_num, image_data)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _sign(session_id, name, expires):
+    message = f'{session_id}/{name}:{expires}'.encode()
+    return hmac.new(current_app.config['SECRET_KEY'].encode(), message, hashlib.sha256).hexdigest()
+
+def signed_url(session_id, month_num, image_data):
+    """
+    Get an expiring public URL for a month's print rendition (needs an app
+    context and PUBLIC_BASE_URL)
+
+    Returns:
+        str: URL served by api.print_rendition, valid for PRINT_URL_TTL_SECONDS
+    """
+    path, _ = ensure_rendition(session_id, month_num, image_data)
+    expires = int(time.time()) + PRINT_URL_TTL_SECONDS
+    signature = _sign(session_id, path.name, expires)
+    return f'{PUBLIC_BASE_URL}/api/print/{session_id}/{path.name}?expires={expires}&signature={signature}'
+
+def verify_url(session_id, name, expires, signature):
+    """
+    Check a signed rendition URL
+
+    Returns:
+        Path or None: The rendition file, or None if the link is malformed,
+                      expired or not signed by us
+    """
+    if not _SESSION_ID.match(session_id) or not _RENDITION_NAME.match(name):
+        return None
+    try:
+        if int(expires) < time.time():
+            return None
+    except (TypeError, ValueError):
+        return None
+    if not signature or not hmac.compare_digest(_sign(session_id, name, expires), signature):
+        return None
+    return PRINT_RENDITION_DIR / session_id / name
+
+def cleanup_expired_renditions():
+    """Delete renditions for sessions not touched in PRINT_RENDITION_TTL_SECONDS"""
+    cutoff = time.time() - PRINT_RENDITION_TTL_SECONDS
+    removed = 0
+    for session_dir in PRINT_RENDITION_DIR.iterdir():
+        try:
+            if session_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"✓ Removed print renditions for {removed} expired sessions")
+    return removed
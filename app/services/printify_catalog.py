@@ -0,0 +1,222 @@
+"""
+Printify catalog cache
+The shop ID and each blueprint's print provider/variant, persisted in
+DATA_DIR/printify_catalog.json so they survive restarts and are shared by
+all worker processes. fetch_printify_calendars.py can write the file ahead
+of a deploy; the app loads it at startup, warms missing entries and
+refreshes stale ones in the background, serving the stale value meanwhile.
+"""
+import os
+import json
+import time
+import fcntl
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from app.session_storage import DATA_DIR
+
+# Entries older than this are refreshed (the cached value is still served)
+PRINTIFY_CATALOG_TTL_SECONDS = int(os.getenv('PRINTIFY_CATALOG_TTL_SECONDS', 24 * 3600))
+# How often the background thread looks for stale entries
+PRINTIFY_CATALOG_REFRESH_SECONDS = int(os.getenv('PRINTIFY_CATALOG_REFRESH_SECONDS', 3600))
+
+CATALOG_FILE = Path(os.getenv('PRINTIFY_CATALOG_FILE', DATA_DIR / 'printify_catalog.json'))
+
+_entries = {}         # key -> {'value': ..., 'fetched_at': ...}
+_file_mtime = None    # mtime of CATALOG_FILE when last read
+_lock = threading.Lock()
+_refreshing = set()   # Keys with a background refresh in flight
+_stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0}
+_thread = None
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock across processes for rewriting the catalog file"""
+    with open(path.with_suffix('.lock'), 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _read_file(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('entries', {})
+    except (FileNotFoundError, ValueError, AttributeError):
+        return {}
+
+def write_catalog(entries, path=CATALOG_FILE):
+    """
+    Merge entries into a catalog file, keeping the newest of each key
+
+    Args:
+        entries: Dict of key -> {'value': ..., 'fetched_at': ...}
+        path: Catalog file (default: CATALOG_FILE)
+
+    Returns:
+        dict: All entries now in the file
+    """
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with _file_lock(path):
+        merged = _read_file(path)
+        for key, entry in entries.items():
+            if key not in merged or merged[key]['fetched_at'] <= entry['fetched_at']:
+                merged[key] = entry
+
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': merged}, f, indent=2)
+        os.replace(tmp_path, path)  # Atomic - readers never see a half-written file
+    return merged
+
+def load():
+    """
+    Load the catalog file into memory (at startup, or when another process
+    has rewritten it)
+
+    Returns:
+        int: Number of entries loaded
+    """
+    global _file_mtime
+    try:
+        mtime = CATALOG_FILE.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+    entries = _read_file(CATALOG_FILE)
+    with _lock:
+        for key, entry in entries.items():
+            if key not in _entries or _entries[key]['fetched_at'] <= entry['fetched_at']:
+                _entries[key] = entry
+        _file_mtime = mtime
+        return len(entries)
+
+def _reload_if_changed():
+    try:
+        if CATALOG_FILE.stat().st_mtime != _file_mtime:
+            load()
+    except FileNotFoundError:
+        pass
+
+def _store(key, value):
+    global _file_mtime
+    entry = {'value': value, 'fetched_at': time.time()}
+    with _lock:
+        _entries[key] = entry
+    try:
+        write_catalog({key: entry})
+        _file_mtime = CATALOG_FILE.stat().st_mtime
+    except OSError as e:
+        print(f"  ⚠️ Could not save Printify catalog: {e}")
+
+def refresh(key, fetch):
+    """Fetch an entry now and save it"""
+    try:
+        value = fetch()
+    except Exception:
+        with _lock:
+            _stats['refresh_failures'] += 1
+        raise
+    _store(key, value)
+    with _lock:
+        _stats['refreshes'] += 1
+    return value
+
+def _refresh_in_background(key, fetch):
+    from flask import current_app
+    app = current_app._get_current_object()
+
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            with app.app_context():
+                refresh(key, fetch)
+            print(f"  ℹ Refreshed stale Printify catalog entry {key}")
+        except Exception as e:
+            print(f"  ⚠️ Printify catalog refresh failed for {key}: {e}")
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name=f'catalog-refresh-{key}', daemon=True).start()
+
+def get(key, fetch):
+    """
+    Get a catalog entry, fetching it on a miss
+
+    A stale entry is returned right away and refreshed in the background
+    (which needs an app context, like fetch itself).
+
+    Args:
+        key: Entry key, e.g. 'shop_id' or 'blueprint_1170'
+        fetch: Callable returning the value from the Printify API
+
+    Returns:
+        The cached or freshly fetched value
+    """
+    _reload_if_changed()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+        elif time.time() - entry['fetched_at'] > PRINTIFY_CATALOG_TTL_SECONDS:
+            _stats['stale_hits'] += 1
+        else:
+            _stats['hits'] += 1
+            return entry['value']
+
+    if entry is None:
+        return refresh(key, fetch)
+
+    _refresh_in_background(key, fetch)
+    return entry['value']
+
+def is_fresh(key):
+    with _lock:
+        entry = _entries.get(key)
+        return entry is not None and time.time() - entry['fetched_at'] <= PRINTIFY_CATALOG_TTL_SECONDS
+
+def get_stats():
+    """Catalog cache hit/miss counters and staleness"""
+    now = time.time()
+    with _lock:
+        ages = [now - entry['fetched_at'] for entry in _entries.values()]
+        return {
+            **_stats,
+            'entries': len(_entries),
+            'stale_entries': sum(1 for age in ages if age > PRINTIFY_CATALOG_TTL_SECONDS),
+            'oldest_entry_age_seconds': int(max(ages)) if ages else None,
+            'ttl_seconds': PRINTIFY_CATALOG_TTL_SECONDS
+        }
+
+
+def _refresh_loop(app):
+    from app.services import printify_service
+    while True:
+        try:
+            with app.app_context():
+                printify_service.warm_catalog()
+        except Exception as e:
+            print(f"  ⚠️ Printify catalog warm-up failed: {e}")
+        time.sleep(PRINTIFY_CATALOG_REFRESH_SECONDS)
+
+def start(app):
+    """Load the catalog file and keep it warm in the background (idempotent)"""
+    global _thread
+    if _thread:
+        return
+
+    count = load()
+    print(f"✓ Loaded {count} Printify catalog entries from {CATALOG_FILE}")
+
+    if not app.config.get('PRINTIFY_API_TOKEN'):
+        return
+    _thread = threading.Thread(target=_refresh_loop, args=(app,), name='catalog-refresh', daemon=True)
+    _thread.start()
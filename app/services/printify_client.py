@@ -0,0 +1,218 @@
+"""
+Printify API client
+Every Printify call goes through request(), which keeps this process
+within Printify's published rate limits (token buckets), applies a
+timeout per kind of endpoint, and retries throttled or failed calls after
+Retry-After. Time spent waiting on limits is tracked in get_stats().
+"""
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+PRINTIFY_API_BASE = os.getenv('PRINTIFY_API_BASE', "https://api.printify.com/v1")
+
+# Connection pool shared by all Printify calls (concurrent uploads included)
+PRINTIFY_POOL_SIZE = int(os.getenv('PRINTIFY_POOL_SIZE', 10))
+# Attempts per call on 429s, 5xx and connection errors
+PRINTIFY_MAX_ATTEMPTS = int(os.getenv('PRINTIFY_MAX_ATTEMPTS', 5))
+# Backoff when Printify doesn't send Retry-After: base * 2^(attempt - 1), capped
+PRINTIFY_RETRY_BASE_SECONDS = 1.0
+PRINTIFY_RETRY_MAX_SECONDS = 60.0
+
+# (connect, read) timeouts per kind of endpoint. URL uploads wait while
+# Printify downloads the file; base64 uploads send several megabytes.
+PRINTIFY_TIMEOUTS = {
+    'catalog': (5, 15),
+    'upload': (5, 120),
+    'publish': (5, 30),
+    'default': (5, 30),
+}
+
+# Printify's published limits: 600 requests/minute overall, 100/minute for
+# the catalog, 200 product publishes per 30 minutes
+RATE_LIMITS = {
+    'global': (600, 60),
+    'catalog': (100, 60),
+    'publish': (200, 30 * 60),
+}
+
+
+class TokenBucket:
+    """Allows `limit` calls per `period` seconds, with bursts up to `limit`"""
+
+    def __init__(self, limit, period):
+        self.capacity = limit
+        self.rate = limit / period
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+_buckets = {name: TokenBucket(limit, period) for name, (limit, period) in RATE_LIMITS.items()}
+
+# After a 429, every call waits until Printify's Retry-After has passed
+_paused_until = 0.0
+_stats = {
+    'requests': 0,
+    'retries': 0,
+    'throttled_responses': 0,
+    'timeouts': 0,
+    'budget_wait_seconds': 0.0,
+    'throttle_wait_seconds': 0.0,
+}
+_stats_lock = threading.Lock()
+
+_http = None
+_http_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Get the shared requests.Session for Printify
+
+    Reusing connections skips a TCP + TLS handshake per call; the pool is
+    sized so every concurrent upload gets its own connection.
+    """
+    global _http
+    with _http_lock:
+        if _http is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PRINTIFY_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http = session
+        return _http
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+def _retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta or HTTP date), or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff_seconds(attempt):
+    delay = min(PRINTIFY_RETRY_BASE_SECONDS * 2 ** (attempt - 1), PRINTIFY_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+def _wait_for_budget(kind):
+    waited = 0.0
+    pause = _paused_until - time.time()
+    if pause > 0:
+        time.sleep(pause)
+        _count('throttle_wait_seconds', pause)
+
+    waited += _buckets['global'].acquire()
+    if kind in _buckets:
+        waited += _buckets[kind].acquire()
+    if waited:
+        _count('budget_wait_seconds', waited)
+
+def request(method, path, headers, kind='default', **kwargs):
+    """
+    Call the Printify API within the rate limits, retrying when throttled
+
+    429s are always retried. 5xx responses and connection errors are only
+    retried for GETs and uploads, where repeating the call is harmless.
+
+    Args:
+        method: HTTP method
+        path: Path under PRINTIFY_API_BASE, e.g. "/shops.json"
+        headers: Request headers (with the API token)
+        kind: 'catalog', 'upload', 'publish' or 'default' - selects the
+              timeout and the rate limit bucket
+        **kwargs: Passed to requests (json=..., params=...)
+
+    Returns:
+        requests.Response: A successful response
+
+    Raises:
+        requests.HTTPError: Non-retryable error status, or attempts exhausted
+        requests.RequestException: Connection error or timeout, attempts exhausted
+    """
+    global _paused_until
+    retry_errors = method == 'GET' or kind == 'upload'
+    url = f"{PRINTIFY_API_BASE}{path}"
+
+    for attempt in range(1, PRINTIFY_MAX_ATTEMPTS + 1):
+        _wait_for_budget(kind)
+        _count('requests')
+        last_attempt = attempt == PRINTIFY_MAX_ATTEMPTS
+
+        try:
+            response = get_http_session().request(
+                method, url, headers=headers, timeout=PRINTIFY_TIMEOUTS[kind], **kwargs
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if isinstance(e, requests.Timeout):
+                _count('timeouts')
+            if not retry_errors or last_attempt:
+                raise
+            delay = _backoff_seconds(attempt)
+            print(f"  ⚠️ Printify {method} {path} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            _count('retries')
+            time.sleep(delay)
+            continue
+
+        if response.status_code == 429:
+            _count('throttled_responses')
+            delay = _retry_after_seconds(response)
+            if delay is None:
+                delay = _backoff_seconds(attempt)
+            if not last_attempt:
+                _paused_until = max(_paused_until, time.time() + delay)
+                print(f"  ⏳ Printify rate limit hit on {method} {path}, waiting {delay:.1f}s")
+                _count('retries')
+                continue
+        elif response.status_code >= 500 and retry_errors and not last_attempt:
+            delay = _retry_after_seconds(response) or _backoff_seconds(attempt)
+            print(f"  ⚠️ Printify {method} {path} returned {response.status_code}, retrying in {delay:.1f}s")
+            _count('retries')
+            time.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response
+
+def get_stats():
+    """Request, retry and rate-limit wait counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['budget_wait_seconds'] = round(stats['budget_wait_seconds'], 1)
+    stats['throttle_wait_seconds'] = round(stats['throttle_wait_seconds'], 1)
+    stats['paused_for_seconds'] = round(max(0.0, _paused_until - time.time()), 1)
+    return stats
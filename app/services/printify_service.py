@@ -2,15 +2,22 @@
 Printify API integration for calendar fulfillment
 Handles image uploads, product creation, and order submission
 """
+import os
 import requests
 import base64
+import hashlib
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask import current_app
+from app.services import printify_catalog, printify_client, printify_upload_cache
 
-PRINTIFY_API_BASE = "https://api.printify.com/v1"
+# Month images uploaded to Printify at once
+PRINTIFY_UPLOAD_CONCURRENCY = int(os.getenv('PRINTIFY_UPLOAD_CONCURRENCY', 4))
 
 # Calendar product configurations
 # All calendars use 3454x2725px images and 13 placeholders (front_cover + 12 months)
+PRINT_IMAGE_SIZE = (3454, 2725)
+
 CALENDAR_PRODUCTS = {
     'calendar_2026': {
         'blueprint_id': 1253,
@@ -38,9 +45,6 @@ CALENDAR_PRODUCTS = {
     }
 }
 
-# Cache for auto-detected configurations
-_config_cache = {}
-
 def get_headers():
     """Get authorization headers for Printify API"""
     token = current_app.config.get('PRINTIFY_API_TOKEN')
@@ -52,9 +56,45 @@ def get_headers():
         "Content-Type": "application/json"
     }
 
+def _api(method, path, kind='default', headers=None, **kwargs):
+    """Call the Printify API through the rate-limited client"""
+    return printify_client.request(method, path, headers or get_headers(), kind=kind, **kwargs)
+
+def _fetch_blueprint_config(blueprint_id):
+    """Look up the first print provider and variant of a blueprint in the Printify catalog"""
+    # Get print providers for this blueprint
+    providers = _api('GET', f"/catalog/blueprints/{blueprint_id}/print_providers.json", kind='catalog').json()
+
+    if not providers:
+        raise Exception(f"No print providers found for blueprint {blueprint_id}")
+
+    # Use first available provider
+    provider_id = providers[0]['id']
+
+    # Get variants for this provider
+    variants_data = _api(
+        'GET',
+        f"/catalog/blueprints/{blueprint_id}/print_providers/{provider_id}/variants.json",
+        kind='catalog'
+    ).json()
+
+    variants = variants_data.get('variants', [])
+    if not variants:
+        raise Exception(f"No variants found for blueprint {blueprint_id}, provider {provider_id}")
+
+    # Use first variant
+    variant_id = variants[0]['id']
+
+    print(f"  ℹ Auto-detected config for blueprint {blueprint_id}: provider={provider_id}, variant={variant_id}")
+    return {
+        'print_provider_id': provider_id,
+        'variant_id': variant_id
+    }
+
 def auto_detect_config(blueprint_id):
     """
     Auto-detect print provider and variant for a blueprint
+    Served from the persistent catalog cache (printify_catalog)
 
     Args:
         blueprint_id: Printify blueprint ID
@@ -62,90 +102,148 @@ def auto_detect_config(blueprint_id):
     Returns:
         dict: {'print_provider_id': X, 'variant_id': Y}
     """
-    cache_key = f"blueprint_{blueprint_id}"
-
-    # Check cache first
-    if cache_key in _config_cache:
-        return _config_cache[cache_key]
-
     try:
-        # Get print providers for this blueprint
-        response = requests.get(
-            f"{PRINTIFY_API_BASE}/catalog/blueprints/{blueprint_id}/print_providers.json",
-            headers=get_headers(),
-            timeout=10
+        return printify_catalog.get(
+            f"blueprint_{blueprint_id}",
+            lambda: _fetch_blueprint_config(blueprint_id)
         )
-        response.raise_for_status()
-        providers = response.json()
-
-        if not providers:
-            raise Exception(f"No print providers found for blueprint {blueprint_id}")
-
-        # Use first available provider
-        provider_id = providers[0]['id']
-
-        # Get variants for this provider
-        response = requests.get(
-            f"{PRINTIFY_API_BASE}/catalog/blueprints/{blueprint_id}/print_providers/{provider_id}/variants.json",
-            headers=get_headers(),
-            timeout=10
-        )
-        response.raise_for_status()
-        variants_data = response.json()
-
-        variants = variants_data.get('variants', [])
-        if not variants:
-            raise Exception(f"No variants found for blueprint {blueprint_id}, provider {provider_id}")
-
-        # Use first variant
-        variant_id = variants[0]['id']
-
-        config = {
-            'print_provider_id': provider_id,
-            'variant_id': variant_id
-        }
-
-        # Cache it
-        _config_cache[cache_key] = config
-
-        print(f"  ℹ Auto-detected config for blueprint {blueprint_id}: provider={provider_id}, variant={variant_id}")
-        return config
-
     except Exception as e:
         print(f"  ⚠️ Auto-detection failed for blueprint {blueprint_id}: {e}")
         raise Exception(f"Could not auto-detect configuration for blueprint {blueprint_id}. Please configure manually.")
 
-def upload_image(image_data_bytes, filename="month.jpg"):
+def warm_catalog():
+    """
+    Fetch the shop ID and the auto-detected blueprint configs that are
+    missing from the catalog cache or stale (runs in the background)
+    """
+    if not current_app.config.get('PRINTIFY_SHOP_ID') and not printify_catalog.is_fresh("shop_id"):
+        printify_catalog.refresh("shop_id", _fetch_shop_id)
+
+    for config in CALENDAR_PRODUCTS.values():
+        if config['print_provider_id'] != 'auto' and config['variant_id'] != 'auto':
+            continue
+        key = f"blueprint_{config['blueprint_id']}"
+        if not printify_catalog.is_fresh(key):
+            printify_catalog.refresh(key, lambda: _fetch_blueprint_config(config['blueprint_id']))
+
+def _cached_upload(content_hash, headers):
+    """A still-valid earlier upload of the same content, or None"""
+    entry = printify_upload_cache.lookup(content_hash)
+    if not entry:
+        return None
+
+    validated = False
+    if printify_upload_cache.needs_validation(entry):
+        try:
+            _api('GET', f"/uploads/{entry['id']}.json", headers=headers)
+            validated = True
+        except requests.RequestException as e:
+            if getattr(e.response, 'status_code', None) == 404:
+                print(f"  ℹ Cached upload {entry['id']} is gone from Printify, uploading again")
+                printify_upload_cache.forget(content_hash)
+            else:
+                # Can't tell - uploading again is always safe
+                print(f"  ⚠️ Could not check cached upload {entry['id']}: {e}")
+            return None
+
+    printify_upload_cache.record_hit(content_hash, validated=validated)
+    return {'id': entry['id'], 'file_name': entry['file_name']}
+
+def upload_image(image_data_bytes=None, filename="month.jpg", headers=None, url=None, content_hash=None):
     """
     Upload image to Printify Media Library
+    An earlier upload of the same content (by SHA-256) is reused instead
 
     Args:
-        image_data_bytes: Raw image bytes (JPEG/PNG)
+        image_data_bytes: Raw image bytes (JPEG/PNG), sent base64-encoded
         filename: Filename for the upload
+        headers: Request headers (default: get_headers(), which needs an app context)
+        url: Public URL Printify downloads the image from instead (no bytes sent)
+        content_hash: SHA-256 hex of the image (computed from the bytes if
+                      not given; URL uploads are only cached when given)
 
     Returns:
         dict: Upload data with 'id' and 'file_name'
     """
-    # Convert image bytes to base64
-    image_b64 = base64.b64encode(image_data_bytes).decode('utf-8')
+    headers = headers or get_headers()
+    if content_hash is None and image_data_bytes is not None:
+        content_hash = hashlib.sha256(image_data_bytes).hexdigest()
+
+    if content_hash:
+        cached = _cached_upload(content_hash, headers)
+        if cached:
+            print(f"  ✓ Reused earlier upload for {filename}: {cached['id']}")
+            return cached
+
+    if url:
+        payload = {
+            "file_name": filename,
+            "url": url
+        }
+    else:
+        # Convert image bytes to base64
+        image_b64 = base64.b64encode(image_data_bytes).decode('utf-8')
 
-    payload = {
-        "file_name": filename,
-        "contents": image_b64
-    }
+        payload = {
+            "file_name": filename,
+            "contents": image_b64
+        }
 
-    response = requests.post(
-        f"{PRINTIFY_API_BASE}/uploads/images.json",
-        headers=get_headers(),
-        json=payload
-    )
+    upload_data = _api('POST', "/uploads/images.json", kind='upload', headers=headers, json=payload).json()
 
-    response.raise_for_status()
-    upload_data = response.json()
+    if content_hash:
+        printify_upload_cache.store(content_hash, upload_data)
 
-    print(f"  ✓ Uploaded {filename}: {upload_data['id']}")
+    print(f"  ✓ Uploaded {filename}{' (by URL)' if url else ''}: {upload_data['id']}")
     return upload_data
 
+def upload_images(images, on_upload=None):
+    """
+    Upload several images to Printify concurrently
+
+    At most PRINTIFY_UPLOAD_CONCURRENCY uploads run at once over the shared
+    session. If some uploads fail, the rest still finish (and are reported
+    to on_upload) before the first error is raised.
+
+    Args:
+        images: Dict mapping a key (e.g. month name) to (source, filename) or
+                (source, filename, content_hash), where source is image
+                bytes or a public URL (str)
+        on_upload: Optional callback(key, upload_data), called on this
+                   thread as each upload finishes
+
+    Returns:
+        dict: Key -> upload data with 'id' and 'file_name'
+    """
+    headers = get_headers()
+    results = {}
+    first_error = None
+
+    def upload(source, filename, content_hash=None):
+        if isinstance(source, str):
+            return upload_image(filename=filename, headers=headers, url=source, content_hash=content_hash)
+        return upload_image(source, filename, headers=headers, content_hash=content_hash)
+
+    with ThreadPoolExecutor(max_workers=PRINTIFY_UPLOAD_CONCURRENCY, thread_name_prefix='printify-upload') as executor:
+        futures = {
+            executor.submit(upload, *image): key
+            for key, image in images.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"  ✗ Upload failed for {key}: {e}")
+                first_error = first_error or e
+                continue
+            if on_upload:
+                on_upload(key, results[key])
+
+    if first_error:
+        raise first_error
+    return results
+
 def create_calendar_product(product_type, month_image_ids, title="Custom Hunk Calendar 2026"):
     """
     Create a calendar product with user's images
@@ -232,14 +330,7 @@ def create_calendar_product(product_type, month_image_ids, title="Custom Hunk Ca
     # Get shop ID
     shop_id = get_shop_id()
 
-    response = requests.post(
-        f"{PRINTIFY_API_BASE}/shops/{shop_id}/products.json",
-        headers=get_headers(),
-        json=payload
-    )
-
-    response.raise_for_status()
-    product_data = response.json()
+    product_data = _api('POST', f"/shops/{shop_id}/products.json", json=payload).json()
 
     print(f"  ✓ Created product: {product_data['id']}")
     return product_data['id']
@@ -264,17 +355,11 @@ def publish_product(product_id):
         "tags": True
     }
 
-    response = requests.post(
-        f"{PRINTIFY_API_BASE}/shops/{shop_id}/products/{product_id}/publish.json",
-        headers=get_headers(),
-        json=payload
-    )
-
-    response.raise_for_status()
+    _api('POST', f"/shops/{shop_id}/products/{product_id}/publish.json", kind='publish', json=payload)
     print(f"  ✓ Published product: {product_id}")
     return True
 
-def create_order(product_id, variant_id, quantity, shipping_address, customer_email):
+def create_order(product_id, variant_id, quantity, shipping_address, customer_email, external_id=None):
     """
     Create Printify order for fulfillment
 
@@ -284,6 +369,8 @@ def create_order(product_id, variant_id, quantity, shipping_address, customer_em
         quantity: Number of calendars (usually 1)
         shipping_address: Dict with address fields
         customer_email: Customer email
+        external_id: Our order reference - pass one derived from the Stripe
+                     checkout session so retries reuse it (default: time-based)
 
     Returns:
         str: Printify order ID
@@ -291,7 +378,7 @@ def create_order(product_id, variant_id, quantity, shipping_address, customer_em
     shop_id = get_shop_id()
 
     payload = {
-        "external_id": f"hotm_{int(time.time())}",  # Unique order reference
+        "external_id": external_id or f"hotm_{int(time.time())}",  # Unique order reference
         "label": customer_email,
         "line_items": [
             {
@@ -316,14 +403,7 @@ def create_order(product_id, variant_id, quantity, shipping_address, customer_em
         }
     }
 
-    response = requests.post(
-        f"{PRINTIFY_API_BASE}/shops/{shop_id}/orders.json",
-        headers=get_headers(),
-        json=payload
-    )
-
-    response.raise_for_status()
-    order_data = response.json()
+    order_data = _api('POST', f"/shops/{shop_id}/orders.json", json=payload).json()
 
     print(f"  ✓ Created order: {order_data['id']}")
     return order_data['id']
@@ -340,38 +420,30 @@ def submit_order(order_id):
     """
     shop_id = get_shop_id()
 
-    response = requests.post(
-        f"{PRINTIFY_API_BASE}/shops/{shop_id}/orders/{order_id}/send_to_production.json",
-        headers=get_headers()
-    )
-
-    response.raise_for_status()
+    _api('POST', f"/shops/{shop_id}/orders/{order_id}/send_to_production.json")
     print(f"  ✓ Submitted order to production: {order_id}")
     return True
 
-def get_shop_id():
-    """
-    Get first shop ID from Printify account
-    Caches the result in app config
-    """
-    if current_app.config.get('PRINTIFY_SHOP_ID'):
-        return current_app.config['PRINTIFY_SHOP_ID']
-
-    response = requests.get(
-        f"{PRINTIFY_API_BASE}/shops.json",
-        headers=get_headers()
-    )
-    response.raise_for_status()
-    shops = response.json()
+def _fetch_shop_id():
+    shops = _api('GET', "/shops.json").json()
 
     if not shops:
         raise Exception("No Printify shops found. Please create a shop at printify.com first.")
 
     shop_id = shops[0]['id']
-    current_app.config['PRINTIFY_SHOP_ID'] = shop_id
     print(f"  ℹ Using Printify shop: {shop_id}")
     return shop_id
 
+def get_shop_id():
+    """
+    Get first shop ID from Printify account
+    PRINTIFY_SHOP_ID takes precedence; otherwise the persistent catalog cache
+    """
+    if current_app.config.get('PRINTIFY_SHOP_ID'):
+        return current_app.config['PRINTIFY_SHOP_ID']
+
+    return printify_catalog.get("shop_id", _fetch_shop_id)
+
 def process_full_order(product_type, month_image_data, shipping_address, customer_email):
     """
     Complete workflow: Upload images, create product, create order, submit to production
@@ -399,7 +471,6 @@ def process_full_order(product_type, month_image_data, shipping_address, custome
     try:
         # Step 1: Upload all 12 month images
         print("📤 STEP 1: Uploading images...")
-        month_image_ids = {}
         month_names = ["january", "february", "march", "april", "may", "june",
                       "july", "august", "september", "october", "november", "december"]
 
@@ -407,14 +478,11 @@ def process_full_order(product_type, month_image_data, shipping_address, custome
             if month_num not in month_image_data:
                 raise ValueError(f"Missing image data for month {month_num}")
 
-            month_name = month_names[month_num - 1]
-            filename = f"{month_name}.jpg"
-
-            upload_data = upload_image(month_image_data[month_num], filename)
-            month_image_ids[month_name] = upload_data['id']
-
-            # Small delay to avoid rate limiting
-            time.sleep(0.1)
+        uploads = upload_images({
+            month_names[month_num - 1]: (month_image_data[month_num], f"{month_names[month_num - 1]}.jpg")
+            for month_num in range(1, 13)
+        })
+        month_image_ids = {month_name: upload_data['id'] for month_name, upload_data in uploads.items()}
 
         print(f"✅ Uploaded {len(month_image_ids)} images\n")
 
@@ -0,0 +1,104 @@
+"""
+Printify upload cache
+Maps the SHA-256 of an uploaded image to its Printify upload ID, persisted
+in DATA_DIR/printify_uploads.json, so a retried fulfillment or a second
+calendar from the same months reuses the uploads instead of sending the
+images again. Entries expire, and are re-checked with Printify before
+reuse once their last check is old.
+"""
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from app.session_storage import DATA_DIR
+
+# Cached uploads older than this are uploaded again
+PRINTIFY_UPLOAD_CACHE_TTL_SECONDS = int(os.getenv('PRINTIFY_UPLOAD_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+# Reuse without asking Printify whether the upload still exists for this long
+PRINTIFY_UPLOAD_VALIDATE_SECONDS = int(os.getenv('PRINTIFY_UPLOAD_VALIDATE_SECONDS', 3600))
+
+CACHE_FILE = DATA_DIR / 'printify_uploads.json'
+LOCK_FILE = DATA_DIR / 'printify_uploads.lock'
+
+_stats = {'hits': 0, 'misses': 0, 'invalidated': 0}
+_stats_lock = threading.Lock()
+
+
+def _read_cache():
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+@contextmanager
+def _locked_cache():
+    """Read-modify-write the cache under an exclusive lock (safe across processes)"""
+    with open(LOCK_FILE, 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            cache = _read_cache()
+            yield cache
+
+            # Drop expired entries on every write
+            cutoff = time.time() - PRINTIFY_UPLOAD_CACHE_TTL_SECONDS
+            cache = {h: entry for h, entry in cache.items() if entry['uploaded_at'] >= cutoff}
+            tmp_file = CACHE_FILE.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_file, CACHE_FILE)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+def lookup(content_hash):
+    """
+    Find an unexpired upload of this content
+
+    Returns:
+        dict or None: {'id', 'file_name', 'uploaded_at', 'validated_at'}
+    """
+    entry = _read_cache().get(content_hash)
+    if entry and time.time() - entry['uploaded_at'] <= PRINTIFY_UPLOAD_CACHE_TTL_SECONDS:
+        return entry
+    _count('misses')
+    return None
+
+def needs_validation(entry):
+    return time.time() - entry['validated_at'] > PRINTIFY_UPLOAD_VALIDATE_SECONDS
+
+def record_hit(content_hash, validated=False):
+    """Count a reuse, refreshing the entry's check time if Printify just confirmed it"""
+    _count('hits')
+    if not validated:
+        return
+    with _locked_cache() as cache:
+        if content_hash in cache:
+            cache[content_hash]['validated_at'] = time.time()
+
+def store(content_hash, upload_data):
+    """Remember a fresh upload"""
+    now = time.time()
+    with _locked_cache() as cache:
+        cache[content_hash] = {
+            'id': upload_data['id'],
+            'file_name': upload_data.get('file_name'),
+            'uploaded_at': now,
+            'validated_at': now
+        }
+
+def forget(content_hash):
+    """Drop an entry Printify no longer has"""
+    _count('invalidated')
+    with _locked_cache() as cache:
+        cache.pop(content_hash, None)
+
+def get_stats():
+    """Upload cache hit/miss counters for this process"""
+    with _stats_lock:
+        return {**_stats, 'entries': len(_read_cache())}
@@ -0,0 +1,92 @@
+"""
+Face-aware reference photo selection
+Ranks a session's uploads by face size and sharpness, keeps the best three
+and crops them to the face, so Gemini gets small, useful references instead
+of the first three uploads at full size. Runs once per set of uploads; the
+result is cached in the session.
+"""
+import os
+import threading
+from app import session_storage
+from app.services import image_pool, image_processing
+
+# generate_calendar_image sends at most this many references
+REFERENCE_IMAGE_COUNT = 3
+# Max width/height of each cropped reference sent to Gemini
+REFERENCE_MAX_DIMENSION = int(os.getenv('REFERENCE_MAX_DIMENSION', 1024))
+
+# Months of one session start on several workers at once - rank only once
+# per session, while other sessions rank in parallel. A fixed set of locks
+# picked by session ID hash, so nothing accumulates per session.
+_SELECTION_LOCK_STRIPES = 64
+_selection_locks = [threading.Lock() for _ in range(_SELECTION_LOCK_STRIPES)]
+
+
+def rank_images(images):
+    """
+    Order uploaded images best-first as face references
+
+    Photos with a detected face come first, by score; the rest keep their
+    upload order. Without OpenCV, upload order is kept for all of them.
+
+    Returns:
+        list: (image dict, face box or None) tuples
+    """
+    if not image_processing.face_detection_available():
+        return [(img, None) for img in images]
+
+    futures = [image_pool.submit(image_processing.analyze_reference, img['file_data']) for img in images]
+
+    ranked = []
+    for position, (img, future) in enumerate(zip(images, futures)):
+        try:
+            analysis = future.result()
+        except Exception as e:
+            print(f"⚠️ Could not analyze image {img['id']}: {e}")
+            analysis = {'score': 0.0, 'faces': 0, 'face_box': None}
+        ranked.append((analysis['face_box'] is not None, analysis['score'], -position, img, analysis))
+
+    ranked.sort(key=lambda entry: entry[:3], reverse=True)
+    for has_face, score, _, img, analysis in ranked:
+        print(f"🧑 Image {img['id']}: {analysis['faces']} face(s), score {score:.2f}")
+    return [(img, analysis['face_box']) for _, _, _, img, analysis in ranked]
+
+def _session_lock(session_id):
+    return _selection_locks[hash(session_id) % _SELECTION_LOCK_STRIPES]
+
+def select_references(session_id, images):
+    """
+    Get the reference photos to send to Gemini for a session
+
+    Args:
+        session_id: Storage ID of the session
+        images: The session's uploaded image dicts
+
+    Returns:
+        list: Up to REFERENCE_IMAGE_COUNT cropped JPEGs (bytes), best first
+    """
+    image_hashes = session_storage.image_fingerprints(images)
+    references = session_storage.get_reference_selection(session_id, image_hashes)
+    if references is not None:
+        return references
+
+    with _session_lock(session_id):
+        # Another worker may have finished ranking while we waited
+        references = session_storage.get_reference_selection(session_id, image_hashes)
+        if references is not None:
+            return references
+
+        selected = rank_images(images)[:REFERENCE_IMAGE_COUNT]
+        references = [
+            image_pool.run(image_processing.crop_reference, img['file_data'], face_box, REFERENCE_MAX_DIMENSION)
+            for img, face_box in selected
+        ]
+
+        original_bytes = sum(len(img['file_data']) for img, _ in selected)
+        print(f"🧑 Selected reference images {[img['id'] for img, _ in selected]} "
+              f"({original_bytes // 1024}KB -> {sum(len(r) for r in references) // 1024}KB)")
+
+        session_storage.save_reference_selection(
+            session_id, image_hashes, [img['id'] for img, _ in selected], references
+        )
+        return references
@@ -0,0 +1,141 @@
+"""
+Speculative pre-generation of early months
+Starts generating the first few months on idle workers as soon as the user
+has uploaded enough photos, while they are still reviewing the themes
+"""
+import os
+import time
+from app import session_storage
+from app.services import reference_selection
+from app.services.generation_scheduler import get_scheduler, PRIORITY_SPECULATIVE
+from app.services.month_generation import render_month_jpeg, release_slot_if_finished, queue_print_rendition, submit_month
+
+# Number of months to pre-generate (0 disables speculative mode)
+SPECULATIVE_GENERATION_MONTHS = int(os.getenv('SPECULATIVE_GENERATION_MONTHS', 0))
+# Sessions with no requests for this long are treated as abandoned
+SPECULATIVE_ABANDON_SECONDS = int(os.getenv('SPECULATIVE_ABANDON_SECONDS', 900))
+
+# Same threshold the upload page uses before themes can be reviewed
+MIN_REFERENCE_IMAGES = 3
+
+
+def is_enabled():
+    """Check if speculative pre-generation is turned on"""
+    return SPECULATIVE_GENERATION_MONTHS > 0
+
+def start(session_id):
+    """
+    Queue speculative generation of the first N months for a session
+
+    Safe to call repeatedly - months already pre-generated, completed or
+    queued are skipped.
+
+    Returns:
+        int: Number of months queued
+    """
+    if not is_enabled():
+        return 0
+
+    images = session_storage.get_uploaded_images_by_session_id(session_id)
+    if len(images) < MIN_REFERENCE_IMAGES:
+        return 0
+
+    reference_hashes = session_storage.image_fingerprints(images)
+    pre_generated = session_storage.get_speculative_months(session_id)
+    completed = {
+        m['month_number'] for m in session_storage.get_months_by_session_id(session_id)
+        if m['generation_status'] == 'completed'
+    }
+
+    queued = 0
+    for month_num in range(1, min(SPECULATIVE_GENERATION_MONTHS, 12) + 1):
+        if month_num in pre_generated or month_num in completed:
+            continue
+        future = get_scheduler().submit(
+            session_id,
+            month_num,
+            speculative_month_job,
+            session_id,
+            month_num,
+            reference_hashes,
+            priority=PRIORITY_SPECULATIVE
+        )
+        future.add_done_callback(
+            lambda f, month_num=month_num: _generate_if_unfinished(f, session_id, month_num)
+        )
+        queued += 1
+
+    if queued:
+        print(f"🔮 Queued {queued} speculative months for session {session_id[:8]}...")
+    return queued
+
+def cancel(session_id):
+    """Drop a session's queued speculative months (e.g. reference photos changed)"""
+    cancelled = get_scheduler().cancel_session(session_id, PRIORITY_SPECULATIVE)
+    if cancelled:
+        print(f"🔮 Cancelled {cancelled} speculative months for session {session_id[:8]}...")
+    return cancelled
+
+def is_abandoned(session_id):
+    """A session nobody has touched for SPECULATIVE_ABANDON_SECONDS"""
+    last_access = session_storage.get_last_access(session_id)
+    return last_access is None or time.time() - last_access > SPECULATIVE_ABANDON_SECONDS
+
+def _generate_if_unfinished(future, session_id, month_num):
+    """
+    Queue a real generation of a month the user is waiting on when its
+    speculative job produced nothing
+
+    A generate request that timed out (202) left the month 'processing' and
+    relies on this job; runs once the scheduler has forgotten the job, so
+    submit_month starts a new one.
+    """
+    if future.cancelled() or (future.exception() is None and future.result() is not None):
+        return
+
+    month = next(
+        (m for m in session_storage.get_months_by_session_id(session_id) if m['month_number'] == month_num),
+        None
+    )
+    if not month or month['generation_status'] != 'processing':
+        return
+
+    images = session_storage.get_uploaded_images_by_session_id(session_id)
+    if not images:
+        session_storage.update_month_status_by_session_id(session_id, month_num, 'failed', error='No reference images found')
+        release_slot_if_finished(session_id)
+        return
+
+    print(f"🔮 Month {month_num}: Speculative result discarded, generating it for real")
+    submit_month(session_id, month_num, images)
+
+def speculative_month_job(session_id, month_num, reference_hashes):
+    """
+    Pre-generate one month on an idle worker
+
+    Returns:
+        int: Size of the stored JPEG in bytes, or None if the job was
+             skipped (session abandoned) or its result went stale
+    """
+    if is_abandoned(session_id):
+        print(f"🔮 Month {month_num}: Session {session_id[:8]}... abandoned, skipping speculative generation")
+        return None
+
+    images = session_storage.get_uploaded_images_by_session_id(session_id)
+    if session_storage.image_fingerprints(images) != reference_hashes:
+        return None
+
+    started_at = time.time()
+    jpeg_data = render_month_jpeg(month_num, reference_selection.select_references(session_id, images))
+    generation_seconds = time.time() - started_at
+
+    if not session_storage.save_speculative_month(
+        session_id, month_num, jpeg_data, started_at, generation_seconds, reference_hashes
+    ):
+        print(f"🔮 Month {month_num}: Reference photos changed, discarding speculative result")
+        return None
+
+    print(f"🔮 Month {month_num}: Pre-generated in {generation_seconds:.1f}s")
+    queue_print_rendition(session_id, month_num, jpeg_data)
+    release_slot_if_finished(session_id)
+    return len(jpeg_data)
@@ -2,9 +2,18 @@
 Stripe payment processing integration
 Handles checkout sessions, webhooks, and payment verification
 """
+import os
+import time
+import threading
 import stripe
 from flask import current_app
 
+# Retrieved checkout sessions are reused for this long (0 disables)
+CHECKOUT_SESSION_CACHE_SECONDS = int(os.getenv('CHECKOUT_SESSION_CACHE_SECONDS', 300))
+
+_session_cache = {}  # (session_id, expand) -> (retrieved_at, Session)
+_session_cache_lock = threading.Lock()
+
 # Product pricing in cents
 CALENDAR_PRICES = {
     'calendar_2026': 2499,  # $24.99
@@ -86,6 +95,7 @@ def create_checkout_session(product_type, success_url, cancel_url, metadata=None
 def retrieve_checkout_session(session_id, expand=None):
     """
     Retrieve checkout session details from Stripe
+    Repeated lookups within CHECKOUT_SESSION_CACHE_SECONDS are served from memory
 
     Args:
         session_id: Stripe checkout session ID
@@ -94,11 +104,27 @@ def retrieve_checkout_session(session_id, expand=None):
     Returns:
         Stripe Session object
     """
-    return stripe.checkout.Session.retrieve(
+    key = (session_id, tuple(expand or []))
+    now = time.time()
+    with _session_cache_lock:
+        cached = _session_cache.get(key)
+        if cached and now - cached[0] <= CHECKOUT_SESSION_CACHE_SECONDS:
+            return cached[1]
+
+    checkout_session = stripe.checkout.Session.retrieve(
         session_id,
         expand=expand or []
     )
 
+    if CHECKOUT_SESSION_CACHE_SECONDS:
+        with _session_cache_lock:
+            # Drop expired entries so the cache stays small
+            for old_key, (retrieved_at, _) in list(_session_cache.items()):
+                if now - retrieved_at > CHECKOUT_SESSION_CACHE_SECONDS:
+                    del _session_cache[old_key]
+            _session_cache[key] = (now, checkout_session)
+    return checkout_session
+
 def verify_webhook_signature(payload, signature):
     """
     Verify Stripe webhook signature for security
@@ -165,3 +191,45 @@ def extract_shipping_address(checkout_session):
         'country': shipping['country'] if isinstance(shipping, dict) else shipping.country,
         'phone': checkout_session.customer_details.phone or ''
     }
+
+def extract_checkout_details(checkout_session):
+    """
+    Everything fulfillment needs from a completed checkout session
+
+    Args:
+        checkout_session: Stripe Session object - retrieved, or the
+                          data.object of a checkout.session.completed event
+
+    Returns:
+        dict: payment_intent_id, customer_email, product_type,
+              internal_session_id and shipping_address
+    """
+    return {
+        'payment_intent_id': checkout_session.payment_intent,
+        'customer_email': checkout_session.customer_details.email,
+        'product_type': checkout_session.metadata.get('product_type'),
+        'internal_session_id': checkout_session.metadata.get('internal_session_id'),
+        'shipping_address': extract_shipping_address(checkout_session)
+    }
+
+def checkout_details_from_event(checkout_session):
+    """
+    Checkout details straight from a webhook event's session object
+
+    Returns:
+        dict or None: The details, or None if the payload lacks a required
+                      field (then the session has to be retrieved from Stripe)
+    """
+    try:
+        details = extract_checkout_details(checkout_session)
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+    address = details['shipping_address']
+    required = [
+        details['payment_intent_id'], details['customer_email'],
+        details['product_type'], details['internal_session_id'],
+        address['first_name'], address['address1'], address['city'],
+        address['zip'], address['country']
+    ]
+    return details if all(required) else None
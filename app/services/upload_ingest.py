@@ -0,0 +1,150 @@
+"""
+Upload ingestion
+The single processing path every uploaded selfie goes through - multipart
+form uploads and completed chunked uploads alike - ending in
+session_storage.add_uploaded_image
+"""
+import os
+from PIL import Image, UnidentifiedImageError
+from werkzeug.utils import secure_filename
+from app import session_storage
+from app.services import image_pool, image_processing
+
+# Uploads whose perceptual hash is within this many bits (of 64) of an
+# already stored photo are treated as duplicates. 0 disables deduplication.
+DUPLICATE_HASH_DISTANCE = int(os.getenv('DUPLICATE_HASH_DISTANCE', 6))
+
+# Header checks, applied before any pixels are decoded
+UPLOAD_ALLOWED_FORMATS = set(os.getenv('UPLOAD_ALLOWED_FORMATS', 'JPEG,MPO,PNG,HEIF,WEBP').split(','))
+UPLOAD_MIN_DIMENSION = int(os.getenv('UPLOAD_MIN_DIMENSION', 256))
+UPLOAD_MAX_DIMENSION = int(os.getenv('UPLOAD_MAX_DIMENSION', 16384))
+# Total pixels all files in one upload request may add up to
+UPLOAD_REQUEST_PIXEL_BUDGET = int(os.getenv('UPLOAD_REQUEST_PIXEL_BUDGET', 150_000_000))
+
+
+class UploadRejected(ValueError):
+    """Upload failed header validation - the message is safe to show users"""
+    pass
+
+
+class RequestPixelBudget:
+    """Pixels left for the rest of one upload request"""
+
+    def __init__(self, limit=UPLOAD_REQUEST_PIXEL_BUDGET):
+        self.remaining = limit
+
+    def charge(self, pixels):
+        if pixels > self.remaining:
+            raise UploadRejected('Too many megapixels in one upload - please upload fewer or smaller photos')
+        self.remaining -= pixels
+
+
+def validate_upload(source, pixel_budget=None):
+    """
+    Check an upload from its header alone, before decoding anything
+
+    Args:
+        source: Path to the spooled/assembled upload, or its bytes
+        pixel_budget: RequestPixelBudget shared by the request's files
+
+    Returns:
+        dict: Header info from image_processing.read_header
+
+    Raises:
+        UploadRejected: Not an image, unsupported format, or dimensions
+                        outside the configured bounds
+    """
+    try:
+        header = image_processing.read_header(source)
+    except Image.DecompressionBombError:
+        raise UploadRejected('Image dimensions are too large')
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise UploadRejected('Not a readable image file')
+
+    if header['format'] not in UPLOAD_ALLOWED_FORMATS:
+        raise UploadRejected(f"Unsupported image format ({header['format']})")
+
+    width, height = header['width'], header['height']
+    if min(width, height) < UPLOAD_MIN_DIMENSION:
+        raise UploadRejected(f'Image is too small ({width}x{height}, min {UPLOAD_MIN_DIMENSION}px)')
+    if max(width, height) > UPLOAD_MAX_DIMENSION or width * height > image_processing.MAX_IMAGE_PIXELS:
+        raise UploadRejected(f'Image dimensions are too large ({width}x{height})')
+
+    if pixel_budget is not None:
+        pixel_budget.charge(width * height)
+    return header
+
+def submit_upload(source, pixel_budget=None):
+    """
+    Validate an uploaded photo's header and start processing it on the image pool
+
+    Waits for room in the decode memory budget first, so only a bounded
+    number of full-resolution decodes are in flight.
+
+    Args:
+        source: Path to the spooled/assembled upload, or its bytes
+        pixel_budget: RequestPixelBudget shared by the request's files
+
+    Returns:
+        Future: Resolves with (master_jpeg_bytes, thumbnail_jpeg_bytes, dhash)
+
+    Raises:
+        UploadRejected: The file failed header validation
+    """
+    validate_upload(source, pixel_budget)
+
+    decode_bytes = image_processing.estimate_decode_bytes(source)
+    return image_pool.submit_budgeted(
+        decode_bytes,
+        image_processing.process_upload,
+        source
+    )
+
+def find_duplicate(phash, images):
+    """
+    Find a stored image that is a near-duplicate of `phash`
+
+    Returns:
+        dict or None: The closest matching image within DUPLICATE_HASH_DISTANCE
+    """
+    if not DUPLICATE_HASH_DISTANCE or phash is None:
+        return None
+
+    best, best_distance = None, DUPLICATE_HASH_DISTANCE + 1
+    for image in images:
+        if image.get('phash') is None:
+            continue
+        distance = image_processing.hamming_distance(phash, image['phash'])
+        if distance < best_distance:
+            best, best_distance = image, distance
+    return best
+
+def store_upload(filename, future):
+    """
+    Wait for a processed upload and save it to the current session,
+    unless it is a near-duplicate of a photo already stored
+
+    Returns:
+        dict: {'image_id', 'duplicate', 'bytes_saved'} - for a duplicate,
+              image_id is the existing photo and bytes_saved what storing
+              the copy would have cost
+    """
+    img_data, thumb_data, phash = future.result()
+
+    duplicate = find_duplicate(phash, session_storage.get_uploaded_images())
+    if duplicate:
+        print(f"⏭️ Skipped {filename}: near-duplicate of image {duplicate['id']}")
+        return {
+            'image_id': duplicate['id'],
+            'duplicate': True,
+            'bytes_saved': len(img_data) + len(thumb_data)
+        }
+
+    # Save to session storage
+    image_id = session_storage.add_uploaded_image(
+        secure_filename(filename),
+        img_data,
+        thumb_data,
+        phash=phash
+    )
+    return {'image_id': image_id, 'duplicate': False, 'bytes_saved': 0}
@@ -0,0 +1,78 @@
+"""
+Processed Stripe webhook events
+Stripe redelivers an event until it gets a 2xx, and may deliver it more
+than once even then. Each handled event is recorded on disk by event ID
+and checkout session ID, so redeliveries are answered straight away
+without touching the fulfillment pipeline again.
+"""
+import os
+import json
+import time
+from app.session_storage import DATA_DIR
+
+# Stripe retries for up to 3 days - keep records comfortably longer
+WEBHOOK_EVENT_RETENTION_SECONDS = int(os.getenv('WEBHOOK_EVENT_RETENTION_SECONDS', 30 * 24 * 3600))
+
+EVENTS_DIR = DATA_DIR / 'webhook_events'
+EVENTS_DIR.mkdir(exist_ok=True, parents=True)
+
+
+def _path(prefix, key):
+    # Stripe IDs (evt_..., cs_...) are alphanumeric plus underscores
+    if not key or not all(c.isalnum() or c == '_' for c in key):
+        raise ValueError(f"Invalid Stripe ID: {key!r}")
+    return EVENTS_DIR / f'{prefix}-{key}.json'
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write(path, record):
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+def find_processed(event_id, checkout_session_id=None):
+    """
+    Look up an earlier handling of this event, or of another event for
+    the same checkout session
+
+    Returns:
+        dict or None: The stored record ({'event_id', 'event_type',
+                      'checkout_session_id', 'processed_at'})
+    """
+    record = _read(_path('event', event_id))
+    if record is None and checkout_session_id:
+        record = _read(_path('checkout', checkout_session_id))
+    return record
+
+def mark_processed(event_id, event_type, checkout_session_id=None):
+    """Record an event as handled - call only once its effects are durable"""
+    record = {
+        'event_id': event_id,
+        'event_type': event_type,
+        'checkout_session_id': checkout_session_id,
+        'processed_at': time.time()
+    }
+    _write(_path('event', event_id), record)
+    if checkout_session_id:
+        _write(_path('checkout', checkout_session_id), record)
+
+def cleanup_expired_events():
+    """Delete records older than WEBHOOK_EVENT_RETENTION_SECONDS"""
+    cutoff = time.time() - WEBHOOK_EVENT_RETENTION_SECONDS
+    removed = 0
+    for path in EVENTS_DIR.glob('*.json'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"✓ Removed {removed} expired webhook event records")
+    return removed
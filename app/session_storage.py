@@ -5,13 +5,19 @@ Stores data in files on disk to survive deployments and restarts
 from flask import session
 from datetime import datetime
 import secrets
+import hashlib
 import pickle
 import os
 import gc
+import threading
+import time
 from pathlib import Path
 
-# Storage directory (persistent volume on Fly.io, falls back to /tmp for local dev)
-STORAGE_DIR = Path('/data/session_storage') if Path('/data').exists() else Path('/tmp/session_storage')
+# Data directory (persistent volume on Fly.io, falls back to /tmp for local dev)
+DATA_DIR = Path('/data') if Path('/data').exists() else Path('/tmp')
+
+# Storage directory for session pickles
+STORAGE_DIR = DATA_DIR / 'session_storage'
 STORAGE_DIR.mkdir(exist_ok=True, parents=True)
 
 # SERVER-SIDE storage (persisted to disk!)
@@ -19,6 +25,13 @@ STORAGE_DIR.mkdir(exist_ok=True, parents=True)
 _storage = {}
 _loaded = False
 
+# Background generation workers change and save sessions concurrently with
+# request threads - hold this around every change to a session and its save
+_save_lock = threading.RLock()
+
+# Last time each session was touched by a request (in memory only)
+_last_access = {}
+
 def _load_storage():
     """Load storage from disk on first access"""
     global _storage, _loaded
@@ -44,8 +57,13 @@ def _save_session(session_id):
 
     try:
         session_file = STORAGE_DIR / f'{session_id}.pkl'
-        with open(session_file, 'wb') as f:
-            pickle.dump(_storage[session_id], f)
+        tmp_file = session_file.with_suffix('.tmp')
+        with _save_lock:
+            data = pickle.dumps(_storage[session_id])
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, session_file)  # Atomic - a failed save never truncates the session
+        del data
         # Force garbage collection after saving large image data
         gc.collect()
     except Exception as e:
@@ -57,24 +75,30 @@ def _get_session_id():
         session['storage_id'] = secrets.token_urlsafe(32)
     return session['storage_id']
 
+def get_storage_id():
+    """Get the storage ID for the current session (used to hand work to background threads)"""
+    return _get_session_id()
+
 def _get_storage():
     """Get storage for current session"""
-    _load_storage()  # Load from disk if not already loaded
-
-    session_id = _get_session_id()
-    if session_id not in _storage:
-        _storage[session_id] = {
-            'project': {
-                'id': 1,
-                'status': 'new',
-                'created_at': datetime.utcnow().isoformat()
-            },
-            'images': [],
-            'months': [],
-            'preferences': None
-        }
-        _save_session(session_id)  # Save new session to disk
-    return _storage[session_id]
+    with _save_lock:
+        _load_storage()  # Load from disk if not already loaded
+
+        session_id = _get_session_id()
+        _last_access[session_id] = time.time()
+        if session_id not in _storage:
+            _storage[session_id] = {
+                'project': {
+                    'id': 1,
+                    'status': 'new',
+                    'created_at': datetime.utcnow().isoformat()
+                },
+                'images': [],
+                'months': [],
+                'preferences': None
+            }
+            _save_session(session_id)  # Save new session to disk
+        return _storage[session_id]
 
 def init_session():
     """Initialize session storage if needed"""
@@ -90,21 +114,38 @@ def get_uploaded_images():
     storage = _get_storage()
     return storage['images']
 
-def add_uploaded_image(filename, file_data, thumbnail_data):
-    """Add an uploaded image"""
-    storage = _get_storage()
+def add_uploaded_image(filename, file_data, thumbnail_data, phash=None):
+    """Add an uploaded image (phash: perceptual hash for duplicate detection)"""
+    with _save_lock:
+        storage = _get_storage()
+
+        # Store binary data directly in server memory (no base64 needed!)
+        # IDs only ever increase, so a deleted photo's ID is never handed out again
+        image_id = max(storage.get('next_image_id', 1), max((img['id'] for img in storage['images']), default=0) + 1)
+        storage['next_image_id'] = image_id + 1
+        storage['images'].append({
+            'id': image_id,
+            'filename': filename,
+            'file_data': file_data,  # Raw binary data
+            'thumbnail_data': thumbnail_data,  # Raw binary data
+            'phash': phash,
+            'sha256': hashlib.sha256(file_data).hexdigest(),
+            'uploaded_at': datetime.utcnow().isoformat()
+        })
+        storage.pop('speculative', None)  # Pre-generated months used the old reference set
+        storage.pop('references', None)  # Ranked from the old photo set
+        _save_session(_get_session_id())  # Persist to disk
+        return image_id
+
+def image_fingerprints(images):
+    """
+    Content hashes identifying a set of uploaded images, in order
 
-    # Store binary data directly in server memory (no base64 needed!)
-    image_id = len(storage['images']) + 1
-    storage['images'].append({
-        'id': image_id,
-        'filename': filename,
-        'file_data': file_data,  # Raw binary data
-        'thumbnail_data': thumbnail_data,  # Raw binary data
-        'uploaded_at': datetime.utcnow().isoformat()
-    })
-    _save_session(_get_session_id())  # Persist to disk
-    return image_id
+    Used to tell whether work derived from the photos (speculative months,
+    reference selection, job checkpoints) still matches them - that work
+    depends on the photos' content, so it is keyed on the content.
+    """
+    return [img.get('sha256') or hashlib.sha256(img['file_data']).hexdigest() for img in images]
 
 def get_image_by_id(image_id):
     """Get image by ID"""
@@ -116,32 +157,60 @@ def get_image_by_id(image_id):
 
 def delete_image(image_id):
     """Delete an image"""
-    storage = _get_storage()
-    storage['images'] = [img for img in storage['images'] if img['id'] != image_id]
-    _save_session(_get_session_id())  # Persist to disk
+    with _save_lock:
+        storage = _get_storage()
+        storage['images'] = [img for img in storage['images'] if img['id'] != image_id]
+        storage.pop('speculative', None)  # Pre-generated months used the old reference set
+        storage.pop('references', None)  # Ranked from the old photo set
+        _save_session(_get_session_id())  # Persist to disk
 
 def get_all_months():
     """Get all calendar months"""
     storage = _get_storage()
     return storage['months']
 
+def month_summary(month):
+    """A month record without its image bytes (safe for jsonify/tojson)"""
+    return {key: value for key, value in month.items() if not isinstance(value, bytes)}
+
 def create_months_with_themes(themes):
     """Create 12 months with themes"""
-    storage = _get_storage()
-    storage['months'] = []
-
-    for month_num in range(1, 13):
-        theme = themes[month_num]
-        storage['months'].append({
-            'id': month_num,
-            'month_number': month_num,
-            'prompt': theme['title'],
-            'generation_status': 'pending',
-            'master_image_data': None,  # Raw binary data
-            'error_message': None,
-            'generated_at': None
-        })
-    _save_session(_get_session_id())  # Persist to disk
+    with _save_lock:
+        storage = _get_storage()
+        storage['months'] = []
+        storage['months_created_at'] = time.time()
+
+        # Months pre-generated while the user reviewed themes (same reference photos only)
+        reference_hashes = image_fingerprints(storage['images'])
+        speculative = storage.pop('speculative', {})
+        stats = storage['project'].setdefault('speculative', {'months_adopted': 0, 'seconds_saved': 0.0})
+
+        for month_num in range(1, 13):
+            theme = themes[month_num]
+            month = {
+                'id': month_num,
+                'month_number': month_num,
+                'prompt': theme['title'],
+                'generation_status': 'pending',
+                'master_image_data': None,  # Raw binary data
+                'error_message': None,
+                'generated_at': None
+            }
+
+            pre_generated = speculative.get(month_num)
+            if pre_generated and pre_generated.get('reference_hashes') == reference_hashes:
+                month['generation_status'] = 'completed'
+                month['master_image_data'] = pre_generated['image_data']
+                month['generated_at'] = pre_generated['generated_at']
+                stats['months_adopted'] += 1
+                stats['seconds_saved'] += pre_generated['generation_seconds']
+
+            storage['months'].append(month)
+
+        if stats['months_adopted']:
+            print(f"⚡ Adopted {stats['months_adopted']} pre-generated months "
+                  f"(saved ~{int(stats['seconds_saved'])}s of waiting)")
+        _save_session(_get_session_id())  # Persist to disk
 
 def get_month_by_number(month_num):
     """Get month by number"""
@@ -153,24 +222,33 @@ def get_month_by_number(month_num):
 
 def update_month_status(month_num, status, image_data=None, error=None):
     """Update month generation status"""
-    storage = _get_storage()
+    _get_storage()
+    return update_month_status_by_session_id(_get_session_id(), month_num, status, image_data, error)
 
-    for month in storage['months']:
-        if month['month_number'] == month_num:
-            month['generation_status'] = status
+def update_month_status_by_session_id(session_id, month_num, status, image_data=None, error=None):
+    """Update month generation status for a specific session (used by background workers)"""
+    with _save_lock:
+        _load_storage()
+        if session_id not in _storage:
+            return None
+        storage = _storage[session_id]
 
-            if image_data:
-                # Store as raw binary (no base64 needed in server memory!)
-                month['master_image_data'] = image_data
-                month['generated_at'] = datetime.utcnow().isoformat()
+        for month in storage['months']:
+            if month['month_number'] == month_num:
+                month['generation_status'] = status
 
-            if error:
-                month['error_message'] = str(error)
+                if image_data:
+                    # Store as raw binary (no base64 needed in server memory!)
+                    month['master_image_data'] = image_data
+                    month['generated_at'] = datetime.utcnow().isoformat()
 
-            _save_session(_get_session_id())  # Persist to disk
-            return month
+                if error:
+                    month['error_message'] = str(error)
 
-    return None
+                _save_session(session_id)  # Persist to disk
+                return month
+
+        return None
 
 def get_month_image_data(month_num):
     """Get binary image data for a month"""
@@ -181,9 +259,10 @@ def get_month_image_data(month_num):
 
 def update_project_status(status):
     """Update project status"""
-    storage = _get_storage()
-    storage['project']['status'] = status
-    _save_session(_get_session_id())  # Persist to disk
+    with _save_lock:
+        storage = _get_storage()
+        storage['project']['status'] = status
+        _save_session(_get_session_id())  # Persist to disk
 
 def get_completion_count():
     """Get number of completed months"""
@@ -197,23 +276,35 @@ def get_preferences():
 
 def set_preferences(preferences):
     """Set user customization preferences"""
-    storage = _get_storage()
-    storage['preferences'] = preferences
-    _save_session(_get_session_id())  # Persist to disk
-    return preferences
+    with _save_lock:
+        storage = _get_storage()
+        storage['preferences'] = preferences
+        _save_session(_get_session_id())  # Persist to disk
+        return preferences
 
 def clear_session():
     """Clear all session data (for testing)"""
-    session_id = _get_session_id()
-    if session_id in _storage:
-        del _storage[session_id]
+    from app.services import admission_control
 
-    # Delete session file from disk
-    session_file = STORAGE_DIR / f'{session_id}.pkl'
-    if session_file.exists():
-        session_file.unlink()
+    with _save_lock:
+        session_id = _get_session_id()
+        if session_id in _storage:
+            del _storage[session_id]
 
-    session.clear()
+        # A deleted session's calendar will never finish - free its generation slot
+        admission_control.release(session_id)
+
+        # Delete session file from disk
+        session_file = STORAGE_DIR / f'{session_id}.pkl'
+        if session_file.exists():
+            session_file.unlink()
+
+        session.clear()
+
+def get_all_session_ids():
+    """Get IDs of all stored sessions (used by startup recovery)"""
+    _load_storage()
+    return list(_storage.keys())
 
 def get_months_by_session_id(session_id):
     """Get all months for a specific session ID (used by webhooks)"""
@@ -222,14 +313,109 @@ def get_months_by_session_id(session_id):
         return _storage[session_id].get('months', [])
     return []
 
-def save_order_info(session_id, order_data):
-    """Save order information to a specific session (used by webhooks)"""
+def get_uploaded_images_by_session_id(session_id):
+    """Get uploaded images for a specific session ID (used by background workers)"""
     _load_storage()
     if session_id in _storage:
-        _storage[session_id]['order'] = order_data
+        return _storage[session_id].get('images', [])
+    return []
+
+def get_last_access(session_id):
+    """Last time a request touched this session (None if not seen since startup)"""
+    return _last_access.get(session_id)
+
+def get_speculative_months(session_id):
+    """Get months pre-generated before the user confirmed themes"""
+    _load_storage()
+    if session_id in _storage:
+        return _storage[session_id].get('speculative', {})
+    return {}
+
+def save_speculative_month(session_id, month_num, image_data, started_at, generation_seconds, reference_hashes):
+    """
+    Store a speculatively generated month (used by background workers)
+
+    If the user already confirmed themes, the month is completed directly and
+    only the part of the generation that ran before they started waiting
+    counts as saved. Otherwise the result is kept until create_months_with_themes.
+
+    Returns:
+        bool: False if the result is stale (reference photos changed)
+    """
+    with _save_lock:
+        _load_storage()
+        if session_id not in _storage:
+            return False
+        storage = _storage[session_id]
+
+        if image_fingerprints(storage['images']) != reference_hashes:
+            return False
+
+        month = next((m for m in storage['months'] if m['month_number'] == month_num), None)
+        if month:
+            if month['generation_status'] != 'completed':
+                month['generation_status'] = 'completed'
+                month['master_image_data'] = image_data
+                month['generated_at'] = datetime.utcnow().isoformat()
+                month['error_message'] = None
+                saved = min(generation_seconds, max(0.0, storage.get('months_created_at', started_at) - started_at))
+                stats = storage['project'].setdefault('speculative', {'months_adopted': 0, 'seconds_saved': 0.0})
+                stats['months_adopted'] += 1
+                stats['seconds_saved'] += saved
+        else:
+            storage.setdefault('speculative', {})[month_num] = {
+                'image_data': image_data,
+                'generated_at': datetime.utcnow().isoformat(),
+                'generation_seconds': generation_seconds,
+                'reference_hashes': reference_hashes
+            }
+
         _save_session(session_id)
         return True
-    return False
+
+def get_reference_selection(session_id, image_hashes):
+    """
+    Get the cached Gemini reference photos for a session
+
+    Returns:
+        list or None: Reference JPEG bytes, if selected from exactly these
+                      photos (image_fingerprints)
+    """
+    _load_storage()
+    if session_id in _storage:
+        selection = _storage[session_id].get('references')
+        if selection and selection.get('image_hashes') == image_hashes:
+            return selection['images']
+    return None
+
+def save_reference_selection(session_id, image_hashes, selected_ids, references):
+    """Cache the ranked and cropped reference photos chosen from the photos in `image_hashes`"""
+    with _save_lock:
+        _load_storage()
+        if session_id not in _storage:
+            return
+        storage = _storage[session_id]
+
+        if image_fingerprints(storage['images']) != image_hashes:
+            return  # Uploads changed while we were ranking
+
+        storage['references'] = {
+            'image_hashes': image_hashes,
+            'selected_ids': selected_ids,
+            'images': references,
+            'selected_at': datetime.utcnow().isoformat()
+        }
+        _save_session(session_id)
+
+def save_order_info(session_id, order_data):
+    """Save order information to a specific session (used by webhooks)"""
+    with _save_lock:
+        _load_storage()
+        if session_id in _storage:
+            _storage[session_id]['order'] = order_data
+            _save_session(session_id)
+            return True
+        return False
 
 def get_order_info_by_session_id(session_id):
     """Get order information for a specific session"""
@@ -0,0 +1,63 @@
+"""
+Disk-spooled multipart uploads
+Streams every uploaded file part into a temp file on the data volume while
+the request body is parsed, so concurrent uploads don't hold their bytes
+in worker memory. Image processing then reads from the file path.
+"""
+import os
+import time
+import tempfile
+from flask import Request
+from app.session_storage import DATA_DIR
+
+# Set to 0 to keep werkzeug's default (small parts in memory)
+UPLOAD_SPOOL_TO_DISK = os.getenv('UPLOAD_SPOOL_TO_DISK', '1') == '1'
+
+UPLOAD_SPOOL_DIR = DATA_DIR / 'upload_spool'
+UPLOAD_SPOOL_DIR.mkdir(exist_ok=True, parents=True)
+
+# Spool files older than this are leftovers from a crashed worker
+STALE_SPOOL_SECONDS = 3600
+
+
+class SpooledRequest(Request):
+    """Flask request that writes multipart file parts straight to disk"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not UPLOAD_SPOOL_TO_DISK:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        # Deleted automatically when werkzeug closes the request's files
+        return tempfile.NamedTemporaryFile(dir=UPLOAD_SPOOL_DIR, prefix='upload-', suffix='.part')
+
+
+def get_upload_source(file_storage):
+    """
+    Get something image_processing can open for an uploaded file
+
+    Returns:
+        str or bytes: Path of the spooled temp file, or the file's bytes if
+                      it was kept in memory
+    """
+    stream = file_storage.stream
+    path = getattr(stream, 'name', None)
+    if isinstance(path, str) and os.path.exists(path):
+        # Make sure the pool worker process sees every byte we received
+        stream.flush()
+        return path
+    return file_storage.read()
+
+def cleanup_stale_spool_files():
+    """Remove spool files left behind by a crashed worker"""
+    cutoff = time.time() - STALE_SPOOL_SECONDS
+    removed = 0
+    for spool_file in UPLOAD_SPOOL_DIR.glob('upload-*.part'):
+        try:
+            if spool_file.stat().st_mtime < cutoff:
+                spool_file.unlink()
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"✓ Removed {removed} stale upload spool files")
+    return removed
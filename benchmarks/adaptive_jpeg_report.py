@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Report: SSIM-targeted adaptive JPEG encoding vs fixed quality
+Encodes each image the way the app stores it - upload master (q90 ceiling),
+generated month (q80) and batch/print (q95) - and prints, per image, the
+quality the adaptive encoder picked, its SSIM against the source and the
+bytes saved versus the old fixed-quality encode.
+
+Usage:
+    python benchmarks/adaptive_jpeg_report.py [photo.jpg month.png ...]
+        [--target-ssim 0.98] [--no-progressive] [--subsampling 4:2:0]
+
+With no paths, a generated 12MP photo-like fixture is used.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (label, max width/height the app stores at, fixed quality it used)
+STORAGE_PROFILES = [
+    ('upload master', 1920, 90),
+    ('month', None, 80),
+    ('batch/print', None, 95),
+]
+
+
+def load_images(paths):
+    from PIL import Image
+    if not paths:
+        from upload_benchmark import make_photo
+        return [('fixture_12mp', make_photo())]
+
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            images.append((os.path.basename(path), img.convert('RGB')))
+    return images
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--target-ssim', type=float, default=None, help='Default: JPEG_TARGET_SSIM')
+    parser.add_argument('--no-progressive', action='store_true')
+    parser.add_argument('--subsampling', default=None, choices=['4:2:0', '4:2:2', '4:4:4'])
+    args = parser.parse_args()
+
+    from app.services import image_processing
+
+    print(f"{'image':<22} {'profile':<14} {'fixed KB':>9} {'adaptive KB':>12} {'quality':>8} {'SSIM':>7} {'saved':>7} {'ms':>6}")
+    total_fixed = total_adaptive = 0
+    for name, img in load_images(args.paths):
+        for label, max_dimension, quality in STORAGE_PROFILES:
+            source = image_processing.downscale(img, max_dimension) if max_dimension else img
+            start = time.time()
+            _, stats = image_processing.encode_jpeg_adaptive(
+                source,
+                max_quality=quality,
+                target_ssim=args.target_ssim,
+                progressive=False if args.no_progressive else None,
+                subsampling=args.subsampling
+            )
+            elapsed_ms = (time.time() - start) * 1000
+            score = f"{stats['ssim']:.4f}" if stats['ssim'] is not None else '-'
+            saved_pct = stats['bytes_saved'] / stats['baseline_bytes'] * 100
+            print(f"{name[:22]:<22} {label:<14} {stats['baseline_bytes'] / 1024:>9.0f} {stats['bytes'] / 1024:>12.0f} "
+                  f"{stats['quality']:>8} {score:>7} {saved_pct:>6.0f}% {elapsed_ms:>6.0f}")
+            total_fixed += stats['baseline_bytes']
+            total_adaptive += stats['bytes']
+
+    print(f"\nTotal: {total_fixed / 1024:.0f}KB fixed -> {total_adaptive / 1024:.0f}KB adaptive "
+          f"({(1 - total_adaptive / total_fixed) * 100:.0f}% saved)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Quality + cost check: reduced-resolution upload decoding
+Compares image_processing.process_upload (JPEG draft decoding, staged
+reduce()+LANCZOS) against the previous full-resolution path on a 12MP
+fixture. Reports CPU time and peak RSS for each, and fails (exit 1) if the
+stored master's SSIM against the previous path drops below --min-ssim.
+
+Usage:
+    python benchmarks/fast_decode_check.py [--runs 5] [--min-ssim 0.98]
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upload_benchmark import make_jpeg_fixture
+
+
+def reference_process_upload(image_data, max_dimension=1920):
+    """The upload path before draft decoding: full decode, transpose, one LANCZOS pass"""
+    from PIL import Image, ImageOps
+    img = Image.open(io.BytesIO(image_data))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max(img.size) > max_dimension:
+        ratio = max_dimension / max(img.size)
+        new_size = tuple(int(dim * ratio) for dim in img.size)
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=90, optimize=True)
+    return out.getvalue()
+
+def run_path(path, runs, fixture_file):
+    from app.services import image_processing
+    with open(fixture_file, 'rb') as f:
+        data = f.read()
+    fn = reference_process_upload if path == 'reference' else (lambda d: image_processing.process_upload(d)[0])
+
+    cpu_start = time.process_time()
+    for _ in range(runs):
+        master = fn(data)
+    cpu = (time.process_time() - cpu_start) / runs
+
+    with open(f'{fixture_file}.{path}.jpg', 'wb') as f:
+        f.write(master)
+    return {
+        'cpu_seconds': round(cpu, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--min-ssim', type=float, default=0.98)
+    parser.add_argument('--path', choices=['reference', 'fast'], help=argparse.SUPPRESS)
+    parser.add_argument('--fixture', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(run_path(args.path, args.runs, args.fixture)))
+        return
+
+    import tempfile
+    from PIL import Image
+    from app.services.image_processing import ssim
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_file = os.path.join(tmp, 'fixture_12mp.jpg')
+        with open(fixture_file, 'wb') as f:
+            f.write(make_jpeg_fixture())
+
+        # Each path in a fresh process so peak RSS is its own. Both encode at
+        # fixed q90 so only the decode path is compared (adaptive quality is
+        # checked by adaptive_jpeg_report.py)
+        env = dict(os.environ, JPEG_ADAPTIVE_QUALITY='0')
+        results = {}
+        for path in ('reference', 'fast'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--path', path, '--runs', str(args.runs), '--fixture', fixture_file],
+                capture_output=True, text=True, check=True, env=env
+            ).stdout
+            results[path] = json.loads(output.strip().splitlines()[-1])
+
+        with Image.open(f'{fixture_file}.reference.jpg') as reference, Image.open(f'{fixture_file}.fast.jpg') as fast:
+            if reference.size != fast.size:
+                print(f"❌ Size mismatch: reference {reference.size}, fast {fast.size}")
+                sys.exit(1)
+            score = ssim(reference, fast)
+
+    print(f"{'path':<10} {'CPU s/img':>10} {'peak RSS MB':>12}")
+    for path, result in results.items():
+        print(f"{path:<10} {result['cpu_seconds']:>10} {result['peak_rss_mb']:>12}")
+    speedup = results['reference']['cpu_seconds'] / max(results['fast']['cpu_seconds'], 1e-6)
+    print(f"\nCPU speedup: {speedup:.1f}x   SSIM vs reference: {score:.4f} (min {args.min_ssim})")
+
+    if score < args.min_ssim:
+        print("❌ Quality check failed")
+        sys.exit(1)
+    print("✅ Quality check passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PNG→JPEG transcoding inline vs. in the image pool
+Measures peak RSS of the web-worker process and CPU time spent on the
+calling (request) thread for a batch of Gemini-sized PNGs.
+
+Usage:
+    python benchmarks/image_pool_benchmark.py [--images 12] [--quality 80]
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_gemini_png(width=896, height=1152):
+    """Noisy gradient PNG about the size Gemini returns for a 3:4 image"""
+    from PIL import Image
+    img = Image.effect_noise((width, height), 64).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    img = Image.blend(img, gradient, 0.5)
+    out = io.BytesIO()
+    img.save(out, format='PNG')
+    return out.getvalue()
+
+def run_mode(mode, count, quality):
+    """Transcode `count` PNGs in this process and report RSS/thread CPU"""
+    os.environ['IMAGE_POOL_WORKERS'] = '0' if mode == 'inline' else os.getenv('IMAGE_POOL_WORKERS', '1')
+    from app.services import image_pool, image_processing
+
+    png_data = make_gemini_png()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Warm the pool so process start-up isn't counted
+    image_pool.run(image_processing.transcode_to_jpeg, png_data, quality=quality)
+
+    cpu_start = time.thread_time()
+    wall_start = time.time()
+    sizes = [len(image_pool.run(image_processing.transcode_to_jpeg, png_data, quality=quality)) for _ in range(count)]
+    wall = time.time() - wall_start
+    thread_cpu = time.thread_time() - cpu_start
+
+    return {
+        'mode': mode,
+        'images': count,
+        'png_bytes': len(png_data),
+        'jpeg_bytes': sizes[0],
+        'wall_seconds': round(wall, 3),
+        'request_thread_cpu_seconds': round(thread_cpu, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'baseline_rss_mb': round(rss_before / 1024, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--images', type=int, default=12)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--mode', choices=['inline', 'pool'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.images, args.quality)))
+        return
+
+    # Run each mode in a fresh process so peak RSS isn't shared
+    print(f"{'mode':<8} {'wall s':>8} {'thread CPU s':>13} {'peak RSS MB':>12}")
+    for mode in ('inline', 'pool'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--images', str(args.images), '--quality', str(args.quality)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['wall_seconds']:>8} {result['request_thread_cpu_seconds']:>13} {result['peak_rss_mb']:>12}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark: uploading 12 month images to Printify
+Runs a local fake Printify upload endpoint with injected latency and
+compares four ways of uploading a calendar's images:
+  - old:        sequential, a fresh requests.post (new connection) each time
+  - keep-alive: sequential over printify_client's shared session
+  - concurrent: printify_service.upload_images (shared session, parallel)
+  - by-url:     concurrent, sending signed rendition URLs instead of base64
+
+The fake server sleeps --connect-ms when a client opens a connection (a
+stand-in for TCP + TLS setup to a remote API) and --request-ms per upload. It does not fetch by-url uploads, so that row
+leaves out Printify's own download time - compare the bytes sent.
+
+Usage:
+    python benchmarks/printify_upload_benchmark.py [--connect-ms 150] [--request-ms 400]
+        [--image-kb 3000] [--concurrency 4]
+"""
+import os
+import sys
+import json
+import base64
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONTHS = 12
+
+
+def make_fake_printify(connect_seconds, request_seconds):
+    stats = {'connections': 0, 'uploads': 0, 'bytes_in': 0}
+    lock = threading.Lock()
+
+    class FakePrintifyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats['connections'] += 1
+            time.sleep(connect_seconds)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            upload = json.loads(body)
+            time.sleep(request_seconds)
+            with lock:
+                stats['uploads'] += 1
+                stats['bytes_in'] += len(body)
+                upload_id = f"fake_{stats['uploads']}"
+
+            response = json.dumps({'id': upload_id, 'file_name': upload['file_name']}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakePrintifyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+def upload_old(base_url, images):
+    """The previous code path: one fresh connection per upload, in order"""
+    for data, filename in images.values():
+        response = requests.post(
+            f"{base_url}/uploads/images.json",
+            headers={'Authorization': 'Bearer fake', 'Content-Type': 'application/json', 'Connection': 'close'},
+            json={'file_name': filename, 'contents': base64.b64encode(data).decode('utf-8')}
+        )
+        response.raise_for_status()
+
+def upload_keep_alive(images):
+    from app.services import printify_service
+    headers = printify_service.get_headers()
+    for data, filename in images.values():
+        printify_service.upload_image(data, filename, headers=headers)
+
+def upload_concurrent(images):
+    from app.services import printify_service
+    printify_service.upload_images(images)
+
+def upload_by_url(images):
+    from app.services import printify_service
+    printify_service.upload_images({
+        key: (f"https://example.com/api/print/session/{filename}?expires=0&signature={'0' * 64}", filename)
+        for key, (_, filename) in images.items()
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--connect-ms', type=float, default=150)
+    parser.add_argument('--request-ms', type=float, default=400)
+    parser.add_argument('--image-kb', type=int, default=3000, help='Size of each print rendition')
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    server, stats = make_fake_printify(args.connect_ms / 1000, args.request_ms / 1000)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    # Configure the client before it is imported
+    os.environ['PRINTIFY_API_BASE'] = base_url
+    os.environ['PRINTIFY_UPLOAD_CONCURRENCY'] = str(args.concurrency)
+    # Every mode uploads the same images - don't let the upload cache skip them
+    os.environ['PRINTIFY_UPLOAD_CACHE_TTL_SECONDS'] = '0'
+
+    from flask import Flask
+    app = Flask(__name__)
+    app.config['PRINTIFY_API_TOKEN'] = 'fake'
+
+    images = {
+        f"month{month_num}": (os.urandom(args.image_kb * 1024), f"month{month_num}.jpg")
+        for month_num in range(1, MONTHS + 1)
+    }
+
+    print(f"Fake Printify: +{args.connect_ms:.0f}ms per connection, +{args.request_ms:.0f}ms per upload, "
+          f"{MONTHS} x {args.image_kb}KB images\n")
+    print(f"{'mode':<12} {'seconds':>8} {'connections':>12} {'sent KB':>9} {'speedup':>8}")
+
+    baseline = None
+    with app.app_context():
+        for mode, run in (
+            ('old', lambda: upload_old(base_url, images)),
+            ('keep-alive', lambda: upload_keep_alive(images)),
+            ('concurrent', lambda: upload_concurrent(images)),
+            ('by-url', lambda: upload_by_url(images)),
+        ):
+            stats['connections'] = 0
+            stats['bytes_in'] = 0
+            start = time.time()
+            run()
+            seconds = time.time() - start
+            baseline = baseline or seconds
+            print(f"{mode:<12} {seconds:>8.2f} {stats['connections']:>12} "
+                  f"{stats['bytes_in'] // 1024:>9} {baseline / seconds:>7.1f}x")
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
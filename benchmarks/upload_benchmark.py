@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark: processing a multi-file selfie upload
+Compares sequential processing on the request thread with the parallel,
+memory-budgeted image pool, using realistic 12MP iPhone-sized fixtures.
+
+Also reports single-image ingestion cost per megapixel for each format,
+and for HEIC the preview thumbnail from the embedded container thumbnail
+versus a full decode.
+
+Fixtures are generated on the fly (nothing binary is checked in):
+  - 4032x3024 JPEG, quality 92, EXIF orientation 6 (portrait iPhone shot)
+  - 4032x3024 HEIC with a 320px embedded thumbnail, like an iPhone
+    (only if pillow-heif is installed)
+
+Usage:
+    python benchmarks/upload_benchmark.py [--files 5] [--format jpeg|heic|both]
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURE_SIZE = (4032, 3024)  # 12MP
+
+
+def make_photo(size=FIXTURE_SIZE):
+    """Photo-like 12MP frame: smooth gradients plus sensor-style noise"""
+    from PIL import Image
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 24)
+    red = Image.blend(gradient, noise, 0.3)
+    green = gradient.rotate(90).resize(size)
+    blue = Image.blend(noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), 0.6)
+    return Image.merge('RGB', (red, green, blue))
+
+def make_jpeg_fixture():
+    from PIL import Image
+    img = make_photo()
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW, like a portrait iPhone photo
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=92, exif=exif)
+    return out.getvalue()
+
+def make_heic_fixture():
+    try:
+        import pillow_heif
+    except ImportError:
+        return None
+    heif_file = pillow_heif.from_pillow(make_photo())
+    heif_file.add_thumbnails([320])
+    out = io.BytesIO()
+    heif_file.save(out, quality=85)
+    return out.getvalue()
+
+def cpu_ms_per_megapixel(fn, data, runs=3):
+    """Single-threaded CPU cost of fn(data), per megapixel of the source"""
+    start = time.process_time()
+    for _ in range(runs):
+        fn(data)
+    megapixels = FIXTURE_SIZE[0] * FIXTURE_SIZE[1] / 1e6
+    return (time.process_time() - start) / runs * 1000 / megapixels
+
+def full_decode_thumbnail(image_data, size=(200, 200)):
+    """Preview thumbnail the old way: decode the whole image, then shrink"""
+    from PIL import Image
+    with Image.open(io.BytesIO(image_data)) as img:
+        img.thumbnail(size)
+        rgb = img.convert('RGB')
+    out = io.BytesIO()
+    rgb.save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+def bench_sequential(fixtures):
+    from app.services import image_processing
+    start = time.time()
+    for data in fixtures:
+        image_processing.process_upload(data)
+    return time.time() - start
+
+def bench_pool(fixtures):
+    from app.services import image_pool, image_processing
+    # Warm up worker processes so start-up isn't counted
+    image_pool.run(image_processing.estimate_decode_bytes, fixtures[0])
+
+    start = time.time()
+    futures = [
+        image_pool.submit_budgeted(image_processing.estimate_decode_bytes(data), image_processing.process_upload, data)
+        for data in fixtures
+    ]
+    for future in futures:
+        future.result()
+    return time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--files', type=int, default=5)
+    parser.add_argument('--format', choices=['jpeg', 'heic', 'both'], default='both')
+    args = parser.parse_args()
+
+    fixture_sets = {}
+    if args.format in ('jpeg', 'both'):
+        fixture_sets['jpeg'] = make_jpeg_fixture()
+    if args.format in ('heic', 'both'):
+        heic = make_heic_fixture()
+        if heic:
+            fixture_sets['heic'] = heic
+        else:
+            print("⚠️  pillow-heif not installed, skipping HEIC fixtures")
+
+    from app.services import image_pool
+    print(f"Pool workers: {image_pool.IMAGE_POOL_WORKERS}, decode budget: {image_pool.IMAGE_DECODE_BUDGET_MB}MB\n")
+    print(f"{'format':<6} {'file MB':>8} {'sequential s':>13} {'pool s':>8} {'speedup':>8}")
+
+    for name, data in fixture_sets.items():
+        fixtures = [data] * args.files
+        sequential = bench_sequential(fixtures)
+        pooled = bench_pool(fixtures)
+        print(f"{name:<6} {len(data) / 1e6:>8.1f} {sequential:>13.2f} {pooled:>8.2f} {sequential / pooled:>7.1f}x")
+
+    from app.services import image_processing
+    print(f"\n{'format':<6} {'ingest CPU ms/MP':>17} {'thumb (full) ms/MP':>19} {'thumb (fast) ms/MP':>19}")
+    for name, data in fixture_sets.items():
+        ingest = cpu_ms_per_megapixel(image_processing.process_upload, data)
+        thumb_full = cpu_ms_per_megapixel(full_decode_thumbnail, data)
+        thumb_fast = cpu_ms_per_megapixel(image_processing.make_thumbnail, data)
+        print(f"{name:<6} {ingest:>17.1f} {thumb_full:>19.1f} {thumb_fast:>19.1f}")
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nPeak RSS (this process): {peak_mb:.0f}MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Load test: web-worker memory under concurrent multi-photo uploads
+Starts the app in a subprocess, fires N concurrent upload sessions (each
+posting several large JPEGs to /project/upload) and reports the server's
+peak RSS (VmHWM). Run it with disk spooling on and off to compare:
+
+    python benchmarks/upload_load_test.py --concurrency 1 4 8
+    python benchmarks/upload_load_test.py --concurrency 1 4 8 --no-spool
+
+With spooling, peak RSS should stay roughly flat as concurrency grows.
+Requires Linux (/proc) and the `requests` package.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import threading
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from upload_benchmark import make_jpeg_fixture
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def peak_rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def start_server(port, spool):
+    env = dict(os.environ, UPLOAD_SPOOL_TO_DISK='1' if spool else '0', FLASK_ENV='production')
+    server = subprocess.Popen(
+        [sys.executable, '-c',
+         f"from app import create_app; create_app().run(host='127.0.0.1', port={port}, threaded=True)"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('Server did not start')
+
+def upload_session(base_url, fixture_path, photos, errors):
+    client = requests.Session()
+    try:
+        client.get(f'{base_url}/start', timeout=30)
+        handles = [open(fixture_path, 'rb') for _ in range(photos)]
+        try:
+            files = [('photos', (f'photo{i}.jpg', handle, 'image/jpeg')) for i, handle in enumerate(handles)]
+            response = client.post(f'{base_url}/project/upload', files=files, timeout=300, allow_redirects=False)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        finally:
+            for handle in handles:
+                handle.close()
+    except requests.RequestException as e:
+        errors.append(str(e))
+
+def run_level(concurrency, spool, fixture_path, photos):
+    port = free_port()
+    server = start_server(port, spool)
+    try:
+        baseline = peak_rss_mb(server.pid)
+        errors = []
+        threads = [
+            threading.Thread(target=upload_session, args=(f'http://127.0.0.1:{port}', fixture_path, photos, errors))
+            for _ in range(concurrency)
+        ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return baseline, peak_rss_mb(server.pid), time.time() - start, errors
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--photos', type=int, default=5, help='Photos per upload request')
+    parser.add_argument('--no-spool', action='store_true', help='Buffer uploads in memory (old behavior)')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.jpg') as fixture:
+        fixture.write(make_jpeg_fixture())
+        fixture.flush()
+        size_mb = os.path.getsize(fixture.name) / 1e6
+
+        mode = 'in-memory' if args.no_spool else 'disk spool'
+        print(f"Mode: {mode}, {args.photos} x {size_mb:.1f}MB photos per upload\n")
+        print(f"{'concurrent':>10} {'baseline MB':>12} {'peak MB':>9} {'seconds':>8} {'errors':>7}")
+        for concurrency in args.concurrency:
+            baseline, peak, seconds, errors = run_level(concurrency, not args.no_spool, fixture.name, args.photos)
+            print(f"{concurrency:>10} {baseline:>12.0f} {peak:>9.0f} {seconds:>8.1f} {len(errors):>7}")
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,55 @@
 """
 Fetch Printify calendar configurations
 Run this to get print provider IDs and variant IDs for all calendar products
+
+With --catalog, also writes the shop ID and blueprint configs to the app's
+Printify catalog cache (see app/services/printify_catalog.py), so a fresh
+deploy starts warm:
+    python fetch_printify_calendars.py --catalog [/data/printify_catalog.json]
 """
 import requests
+import os
 import json
 import sys
+import time
+
+def fetch_shop_id(headers):
+    """First shop ID of the account, or None"""
+    response = requests.get("https://api.printify.com/v1/shops.json", headers=headers, timeout=10)
+    if response.status_code != 200:
+        print(f"❌ Error getting shops: {response.status_code}")
+        return None
+    shops = response.json()
+    return shops[0]['id'] if shops else None
+
+def write_catalog_cache(api_token, results, path=None):
+    """Save the fetched shop and blueprint configs in the app's catalog cache format"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services import printify_catalog
+
+    headers = {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json"
+    }
+    now = time.time()
+    entries = {
+        f"blueprint_{blueprint_id}": {
+            'value': {
+                'print_provider_id': config['print_provider_id'],
+                'variant_id': config['variant_id']
+            },
+            'fetched_at': now
+        }
+        for blueprint_id, config in results.items()
+    }
+
+    shop_id = fetch_shop_id(headers)
+    if shop_id:
+        entries['shop_id'] = {'value': shop_id, 'fetched_at': now}
+
+    path = path or printify_catalog.CATALOG_FILE
+    printify_catalog.write_catalog(entries, path)
+    print(f"✓ Wrote {len(entries)} catalog entries to {path}")
 
 def fetch_calendar_configs(api_token):
     """Fetch configuration details for all calendar products"""
@@ -151,7 +196,6 @@ def fetch_calendar_configs(api_token):
 
 if __name__ == "__main__":
     # Try to get token from environment or Fly.io secrets
-    import os
     import subprocess
 
     api_token = os.getenv('PRINTIFY_API_TOKEN')
@@ -177,4 +221,8 @@ if __name__ == "__main__":
         sys.exit(1)
 
     print(f"Using API token: {api_token[:20]}...")
-    fetch_calendar_configs(api_token)
+    results = fetch_calendar_configs(api_token)
+
+    if '--catalog' in sys.argv:
+        args = sys.argv[sys.argv.index('--catalog') + 1:]
+        write_catalog_cache(api_token, results, args[0] if args else None)
@@ -5,10 +5,12 @@ Version: 2.0.4 - FIX: Upgrade Stripe to v13+ for checkout.Session API
 import os
 from app import create_app
 
-# Create Flask application
-app = create_app()
-
 if __name__ == '__main__':
+    # Create Flask application - only when run directly: image pool worker
+    # processes re-import this module and must not boot a second app
+    # (background workers included). WSGI servers use wsgi:app.
+    app = create_app()
+
     # Get host and port from environment variables
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5000))
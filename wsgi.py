@@ -0,0 +1,6 @@
+"""
+Hunk of the Month - WSGI entry point (e.g. gunicorn wsgi:app)
+"""
+from app import create_app
+
+app = create_app()